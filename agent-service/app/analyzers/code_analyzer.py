@@ -1,15 +1,237 @@
 # agent-service/app/analyzers/code_analyzer.py
 
+import io
+import re
 import logging
 import asyncio
 import httpx
-from typing import Dict, List, Any, Optional
+import orjson
+from itertools import islice
+from cachetools import TTLCache
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type, retry_if_result
+from typing import Dict, List, Any, Optional, Tuple, Union, AsyncIterator
 from app.services.claude_api import ClaudeAPI
+from app.services.http_client import get_http_client
 from app.core.config import settings
-from app.utils.prompt_utils import build_system_prompt
+from app.utils.prompt_utils import build_system_prompt, build_cached_content, estimate_tokens, CHARS_PER_TOKEN
+from app.utils.cache_utils import prompt_hash
 
 logger = logging.getLogger(__name__)
 
+# Температура для запросов анализа. Ответы кэшируются только при детерминированной генерации.
+ANALYSIS_TEMPERATURE = 0.0
+
+# Лимит токенов ответа при анализе отдельного файла
+FILE_ANALYSIS_MAX_TOKENS = 1500
+
+# Размер окна задач при параллельном анализе файлов
+FILE_ANALYSIS_CHUNK_SIZE = 32
+
+# Коды ответа Git Service, при которых запрос информации о репозитории повторяется
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+# Общий срок получения информации о репозитории (включая повторы), в секундах
+REPO_INFO_DEADLINE = 60.0
+
+# Бюджет токенов на код в запросе analyze_code; более длинный код сокращается
+CODE_MAX_TOKENS = 8000
+
+# Строки объявлений (функции, классы и т.п.), сохраняемые из середины сокращенного кода
+_DECLARATION_PATTERNS = {
+    "python": re.compile(r"^\s*(?:async\s+def|def|class)\s"),
+    "javascript": re.compile(r"^\s*(?:export\s+)?(?:async\s+)?(?:function|class)\s"),
+    "typescript": re.compile(r"^\s*(?:export\s+)?(?:async\s+)?(?:function|class|interface)\s"),
+    "go": re.compile(r"^\s*(?:func|type)\s"),
+    "rust": re.compile(r"^\s*(?:pub\s+)?(?:fn|impl|struct|enum|trait)\s")
+}
+_DEFAULT_DECLARATION_PATTERN = re.compile(r"^\s*(?:def|class|function|fn|impl|func)\s")
+
+# Маркер пропущенного фрагмента в сокращенном коде
+_OMITTED_MARKER = "\n... [фрагмент кода опущен] ...\n"
+
+# Статические инструкции для анализа. Передаются с маркером cache_control,
+# поэтому должны оставаться побайтово одинаковыми между вызовами.
+# Все изменяемые поля (язык, код, URL, ветка) идут строго после них, в хвосте промпта.
+STATIC_ANALYSIS_INSTRUCTIONS = """Задача: анализ кода.
+
+Выполни следующие задачи для кода, приведенного в конце запроса:
+1. Объясни основную функциональность и структуру кода
+2. Оцени качество кода и выяви потенциальные проблемы, включая:
+   - Ошибки или баги
+   - Проблемы производительности
+   - Уязвимости безопасности
+   - Нарушения лучших практик и стандартов
+3. Предложи конкретные улучшения с примерами кода
+
+Организуй ответ в разделы:
+- Общий обзор
+- Анализ структуры
+- Потенциальные проблемы
+- Рекомендуемые улучшения"""
+
+STATIC_REPO_INSTRUCTIONS = """Задача: анализ репозитория.
+
+Проанализируй репозиторий, информация о котором и ключевые файлы которого приведены в конце запроса.
+
+Предоставь следующую информацию:
+1. Общий обзор репозитория и его назначение
+2. Архитектура проекта и основные компоненты
+3. Используемые технологии и библиотеки
+4. Основные паттерны проектирования
+5. Потенциальные улучшения и рекомендации
+
+Структурируй ответ по разделам и дай конкретные рекомендации, если возможно."""
+
+STATIC_FILE_INSTRUCTIONS = """Задача: анализ файла репозитория.
+
+Проанализируй файл, приведенный в конце запроса, как часть более крупного проекта.
+
+Предоставь кратко:
+1. Назначение файла и его роль в проекте
+2. Основные компоненты, используемые технологии и паттерны
+3. Потенциальные проблемы и рекомендации по улучшению"""
+
+STATIC_REPO_SUMMARY_INSTRUCTIONS = """Задача: сводный анализ репозитория.
+
+Ниже в конце запроса приведены информация о репозитории и результаты анализа его ключевых файлов.
+Объедини их в целостный анализ репозитория.
+
+Предоставь следующую информацию:
+1. Общий обзор репозитория и его назначение
+2. Архитектура проекта и основные компоненты
+3. Используемые технологии и библиотеки
+4. Основные паттерны проектирования
+5. Потенциальные улучшения и рекомендации
+
+Структурируй ответ по разделам и дай конкретные рекомендации, если возможно."""
+
+STATIC_DIFF_INSTRUCTIONS = """Задача: анализ изменений кода (diff).
+
+Проанализируй изменения кода, приведенные в конце запроса.
+
+Предоставь следующую информацию:
+1. Краткое описание изменений
+2. Анализ влияния изменений на функциональность
+3. Потенциальные проблемы или риски, связанные с изменениями
+4. Рекомендации по улучшению или альтернативные подходы, если применимо
+
+Организуй ответ по разделам, фокусируясь на ключевых изменениях."""
+
+# Шаблоны изменяемой части промптов. Разбираются один раз при импорте
+# и заполняются через format_map, всегда следуя за статическими инструкциями.
+_CODE_TMPL = "---\nЯзык: {language}\nКод:\n```{fence_lang}\n{code}\n```"
+
+# Наиболее частые языки: для них шаблон кода специализируется при импорте,
+# и в analyze_code остается подставить только сам код
+SUPPORTED_LANGUAGES = (
+    "python", "javascript", "typescript", "go", "rust",
+    "java", "cpp", "csharp", "ruby", "php"
+)
+
+_CODE_TMPL_BY_LANG = {
+    language: _CODE_TMPL.format(language=language, fence_lang=language, code="{code}")
+    for language in SUPPORTED_LANGUAGES
+}
+_CODE_TMPL_BY_LANG[None] = _CODE_TMPL.format(language="не указан", fence_lang="", code="{code}")
+
+_REPO_HEADER_TMPL = """---
+Репозиторий: {repo_url}
+Ветка: {branch}
+Язык: {language}
+Описание: {description}
+Количество файлов: {files_count}
+"""
+
+_REPO_TMPL = _REPO_HEADER_TMPL + """
+Ключевые файлы репозитория:
+
+{files_str}"""
+
+_REPO_SUMMARY_TMPL = _REPO_HEADER_TMPL + """
+Результаты анализа ключевых файлов:
+
+{analyses_str}"""
+
+_FILE_ANALYSIS_TMPL = "---\nФайл: {path}\n```{fence_lang}\n{content}\n```"
+
+_FILE_TMPL = "## Файл: {path}\n```{lang}\n{content}\n```\n\n"
+
+_DIFF_TMPL = "---\nDiff:\n```diff\n{diff}\n```"
+
+def _shrink(code: str, language: Optional[str], max_tokens: int = CODE_MAX_TOKENS) -> Tuple[str, int]:
+    """
+    Сокращает слишком длинный код до бюджета токенов.
+    
+    Сохраняются первые 40% и последние 20% бюджета, а из середины -
+    строки объявлений функций и классов, пока они помещаются в оставшийся бюджет.
+    Границы частей по возможности совпадают с границами строк.
+    
+    Args:
+        code: Исходный код
+        language: Язык программирования кода
+        max_tokens: Максимальное количество токенов кода
+        
+    Returns:
+        Tuple из (сокращенный код, исходное количество токенов)
+    """
+    original_tokens = estimate_tokens(code)
+    if original_tokens <= max_tokens:
+        return code, original_tokens
+    
+    # Границы частей выравниваются по строкам; если в окне нет перевода строки
+    # (минифицированный или однострочный код), часть режется по числу символов
+    budget = max_tokens * CHARS_PER_TOKEN
+    head_limit = budget * 2 // 5
+    tail_limit = len(code) - budget // 5
+    head_end = code.rfind("\n", 0, head_limit) + 1 or head_limit
+    tail_start = code.find("\n", tail_limit, len(code) - 1) + 1 or tail_limit
+    
+    pattern = _DECLARATION_PATTERNS.get((language or "").lower(), _DEFAULT_DECLARATION_PATTERN)
+    middle_budget = budget - head_end - (len(code) - tail_start)
+    declarations = []
+    for line in code[head_end:tail_start].splitlines():
+        if pattern.match(line):
+            middle_budget -= len(line) + 1
+            if middle_budget < 0:
+                break
+            declarations.append(line)
+    
+    parts = [code[:head_end], _OMITTED_MARKER]
+    if declarations:
+        parts.append("\n".join(declarations))
+        parts.append(_OMITTED_MARKER)
+    parts.append(code[tail_start:])
+    return "".join(parts), original_tokens
+
+def _file_content(file: Dict[str, Any]) -> str:
+    """
+    Возвращает содержимое файла из Git Service для вставки в промпт.
+    
+    Args:
+        file: Описание файла из Git Service
+        
+    Returns:
+        str: Содержимое файла или заглушка, если оно отсутствует или пустое
+    """
+    return file.get("content") or "Содержимое недоступно"
+
+def _build_files_str(key_files: List[Dict[str, Any]]) -> str:
+    """
+    Собирает листинг ключевых файлов для промпта анализа репозитория.
+    
+    Args:
+        key_files: Список файлов из Git Service
+        
+    Returns:
+        str: Листинг файлов в формате Markdown
+    """
+    files_buffer = io.StringIO()
+    for file in key_files:
+        path = file["path"]
+        lang = file.get("language") or ""
+        files_buffer.write(_FILE_TMPL.format(path=path, lang=lang, content=_file_content(file)))
+    return files_buffer.getvalue()
+
 class CodeAnalyzer:
     """
     Класс для анализа кода с использованием API Claude.
@@ -18,9 +240,28 @@ class CodeAnalyzer:
     def __init__(self):
         """Инициализация анализатора кода."""
         self.claude_api = ClaudeAPI()
+        
+        # Общий пул HTTP-соединений к Git Service
+        self._http = get_http_client()
+        
+        # Точный кэш результатов анализа по хэшу промпта (имеет смысл только при нулевой
+        # температуре). Он стоит перед общим кэшем ответов ClaudeAPI (CLAUDE_CACHE_*),
+        # потому что обслуживает и потоковый анализ: stream_request общий кэш не использует.
+        # При no_cache оба уровня пропускаются.
+        self._exact_cache = None
+        if ANALYSIS_TEMPERATURE == 0:
+            self._exact_cache = TTLCache(maxsize=settings.EXACT_CACHE_SIZE, ttl=settings.EXACT_CACHE_TTL)
+        
+        # Кэш анализа репозиториев: (repo_url, branch) -> (версия HEAD, результат)
+        self._repo_cache = None
+        if ANALYSIS_TEMPERATURE == 0:
+            self._repo_cache = TTLCache(maxsize=settings.REPO_CACHE_SIZE, ttl=settings.REPO_CACHE_TTL)
+        
         logger.info("CodeAnalyzer инициализирован")
     
-    async def analyze_code(self, code: str, language: Optional[str] = None, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def analyze_code(self, code: str, language: Optional[str] = None, context: Optional[Dict[str, Any]] = None,
+                           no_cache: bool = False,
+                           stream: bool = False) -> Union[Dict[str, Any], AsyncIterator[str]]:
         """
         Анализирует предоставленный код с использованием API Claude.
         
@@ -28,41 +269,60 @@ class CodeAnalyzer:
             code: Строка с кодом для анализа
             language: Язык программирования кода
             context: Дополнительный контекст для анализа
+            no_cache: Не использовать кэш результатов (для чувствительного кода)
+            stream: Возвращать текст анализа по частям по мере генерации
             
         Returns:
-            Dict с результатами анализа
+            Dict с результатами анализа или асинхронный итератор фрагментов текста (при stream=True)
         """
-        logger.info(f"Начало анализа кода на языке: {language or 'не указан'}")
+        logger.info("Начало анализа кода на языке: %s", language or "не указан")
         
         # Создаем системный промпт для анализа кода
         system_prompt = build_system_prompt("code_analysis", context)
         
-        # Формируем промпт для анализа кода
-        prompt = f"""
-        Проанализируй следующий код{f' на языке {language}' if language else ''}:
-
-        ```{language or ''}
-        {code}
-        ```
-
-        Выполни следующие задачи:
-        1. Объясни основную функциональность и структуру кода
-        2. Оцени качество кода и выяви потенциальные проблемы, включая:
-           - Ошибки или баги
-           - Проблемы производительности
-           - Уязвимости безопасности
-           - Нарушения лучших практик и стандартов
-        3. Предложи конкретные улучшения с примерами кода
-
-        Организуй ответ в разделы:
-        - Общий обзор
-        - Анализ структуры
-        - Потенциальные проблемы
-        - Рекомендуемые улучшения
-        """
+        # Слишком длинный код сокращаем до бюджета токенов
+        prompt_code, original_tokens = _shrink(code, language)
+        truncated = prompt_code is not code
+        if truncated:
+            logger.info("Код сокращен перед анализом: %s токенов (оценка)", original_tokens)
         
-        # Получаем ответ от Claude API
-        response = await self.claude_api.send_request(prompt)
+        # Формируем динамическую часть промпта (статические инструкции кэшируются)
+        code_tmpl = _CODE_TMPL_BY_LANG.get(language or None)
+        if code_tmpl is not None:
+            dynamic_part = code_tmpl.format(code=prompt_code)
+        else:
+            dynamic_part = _CODE_TMPL.format_map({
+                "language": language,
+                "fence_lang": language,
+                "code": prompt_code
+            })
+        
+        # Проверяем кэш по точному совпадению промпта: похожий код может отличаться
+        # одним оператором, поэтому результат другой версии переиспользовать нельзя
+        exact_key = prompt_hash(system_prompt, STATIC_ANALYSIS_INSTRUCTIONS, dynamic_part)
+        cached_analysis = None
+        if not no_cache:
+            cached_analysis = self._get_cached_analysis(exact_key)
+        
+        if stream:
+            return self._stream_analysis(
+                build_cached_content(STATIC_ANALYSIS_INSTRUCTIONS, dynamic_part),
+                system_prompt=system_prompt,
+                cached_analysis=cached_analysis,
+                cache_key=None if no_cache else exact_key
+            )
+        
+        if cached_analysis is not None:
+            response = cached_analysis
+        else:
+            # Получаем ответ от Claude API
+            response = await self.claude_api.send_request(
+                build_cached_content(STATIC_ANALYSIS_INSTRUCTIONS, dynamic_part),
+                system_prompt=system_prompt,
+                temperature=ANALYSIS_TEMPERATURE,
+                cache_system_prompt=True,
+                use_cache=not no_cache
+            )
         
         # Структурируем результат анализа
         analysis_result = {
@@ -70,147 +330,370 @@ class CodeAnalyzer:
             "language": language,
             "analysis": response
         }
+        if truncated:
+            analysis_result["truncated"] = True
+            analysis_result["original_tokens"] = original_tokens
+        
+        if cached_analysis is None and not no_cache:
+            self._store_cached_analysis(exact_key, response)
         
         logger.info("Анализ кода завершен")
         return analysis_result
     
-    async def analyze_repository(self, repo_url: str, branch: Optional[str] = None) -> Dict[str, Any]:
+    async def analyze_repository(self, repo_url: str, branch: Optional[str] = None,
+                                 no_cache: bool = False) -> Dict[str, Any]:
         """
         Анализирует репозиторий кода, получая ключевые файлы через Git Service.
         
         Args:
             repo_url: URL репозитория
             branch: Ветка для анализа (опционально)
+            no_cache: Не использовать кэш результатов
             
         Returns:
             Dict с результатами анализа репозитория
         """
-        logger.info(f"Начало анализа репозитория: {repo_url}, ветка: {branch or 'default'}")
+        logger.info("Начало анализа репозитория: %s, ветка: %s", repo_url, branch or "default")
         
         try:
-            # Запрашиваем информацию о репозитории из Git Service
-            async with httpx.AsyncClient() as client:
-                params = {"url": repo_url}
-                if branch:
-                    params["branch"] = branch
-                
-                response = await client.get(
-                    f"{settings.GIT_SERVICE_URL}/repos/analyze",
-                    params=params,
-                    timeout=60.0
+            # Запрашиваем информацию о репозитории из Git Service и параллельно строим системный промпт
+            repo_info, system_prompt = await asyncio.gather(
+                self._fetch_repo_info(repo_url, branch),
+                asyncio.to_thread(
+                    build_system_prompt,
+                    "code_analysis",
+                    {"repository": {"url": repo_url, "branch": branch}}
                 )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при запросе информации о репозитории: {response.text}")
-                    raise ValueError(f"Ошибка получения информации о репозитории: {response.status_code}")
-                
-                repo_info = response.json()
+            )
             
             # Получаем ключевые файлы для анализа
             key_files = repo_info.get("key_files", [])
             
+            # Метаданные репозитория используются и в контексте, и в результате анализа
+            repo_meta = {
+                "url": repo_url,
+                "branch": branch,
+                "language": repo_info.get("language"),
+                "description": repo_info.get("description"),
+                "files_count": repo_info.get("files_count")
+            }
+            
             # Подготавливаем контекст для анализа
-            context = {
-                "repository": {
-                    "url": repo_url,
-                    "branch": branch,
-                    "description": repo_info.get("description", "Нет описания"),
-                    "language": repo_info.get("language", "Не определен"),
-                    "files_count": repo_info.get("files_count", 0)
+            context = {"repository": repo_meta}
+            
+            # Листинг файлов может занимать мегабайты - собираем его вне цикла событий
+            key_file_paths = [file["path"] for file in key_files]
+            files_str = await asyncio.to_thread(_build_files_str, key_files)
+            
+            dynamic_part = _REPO_TMPL.format_map({
+                **self._repo_header_fields(repo_url, branch, repo_info),
+                "files_str": files_str
+            })
+            
+            # Версия репозитория - HEAD-коммит из Git Service, а если он не передан - хэш промпта.
+            # Кэш общий для обоих способов анализа: пофайловый анализ самый дорогой (N+1 запросов).
+            repo_key = (repo_url, branch)
+            version = repo_info.get("head_sha") or prompt_hash(STATIC_REPO_INSTRUCTIONS, dynamic_part).hex()
+            if not no_cache:
+                analysis_result = self._get_cached_repo_analysis(repo_key, version)
+                if analysis_result is not None:
+                    logger.info("Результат анализа репозитория %s найден в кэше (версия %s)", repo_url, version)
+                    return analysis_result
+            
+            # Листинг, не помещающийся в контекст, анализируется по файлам
+            if estimate_tokens(files_str) > settings.MAX_CODE_CONTEXT_TOKENS:
+                analysis_result = await self._analyze_repository_per_file(
+                    repo_url, branch, repo_info, repo_meta, system_prompt, no_cache
+                )
+            else:
+                response = await self.claude_api.send_request(
+                    build_cached_content(STATIC_REPO_INSTRUCTIONS, dynamic_part),
+                    max_tokens=4000,
+                    system_prompt=system_prompt,
+                    temperature=ANALYSIS_TEMPERATURE,
+                    cache_system_prompt=True,
+                    use_cache=not no_cache
+                )
+                
+                # Формируем результат анализа
+                analysis_result = {
+                    "repository": repo_meta,
+                    "key_files": key_file_paths,
+                    "analysis": response
                 }
-            }
             
-            # Формируем промпт для анализа репозитория
-            files_content = []
-            for file in key_files:
-                files_content.append(f"## Файл: {file['path']}")
-                files_content.append(f"```{file.get('language', '')}")
-                files_content.append(file.get("content", "Содержимое недоступно"))
-                files_content.append("```\n")
-            
-            files_str = "\n".join(files_content)
-            
-            prompt = f"""
-            Проанализируй следующий репозиторий:
-            
-            Репозиторий: {repo_url}
-            Ветка: {branch or 'default'}
-            Язык: {repo_info.get('language', 'Не определен')}
-            Описание: {repo_info.get('description', 'Нет описания')}
-            Количество файлов: {repo_info.get('files_count', 0)}
-            
-            Ниже представлены ключевые файлы репозитория для анализа:
-            
-            {files_str}
-            
-            Предоставь следующую информацию:
-            1. Общий обзор репозитория и его назначение
-            2. Архитектура проекта и основные компоненты
-            3. Используемые технологии и библиотеки
-            4. Основные паттерны проектирования
-            5. Потенциальные улучшения и рекомендации
-            
-            Структурируй ответ по разделам и дай конкретные рекомендации, если возможно.
-            """
-            
-            # Отправляем запрос к Claude API
-            response = await self.claude_api.send_request(prompt, max_tokens=4000)
-            
-            # Формируем результат анализа
-            analysis_result = {
-                "repository": {
-                    "url": repo_url,
-                    "branch": branch,
-                    "language": repo_info.get("language"),
-                    "description": repo_info.get("description"),
-                    "files_count": repo_info.get("files_count")
-                },
-                "key_files": [file["path"] for file in key_files],
-                "analysis": response
-            }
+            if not no_cache and self._repo_cache is not None:
+                self._repo_cache[repo_key] = (version, analysis_result)
             
-            logger.info(f"Анализ репозитория {repo_url} завершен")
+            logger.info("Анализ репозитория %s завершен", repo_url)
             return analysis_result
         
         except Exception as e:
-            logger.error(f"Ошибка при анализе репозитория: {str(e)}")
+            logger.error("Ошибка при анализе репозитория: %s", e)
             raise ValueError(f"Не удалось выполнить анализ репозитория: {str(e)}")
     
-    async def analyze_code_diff(self, diff: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def _analyze_repository_per_file(self, repo_url: str, branch: Optional[str],
+                                           repo_info: Dict[str, Any], repo_meta: Dict[str, Any],
+                                           system_prompt: str, no_cache: bool = False) -> Dict[str, Any]:
+        """
+        Анализирует репозиторий параллельными пофайловыми запросами к Claude.
+        
+        Используется, когда листинг ключевых файлов не помещается в один промпт.
+        Файлы анализируются независимо и одновременно; количество одновременных
+        запросов ограничено семафором (CLAUDE_MAX_CONCURRENCY), чтобы не превышать
+        лимиты Claude API. Результаты объединяются итоговым запросом.
+        
+        Args:
+            repo_url: URL репозитория
+            branch: Ветка для анализа
+            repo_info: Информация о репозитории из Git Service
+            repo_meta: Метаданные репозитория для результата анализа
+            system_prompt: Системный промпт анализа
+            no_cache: Не использовать кэш ответов Claude API
+            
+        Returns:
+            Dict с результатами анализа, включая пофайловые анализы
+        """
+        logger.info("Пофайловый анализ репозитория: %s, ветка: %s", repo_url, branch or "default")
+        
+        key_files = repo_info.get("key_files", [])
+        semaphore = asyncio.Semaphore(settings.CLAUDE_MAX_CONCURRENCY)
+        
+        async def run(file: Dict[str, Any]) -> Tuple[str, str]:
+            async with semaphore:
+                return file["path"], await self._analyze_file(file, system_prompt, no_cache)
+        
+        # Скользящее окно: одновременно существует не больше FILE_ANALYSIS_CHUNK_SIZE задач,
+        # и на место каждой завершившейся сразу ставится следующая. На больших репозиториях
+        # не создаются тысячи задач сразу, а медленный файл не задерживает остальные.
+        completed = {}
+        files_iter = iter(key_files)
+        pending = {asyncio.create_task(run(file)) for file in islice(files_iter, FILE_ANALYSIS_CHUNK_SIZE)}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    path, result = task.result()
+                    completed[path] = result
+                pending.update(asyncio.create_task(run(file)) for file in islice(files_iter, len(done)))
+        finally:
+            # При ошибке одного файла остальные запросы отменяются
+            for task in pending:
+                task.cancel()
+        
+        file_analyses = {file["path"]: completed[file["path"]] for file in key_files}
+        
+        return await self._summarize_file_analyses(
+            repo_url, branch, repo_info, repo_meta, file_analyses, system_prompt, no_cache
+        )
+    
+    async def _analyze_file(self, file: Dict[str, Any], system_prompt: str, no_cache: bool = False) -> str:
+        """
+        Анализирует один файл репозитория отдельным запросом к Claude.
+        
+        Args:
+            file: Описание файла из Git Service (path, language, content)
+            system_prompt: Системный промпт анализа
+            no_cache: Не использовать кэш ответов Claude API
+            
+        Returns:
+            str: Результат анализа файла
+        """
+        return await self.claude_api.send_request(
+            self._file_prompt(file),
+            max_tokens=FILE_ANALYSIS_MAX_TOKENS,
+            system_prompt=system_prompt,
+            temperature=ANALYSIS_TEMPERATURE,
+            cache_system_prompt=True,
+            use_cache=not no_cache
+        )
+    
+    def _file_prompt(self, file: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Формирует промпт для анализа отдельного файла.
+        
+        Args:
+            file: Описание файла из Git Service
+            
+        Returns:
+            List с блоками контента промпта
+        """
+        dynamic_part = _FILE_ANALYSIS_TMPL.format_map({
+            "path": file["path"],
+            "fence_lang": file.get("language") or "",
+            "content": _file_content(file)
+        })
+        return build_cached_content(STATIC_FILE_INSTRUCTIONS, dynamic_part)
+    
+    async def _summarize_file_analyses(self, repo_url: str, branch: Optional[str],
+                                       repo_info: Dict[str, Any], repo_meta: Dict[str, Any],
+                                       file_analyses: Dict[str, str],
+                                       system_prompt: str, no_cache: bool = False) -> Dict[str, Any]:
+        """
+        Объединяет пофайловые анализы итоговым запросом к Claude.
+        
+        Args:
+            repo_url: URL репозитория
+            branch: Ветка для анализа
+            repo_info: Информация о репозитории из Git Service
+            repo_meta: Метаданные репозитория для результата анализа
+            file_analyses: Результаты анализа по путям файлов
+            system_prompt: Системный промпт анализа
+            no_cache: Не использовать кэш ответов Claude API
+            
+        Returns:
+            Dict с результатами анализа репозитория
+        """
+        analyses_str = "\n\n".join(
+            f"## Файл: {path}\n{analysis}" for path, analysis in file_analyses.items()
+        )
+        dynamic_part = _REPO_SUMMARY_TMPL.format_map({
+            **self._repo_header_fields(repo_url, branch, repo_info),
+            "analyses_str": analyses_str
+        })
+        
+        response = await self.claude_api.send_request(
+            build_cached_content(STATIC_REPO_SUMMARY_INSTRUCTIONS, dynamic_part),
+            max_tokens=4000,
+            system_prompt=system_prompt,
+            temperature=ANALYSIS_TEMPERATURE,
+            cache_system_prompt=True,
+            use_cache=not no_cache
+        )
+        
+        return {
+            "repository": repo_meta,
+            "key_files": [file["path"] for file in repo_info.get("key_files", [])],
+            "file_analyses": file_analyses,
+            "analysis": response
+        }
+    
+    def _repo_header_fields(self, repo_url: str, branch: Optional[str],
+                            repo_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Возвращает значения полей заголовка репозитория для шаблонов промптов.
+        
+        Args:
+            repo_url: URL репозитория
+            branch: Ветка для анализа
+            repo_info: Информация о репозитории из Git Service
+            
+        Returns:
+            Dict со значениями полей шаблона
+        """
+        return {
+            "repo_url": repo_url,
+            "branch": branch or "default",
+            "language": repo_info.get("language", "Не определен"),
+            "description": repo_info.get("description", "Нет описания"),
+            "files_count": repo_info.get("files_count", 0)
+        }
+    
+    async def _fetch_repo_info(self, repo_url: str, branch: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Запрашивает информацию о репозитории и ключевые файлы из Git Service.
+        
+        Args:
+            repo_url: URL репозитория
+            branch: Ветка для анализа (опционально)
+            
+        Returns:
+            Dict с информацией о репозитории
+        """
+        params = {"url": repo_url}
+        if branch:
+            params["branch"] = branch
+        
+        # Общий срок ожидания с учетом повторных попыток
+        response = await asyncio.wait_for(self._get_repo_info(params), timeout=REPO_INFO_DEADLINE)
+        
+        if response.status_code != 200:
+            logger.error("Ошибка при запросе информации о репозитории: %s", response.text)
+            raise ValueError(f"Ошибка получения информации о репозитории: {response.status_code}")
+        
+        # Ответ может быть большим - разбираем JSON вне цикла событий
+        content = await response.aread()
+        return await asyncio.to_thread(orjson.loads, content)
+    
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential_jitter(initial=0.2, max=2.0),
+        retry=(retry_if_exception_type(httpx.TransportError)
+               | retry_if_result(lambda response: response.status_code in RETRYABLE_STATUS_CODES)),
+        retry_error_callback=lambda retry_state: retry_state.outcome.result()
+    )
+    async def _get_repo_info(self, params: Dict[str, str]) -> httpx.Response:
+        """
+        Выполняет GET-запрос информации о репозитории к Git Service.
+        
+        Запрос идемпотентен, поэтому при сетевых ошибках и ответах 502/503/504
+        повторяется с экспоненциальной задержкой. После исчерпания попыток
+        возвращается последний ответ или пробрасывается последнее исключение.
+        
+        Args:
+            params: Параметры запроса (url и опционально branch)
+            
+        Returns:
+            httpx.Response: Ответ Git Service
+        """
+        return await self._http.get(
+            f"{settings.GIT_SERVICE_URL}/repos/analyze",
+            params=params,
+            timeout=60.0
+        )
+    
+    async def analyze_code_diff(self, diff: str, context: Optional[Dict[str, Any]] = None,
+                                no_cache: bool = False,
+                                stream: bool = False) -> Union[Dict[str, Any], AsyncIterator[str]]:
         """
         Анализирует различия в коде (diff) с использованием API Claude.
         
         Args:
             diff: Строка с diff-ом в формате unified diff
             context: Дополнительный контекст для анализа
+            no_cache: Не использовать кэш результатов (для чувствительного кода)
+            stream: Возвращать текст анализа по частям по мере генерации
             
         Returns:
-            Dict с результатами анализа diff-а
+            Dict с результатами анализа diff-а или асинхронный итератор фрагментов текста (при stream=True)
         """
         logger.info("Начало анализа различий в коде")
         
         # Создаем системный промпт для анализа кода
         system_prompt = build_system_prompt("code_analysis", context)
         
-        # Формируем промпт для анализа diff-а
-        prompt = f"""
-        Проанализируй следующие изменения кода (diff):
-
-        ```diff
-        {diff}
-        ```
-
-        Предоставь следующую информацию:
-        1. Краткое описание изменений
-        2. Анализ влияния изменений на функциональность
-        3. Потенциальные проблемы или риски, связанные с изменениями
-        4. Рекомендации по улучшению или альтернативные подходы, если применимо
-
-        Организуй ответ по разделам, фокусируясь на ключевых изменениях.
-        """
+        # Формируем динамическую часть промпта (статические инструкции кэшируются)
+        dynamic_part = _DIFF_TMPL.format_map({"diff": diff})
+        
+        # Проверяем кэш по точному совпадению промпта: похожий код может отличаться
+        # одним оператором, поэтому результат другой версии переиспользовать нельзя
+        exact_key = prompt_hash(system_prompt, STATIC_DIFF_INSTRUCTIONS, dynamic_part)
+        cached_analysis = None
+        if not no_cache:
+            cached_analysis = self._get_cached_analysis(exact_key)
+        
+        if stream:
+            return self._stream_analysis(
+                build_cached_content(STATIC_DIFF_INSTRUCTIONS, dynamic_part),
+                system_prompt=system_prompt,
+                cached_analysis=cached_analysis,
+                cache_key=None if no_cache else exact_key
+            )
+        
+        if cached_analysis is not None:
+            return {
+                "diff": diff,
+                "analysis": cached_analysis
+            }
         
         # Получаем ответ от Claude API
-        response = await self.claude_api.send_request(prompt)
+        response = await self.claude_api.send_request(
+            build_cached_content(STATIC_DIFF_INSTRUCTIONS, dynamic_part),
+            system_prompt=system_prompt,
+            temperature=ANALYSIS_TEMPERATURE,
+            cache_system_prompt=True,
+            use_cache=not no_cache
+        )
         
         # Структурируем результат анализа
         analysis_result = {
@@ -218,5 +701,99 @@ class CodeAnalyzer:
             "analysis": response
         }
         
+        if not no_cache:
+            self._store_cached_analysis(exact_key, response)
+        
         logger.info("Анализ различий в коде завершен")
-        return analysis_result
\ No newline at end of file
+        return analysis_result
+    
+    async def _stream_analysis(self, prompt: List[Dict[str, Any]],
+                               system_prompt: Optional[str] = None,
+                               cached_analysis: Optional[str] = None,
+                               cache_key: Optional[bytes] = None) -> AsyncIterator[str]:
+        """
+        Передает текст анализа по частям и сохраняет полный ответ в кэш.
+        
+        Args:
+            prompt: Блоки содержимого промпта
+            system_prompt: Опциональный системный промпт
+            cached_analysis: Результат из кэша (если найден, отдается одним фрагментом)
+            cache_key: Ключ точного кэша или None, если результат не нужно кэшировать
+            
+        Yields:
+            str: Очередной фрагмент текста анализа
+        """
+        if cached_analysis is not None:
+            yield cached_analysis
+            return
+        
+        chunks = []
+        async for chunk in self.claude_api.stream_request(
+            prompt,
+            system_prompt=system_prompt,
+            temperature=ANALYSIS_TEMPERATURE,
+            cache_system_prompt=True
+        ):
+            chunks.append(chunk)
+            yield chunk
+        
+        # Сохраняем собранный ответ для буферизованных вызовов
+        if cache_key is not None:
+            self._store_cached_analysis(cache_key, "".join(chunks))
+    
+    def _get_cached_repo_analysis(self, repo_key: tuple, version: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает кэшированный анализ репозитория, если версия HEAD не изменилась.
+        
+        Запись с устаревшей версией удаляется.
+        
+        Args:
+            repo_key: Кортеж (repo_url, branch)
+            version: Текущая версия репозитория
+            
+        Returns:
+            Результат анализа или None
+        """
+        if self._repo_cache is None:
+            return None
+        
+        entry = self._repo_cache.get(repo_key)
+        if entry is None:
+            return None
+        
+        cached_version, analysis = entry
+        if cached_version != version:
+            logger.info("Версия репозитория %s изменилась, кэш анализа сброшен", repo_key[0])
+            del self._repo_cache[repo_key]
+            return None
+        
+        return analysis
+    
+    def _get_cached_analysis(self, exact_key: bytes) -> Optional[str]:
+        """
+        Ищет результат анализа в точном кэше.
+        
+        Args:
+            exact_key: Хэш полностью сформированного промпта
+            
+        Returns:
+            Текст анализа или None, если результат не найден
+        """
+        if self._exact_cache is None:
+            return None
+        
+        cached_analysis = self._exact_cache.get(exact_key)
+        if cached_analysis is not None:
+            logger.info("Результат анализа найден в точном кэше")
+        return cached_analysis
+    
+    def _store_cached_analysis(self, exact_key: bytes, analysis: str):
+        """
+        Сохраняет результат анализа в точный кэш.
+        
+        Args:
+            exact_key: Хэш полностью сформированного промпта
+            analysis: Текст анализа
+        """
+        if self._exact_cache is not None:
+            self._exact_cache[exact_key] = analysis
\ No newline at end of file
@@ -1,14 +1,150 @@
 # agent-service/app/analyzers/dependency_analyzer.py
 
+import os
 import logging
 import httpx
+import orjson
 import re
-from typing import Dict, List, Any, Optional, Set
+from itertools import chain
+from collections import Counter
+import xml.etree.ElementTree as ET
+from io import StringIO
+from contextlib import aclosing
+from typing import Dict, List, Any, Optional, Set, Tuple, Pattern, NamedTuple, Iterator
 from app.core.config import settings
 from app.services.claude_api import ClaudeAPI
+from app.analyzers.deps_fast import Dep, parse_requirements, parse_go_mod
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
 
 logger = logging.getLogger(__name__)
 
+# Регулярные выражения для парсинга файлов зависимостей (компилируются один раз при импорте)
+_GRADLE_RE = re.compile(r"(implementation|testImplementation|api|compileOnly|runtimeOnly)\s+['\"]([^'\"]+)['\"]")
+_GEM_RE = re.compile(r"gem\s+['\"]([^'\"]+)['\"](?:,\s*['\"]([^'\"]+)['\"])?")
+
+# Максимальный размер содержимого одного файла в запросе к Claude API (в символах)
+CLAUDE_DEPENDENCY_FILE_MAX_CHARS = 20000
+
+# Маркеры для определения технологий
+TECH_MARKERS = {
+    "python": [".py", "requirements.txt", "setup.py", "Pipfile", "pyproject.toml"],
+    "javascript": [".js", ".jsx", "package.json", "yarn.lock", "npm-shrinkwrap.json"],
+    "typescript": [".ts", ".tsx", "tsconfig.json"],
+    "java": [".java", "pom.xml", "build.gradle", ".gradle"],
+    "csharp": [".cs", ".csproj", ".sln"],
+    "go": [".go", "go.mod", "go.sum"],
+    "ruby": [".rb", "Gemfile", "Gemfile.lock"],
+    "php": [".php", "composer.json", "composer.lock"],
+    "rust": [".rs", "Cargo.toml", "Cargo.lock"],
+    "docker": ["Dockerfile", "docker-compose.yml"],
+    "kubernetes": [".yaml", ".yml"]  # Потенциально Kubernetes конфигурации
+}
+
+# Маркеры для определения фреймворков
+FRAMEWORK_MARKERS = {
+    "python": {
+        "django": ["django", "settings.py", "urls.py", "wsgi.py"],
+        "flask": ["flask", "app.run(", "@app.route"],
+        "fastapi": ["fastapi", "from fastapi import"],
+        "pytorch": ["torch", "import torch"],
+        "tensorflow": ["tensorflow", "import tensorflow", "import tf"],
+        "pandas": ["pandas", "import pandas as pd"],
+        "numpy": ["numpy", "import numpy as np"]
+    },
+    "javascript": {
+        "react": ["react", "import React", "from 'react'", "React.Component"],
+        "vue": ["vue", "import Vue", "new Vue("],
+        "angular": ["angular", "@angular/core", "NgModule"],
+        "express": ["express", "require('express')", "import express"],
+        "next.js": ["next", "import next", "pages directory"]
+    },
+    "java": {
+        "spring": ["org.springframework", "@Autowired", "@Controller"],
+        "hibernate": ["org.hibernate", "@Entity", "SessionFactory"],
+        "jakarta ee": ["jakarta", "javax.servlet", "@WebServlet"]
+    }
+}
+
+# Имена файлов зависимостей для каждой технологии
+DEPENDENCY_FILE_PATTERNS = {
+    "python": ["requirements.txt", "setup.py", "Pipfile", "pyproject.toml"],
+    "javascript": ["package.json", "yarn.lock", "npm-shrinkwrap.json"],
+    "java": ["pom.xml", "build.gradle"],
+    "ruby": ["Gemfile", "Gemfile.lock"],
+    "php": ["composer.json"],
+    "rust": ["Cargo.toml"],
+    "go": ["go.mod"]
+}
+
+def _compile_markers(markers_by_key: Dict[str, List[str]]) -> Tuple[Pattern[str], Dict[str, str]]:
+    """
+    Собирает маркеры в одно регулярное выражение для сканирования строки за один проход.
+    
+    Выражение построено на опережающей проверке, поэтому находит и пересекающиеся
+    маркеры (например, "docker-compose.yml" и ".yml"), как и проверка через `in`.
+    
+    Args:
+        markers_by_key: Словарь ключ -> список маркеров
+        
+    Returns:
+        Tuple из (скомпилированное выражение, словарь маркер -> ключ)
+    """
+    marker_to_key = {marker: key for key, markers in markers_by_key.items() for marker in markers}
+    alternation = "|".join(re.escape(marker) for marker in sorted(marker_to_key, key=len, reverse=True))
+    return re.compile(f"(?=({alternation}))"), marker_to_key
+
+# Маркеры технологий разделены на расширения и полные имена файлов:
+# путь сопоставляется двумя поисками в словаре вместо сканирования подстрок
+_EXT_TO_TECH = {
+    marker: tech for tech, markers in TECH_MARKERS.items() for marker in markers if marker.startswith(".")
+}
+_NAME_TO_TECH = {
+    marker: tech for tech, markers in TECH_MARKERS.items() for marker in markers if not marker.startswith(".")
+}
+_DEPENDENCY_FILE_RE, _DEPENDENCY_FILE_TO_TECH = _compile_markers(DEPENDENCY_FILE_PATTERNS)
+
+def _compile_framework_markers(frameworks: Dict[str, List[str]]) -> Tuple[Pattern[str], Dict[str, str]]:
+    """
+    Собирает маркеры фреймворков технологии в одно выражение с именованной группой на фреймворк.
+    
+    Маркеры приводятся к нижнему регистру: выражение применяется к тексту в нижнем регистре.
+    
+    Args:
+        frameworks: Словарь фреймворк -> список маркеров
+        
+    Returns:
+        Tuple из (скомпилированное выражение, словарь имя группы -> фреймворк)
+    """
+    group_to_framework = {}
+    alternatives = []
+    for index, (framework, markers) in enumerate(frameworks.items()):
+        group = f"fw{index}"
+        group_to_framework[group] = framework
+        lowered = {marker.lower() for marker in markers}
+        alternation = "|".join(re.escape(marker) for marker in sorted(lowered, key=len, reverse=True))
+        alternatives.append(f"(?P<{group}>{alternation})")
+    
+    return re.compile(f"(?=(?:{'|'.join(alternatives)}))"), group_to_framework
+
+_FRAMEWORK_MARKERS_RE = {
+    tech: _compile_framework_markers(frameworks) for tech, frameworks in FRAMEWORK_MARKERS.items()
+}
+
+class IndexedFile(NamedTuple):
+    """
+    Файл проекта с заранее извлеченными полями.
+    
+    Строится один раз в начале анализа, чтобы последующие проходы
+    не повторяли обращения к словарю файла и вычисление имени файла.
+    """
+    path: str
+    name: str
+    content: str
+
 class DependencyAnalyzer:
     """
     Класс для анализа зависимостей в проектах различных языков программирования.
@@ -17,6 +153,19 @@ class DependencyAnalyzer:
     def __init__(self):
         """Инициализация анализатора зависимостей."""
         self.claude_api = ClaudeAPI()
+        
+        # Локальные парсеры по имени файла зависимостей
+        self._handlers = {
+            "requirements.txt": self._parse_requirements_txt,
+            "package.json": self._parse_package_json,
+            "pom.xml": self._parse_pom_xml,
+            "build.gradle": self._parse_gradle,
+            "build.gradle.kts": self._parse_gradle,
+            "Gemfile": self._parse_gemfile,
+            "Cargo.toml": self._parse_cargo_toml,
+            "go.mod": self._parse_go_mod
+        }
+        
         logger.info("DependencyAnalyzer инициализирован")
     
     async def analyze_dependencies(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -31,11 +180,17 @@ class DependencyAnalyzer:
         """
         logger.info("Начало анализа зависимостей проекта")
         
+        # Индексируем файлы один раз для всех последующих проходов
+        indexed_files = []
+        for file_info in files:
+            file_path = file_info.get("path", "")
+            indexed_files.append(IndexedFile(file_path, os.path.basename(file_path), file_info.get("content", "")))
+        
         # Определяем технологический стек проекта
-        tech_stack = await self._detect_tech_stack(files)
+        tech_stack = await self._detect_tech_stack(indexed_files)
         
         # Извлекаем файлы зависимостей в зависимости от технологического стека
-        dependency_files = self._extract_dependency_files(files, tech_stack)
+        dependency_files = self._extract_dependency_files(indexed_files, tech_stack)
         
         if not dependency_files:
             logger.warning("Не найдены файлы с зависимостями для анализа")
@@ -45,72 +200,63 @@ class DependencyAnalyzer:
                 "recommendations": "Не найдены файлы с зависимостями для анализа."
             }
         
-        # Анализируем каждый файл зависимостей
-        all_dependencies = []
-        for dep_file in dependency_files:
-            deps = await self._parse_dependencies(dep_file, tech_stack)
-            all_dependencies.extend(deps)
+        # Анализируем файлы зависимостей известных форматов локально
+        results, unknown_files = self._parse_dependencies(dependency_files)
+        
+        # Для других форматов используем Claude API - один общий запрос на все файлы
+        if unknown_files:
+            extracted = await self._extract_dependencies_with_claude(list(unknown_files.values()))
+            
+            for index, dep_file in unknown_files.items():
+                results[index] = extracted.get(dep_file.path, [])
         
-        # Удаляем дубликаты
-        unique_deps = []
-        seen = set()
-        for dep in all_dependencies:
-            if dep["name"] not in seen:
-                seen.add(dep["name"])
-                unique_deps.append(dep)
+        all_dependencies = results[0] if len(results) == 1 else list(chain.from_iterable(results))
+        
+        # Удаляем дубликаты: побеждает первое вхождение, порядок файлов сохраняется.
+        # Для одной зависимости дубликатов быть не может
+        if len(all_dependencies) <= 1:
+            unique_deps = all_dependencies
+        else:
+            deps_by_name = {}
+            for dep in all_dependencies:
+                deps_by_name.setdefault(dep.name, dep)
+            unique_deps = list(deps_by_name.values())
+        
+        if not unique_deps:
+            logger.warning("В файлах зависимостей не найдено ни одной зависимости")
+            return {
+                "tech_stack": tech_stack,
+                "dependencies": [],
+                "recommendations": "В файлах зависимостей не найдено ни одной зависимости."
+            }
         
         # Получаем рекомендации по зависимостям с использованием Claude API
         recommendations = await self._get_dependency_recommendations(unique_deps, tech_stack)
         
         analysis_result = {
             "tech_stack": tech_stack,
-            "dependencies": unique_deps,
+            "dependencies": [dep._asdict() for dep in unique_deps],
             "recommendations": recommendations
         }
         
         logger.info(f"Анализ зависимостей завершен. Найдено {len(unique_deps)} уникальных зависимостей")
         return analysis_result
     
-    async def _detect_tech_stack(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def _detect_tech_stack(self, files: List[IndexedFile]) -> Dict[str, Any]:
         """
         Определяет технологический стек проекта на основе файлов.
         
         Args:
-            files: Список словарей с информацией о файлах
+            files: Список проиндексированных файлов
             
         Returns:
             Dict с информацией о технологическом стеке
         """
-        # Маркеры для определения технологий
-        tech_markers = {
-            "python": [".py", "requirements.txt", "setup.py", "Pipfile", "pyproject.toml"],
-            "javascript": [".js", ".jsx", "package.json", "yarn.lock", "npm-shrinkwrap.json"],
-            "typescript": [".ts", ".tsx", "tsconfig.json"],
-            "java": [".java", "pom.xml", "build.gradle", ".gradle"],
-            "csharp": [".cs", ".csproj", ".sln"],
-            "go": [".go", "go.mod", "go.sum"],
-            "ruby": [".rb", "Gemfile", "Gemfile.lock"],
-            "php": [".php", "composer.json", "composer.lock"],
-            "rust": [".rs", "Cargo.toml", "Cargo.lock"],
-            "docker": ["Dockerfile", "docker-compose.yml"],
-            "kubernetes": [".yaml", ".yml"]  # Потенциально Kubernetes конфигурации
-        }
-        
-        # Счетчики для каждой технологии
-        tech_counts = {tech: 0 for tech in tech_markers}
-        
-        # Проходим по всем файлам и считаем маркеры
-        for file_info in files:
-            file_path = file_info.get("path", "")
-            
-            for tech, markers in tech_markers.items():
-                for marker in markers:
-                    if marker in file_path:
-                        tech_counts[tech] += 1
-                        break
+        # Считаем файлы каждой технологии: в счетчик попадают только найденные технологии
+        tech_counts = Counter(self._iter_file_techs(files))
         
-        # Определяем основные технологии
-        main_techs = [tech for tech, count in tech_counts.items() if count > 0]
+        # Определяем основные технологии (в порядке объявления маркеров)
+        main_techs = [tech for tech in TECH_MARKERS if tech in tech_counts]
         
         # Определяем конкретные фреймворки и библиотеки
         frameworks = await self._detect_frameworks(files, main_techs)
@@ -120,136 +266,132 @@ class DependencyAnalyzer:
             "frameworks": frameworks
         }
     
-    async def _detect_frameworks(self, files: List[Dict[str, Any]], main_techs: List[str]) -> List[str]:
+    @staticmethod
+    def _iter_file_techs(files: List[IndexedFile]) -> Iterator[str]:
+        """
+        Перечисляет технологии файлов по расширению и по имени файла.
+        
+        Каждая технология выдается для файла не более одного раза.
+        
+        Args:
+            files: Список проиндексированных файлов
+            
+        Yields:
+            str: Технология очередного файла
+        """
+        for indexed_file in files:
+            ext_tech = _EXT_TO_TECH.get(os.path.splitext(indexed_file.name)[1])
+            name_tech = _NAME_TO_TECH.get(indexed_file.name)
+            
+            if ext_tech:
+                yield ext_tech
+            if name_tech and name_tech != ext_tech:
+                yield name_tech
+    
+    async def _detect_frameworks(self, files: List[IndexedFile], main_techs: List[str]) -> List[str]:
         """
         Определяет фреймворки и библиотеки, используемые в проекте.
         
         Args:
-            files: Список словарей с информацией о файлах
+            files: Список проиндексированных файлов
             main_techs: Список основных технологий
             
         Returns:
             List с названиями фреймворков
         """
-        frameworks = []
-        
-        # Маркеры для определения фреймворков
-        framework_markers = {
-            "python": {
-                "django": ["django", "settings.py", "urls.py", "wsgi.py"],
-                "flask": ["flask", "app.run(", "@app.route"],
-                "fastapi": ["fastapi", "from fastapi import"],
-                "pytorch": ["torch", "import torch"],
-                "tensorflow": ["tensorflow", "import tensorflow", "import tf"],
-                "pandas": ["pandas", "import pandas as pd"],
-                "numpy": ["numpy", "import numpy as np"]
-            },
-            "javascript": {
-                "react": ["react", "import React", "from 'react'", "React.Component"],
-                "vue": ["vue", "import Vue", "new Vue("],
-                "angular": ["angular", "@angular/core", "NgModule"],
-                "express": ["express", "require('express')", "import express"],
-                "next.js": ["next", "import next", "pages directory"]
-            },
-            "java": {
-                "spring": ["org.springframework", "@Autowired", "@Controller"],
-                "hibernate": ["org.hibernate", "@Entity", "SessionFactory"],
-                "jakarta ee": ["jakarta", "javax.servlet", "@WebServlet"]
-            }
-        }
+        # Без технологий с известными маркерами фреймворков сканировать нечего
+        techs = [tech for tech in main_techs if tech in FRAMEWORK_MARKERS]
+        if not techs:
+            return []
         
-        # Проходим по всем файлам и ищем маркеры фреймворков
-        for tech in main_techs:
-            if tech in framework_markers:
-                for file_info in files:
-                    file_content = file_info.get("content", "")
-                    file_path = file_info.get("path", "")
-                    
-                    for framework, markers in framework_markers[tech].items():
-                        for marker in markers:
-                            if marker in file_content or marker in file_path:
-                                if framework not in frameworks:
-                                    frameworks.append(framework)
-                                break
-        
-        return frameworks
+        # Множество для быстрой проверки и список для сохранения порядка обнаружения
+        frameworks_set = set()
+        frameworks_list = []
+        
+        # Содержимое и путь переводятся в нижний регистр один раз на файл:
+        # поиск маркеров не зависит от регистра ("import React" / "import react")
+        lowered_files = [(indexed_file.content.lower(), indexed_file.path.lower()) for indexed_file in files]
+        
+        # Проходим по всем файлам и ищем маркеры фреймворков: содержимое и путь сканируются
+        # одним выражением на технологию
+        for tech in techs:
+            markers_re, group_to_framework = _FRAMEWORK_MARKERS_RE[tech]
+            
+            for lowered_texts in lowered_files:
+                # Все фреймворки технологии уже найдены - остальные файлы не сканируем
+                if frameworks_set.issuperset(group_to_framework.values()):
+                    break
+                
+                found = {
+                    group_to_framework[match.lastgroup]
+                    for text in lowered_texts
+                    for match in markers_re.finditer(text)
+                }
+                
+                # Сохраняем порядок объявления фреймворков
+                for framework in FRAMEWORK_MARKERS[tech]:
+                    if framework in found and framework not in frameworks_set:
+                        frameworks_set.add(framework)
+                        frameworks_list.append(framework)
+        
+        return frameworks_list
     
-    def _extract_dependency_files(self, files: List[Dict[str, Any]], tech_stack: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _extract_dependency_files(self, files: List[IndexedFile], tech_stack: Dict[str, Any]) -> List[IndexedFile]:
         """
         Извлекает файлы с зависимостями на основе технологического стека.
         
         Args:
-            files: Список словарей с информацией о файлах
+            files: Список проиндексированных файлов
             tech_stack: Информация о технологическом стеке
             
         Returns:
             List с файлами зависимостей
         """
-        dependency_file_patterns = {
-            "python": ["requirements.txt", "setup.py", "Pipfile", "pyproject.toml"],
-            "javascript": ["package.json", "yarn.lock", "npm-shrinkwrap.json"],
-            "java": ["pom.xml", "build.gradle"],
-            "ruby": ["Gemfile", "Gemfile.lock"],
-            "php": ["composer.json"],
-            "rust": ["Cargo.toml"],
-            "go": ["go.mod"]
+        # Файлы зависимостей для каждой технологии в стеке (в порядке технологий)
+        files_by_tech = {
+            tech: [] for tech in tech_stack.get("main_languages", [])
+            if tech in DEPENDENCY_FILE_PATTERNS
         }
+        if not files_by_tech:
+            return []
         
-        dependency_files = []
-        
-        # Извлекаем файлы зависимостей для каждой технологии в стеке
-        for tech in tech_stack.get("main_languages", []):
-            if tech in dependency_file_patterns:
-                patterns = dependency_file_patterns[tech]
-                
-                for file_info in files:
-                    file_path = file_info.get("path", "")
-                    
-                    for pattern in patterns:
-                        if pattern in file_path or file_path.endswith(pattern):
-                            dependency_files.append(file_info)
-                            break
+        # Путь каждого файла сканируется один раз
+        for indexed_file in files:
+            for tech in {_DEPENDENCY_FILE_TO_TECH[marker] for marker in _DEPENDENCY_FILE_RE.findall(indexed_file.path)}:
+                if tech in files_by_tech:
+                    files_by_tech[tech].append(indexed_file)
         
-        return dependency_files
+        return [indexed_file for tech_files in files_by_tech.values() for indexed_file in tech_files]
     
-    async def _parse_dependencies(self, file_info: Dict[str, Any], tech_stack: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _parse_dependencies(self, dependency_files: List[IndexedFile]) -> Tuple[List[List[Dep]], Dict[int, IndexedFile]]:
         """
-        Парсит файл зависимостей для извлечения информации о зависимостях.
+        Парсит файлы зависимостей известных форматов локальными парсерами.
+        
+        Метод синхронный: обращения к Claude API для остальных файлов
+        выполняет вызывающий код, и только если такие файлы есть.
         
         Args:
-            file_info: Словарь с информацией о файле
-            tech_stack: Информация о технологическом стеке
+            dependency_files: Список проиндексированных файлов зависимостей
             
         Returns:
-            List словарей с информацией о зависимостях
+            Tuple из списка зависимостей для каждого файла (в порядке файлов; для
+            неизвестных форматов - пустой список) и словаря индекс -> файл неизвестного формата
         """
-        file_path = file_info.get("path", "")
-        file_content = file_info.get("content", "")
-        
-        dependencies = []
+        results = []
+        unknown_files = {}
         
-        # Парсим зависимости в зависимости от типа файла
-        if "requirements.txt" in file_path:
-            dependencies = self._parse_requirements_txt(file_content)
-        elif "package.json" in file_path:
-            dependencies = self._parse_package_json(file_content)
-        elif "pom.xml" in file_path:
-            dependencies = self._parse_pom_xml(file_content)
-        elif "build.gradle" in file_path:
-            dependencies = self._parse_gradle(file_content)
-        elif "Gemfile" in file_path and not file_path.endswith(".lock"):
-            dependencies = self._parse_gemfile(file_content)
-        elif "Cargo.toml" in file_path:
-            dependencies = self._parse_cargo_toml(file_content)
-        elif "go.mod" in file_path:
-            dependencies = self._parse_go_mod(file_content)
-        else:
-            # Для других форматов используем Claude API для извлечения зависимостей
-            dependencies = await self._extract_dependencies_with_claude(file_path, file_content)
+        for index, dep_file in enumerate(dependency_files):
+            parser = self._handlers.get(dep_file.name)
+            
+            if parser is not None:
+                results.append(parser(dep_file.content))
+            else:
+                results.append([])
+                unknown_files[index] = dep_file
         
-        return dependencies
+        return results, unknown_files
     
-    def _parse_requirements_txt(self, content: str) -> List[Dict[str, Any]]:
+    def _parse_requirements_txt(self, content: str) -> List[Dep]:
         """
         Парсит файл requirements.txt для Python.
         
@@ -257,35 +399,11 @@ class DependencyAnalyzer:
             content: Содержимое файла
             
         Returns:
-            List словарей с информацией о зависимостях
+            List зависимостей
         """
-        dependencies = []
-        
-        for line in content.split("\n"):
-            line = line.strip()
-            
-            # Пропускаем комментарии и пустые строки
-            if not line or line.startswith("#"):
-                continue
-            
-            # Пропускаем опции и ссылки на другие файлы
-            if line.startswith("-r") or line.startswith("--"):
-                continue
-            
-            # Извлекаем имя пакета и версию
-            parts = re.split(r"[=<>~!]", line, 1)
-            name = parts[0].strip()
-            version = parts[1].strip() if len(parts) > 1 else "latest"
-            
-            dependencies.append({
-                "name": name,
-                "version": version,
-                "type": "runtime"
-            })
-        
-        return dependencies
+        return parse_requirements(content)
     
-    def _parse_package_json(self, content: str) -> List[Dict[str, Any]]:
+    def _parse_package_json(self, content: str) -> List[Dep]:
         """
         Парсит файл package.json для JavaScript/Node.js.
         
@@ -293,38 +411,29 @@ class DependencyAnalyzer:
             content: Содержимое файла
             
         Returns:
-            List словарей с информацией о зависимостях
+            List зависимостей
         """
         dependencies = []
         
         try:
-            import json
-            data = json.loads(content)
+            data = orjson.loads(content)
             
             # Извлекаем основные зависимости
             if "dependencies" in data:
                 for name, version in data["dependencies"].items():
-                    dependencies.append({
-                        "name": name,
-                        "version": version,
-                        "type": "runtime"
-                    })
+                    dependencies.append(Dep(name, version, "runtime"))
             
             # Извлекаем зависимости для разработки
             if "devDependencies" in data:
                 for name, version in data["devDependencies"].items():
-                    dependencies.append({
-                        "name": name,
-                        "version": version,
-                        "type": "development"
-                    })
+                    dependencies.append(Dep(name, version, "development"))
         
         except Exception as e:
             logger.error(f"Ошибка при парсинге package.json: {str(e)}")
         
         return dependencies
     
-    def _parse_pom_xml(self, content: str) -> List[Dict[str, Any]]:
+    def _parse_pom_xml(self, content: str) -> List[Dep]:
         """
         Парсит файл pom.xml для Maven (Java).
         
@@ -332,30 +441,36 @@ class DependencyAnalyzer:
             content: Содержимое файла
             
         Returns:
-            List словарей с информацией о зависимостях
+            List зависимостей
         """
         dependencies = []
         
         try:
-            # Извлекаем зависимости с помощью регулярных выражений
-            # Это упрощенный подход, для полного парсинга XML лучше использовать XML-парсер
-            dependency_pattern = r"<dependency>.*?<groupId>(.*?)</groupId>.*?<artifactId>(.*?)</artifactId>.*?<version>(.*?)</version>.*?</dependency>"
-            
-            for match in re.finditer(dependency_pattern, content, re.DOTALL):
-                group_id, artifact_id, version = match.groups()
+            # Потоковый разбор XML: элементы <dependency> обрабатываются по мере закрытия
+            for _, element in ET.iterparse(StringIO(content), events=("end",)):
+                if element.tag.rpartition("}")[2] != "dependency":
+                    continue
+                
+                group_id = element.findtext("{*}groupId")
+                artifact_id = element.findtext("{*}artifactId")
+                version = element.findtext("{*}version")
                 
-                dependencies.append({
-                    "name": f"{group_id}:{artifact_id}",
-                    "version": version,
-                    "type": "runtime"
-                })
+                if group_id and artifact_id:
+                    dependencies.append(Dep(
+                        f"{group_id.strip()}:{artifact_id.strip()}",
+                        version.strip() if version else "unspecified",
+                        "runtime"
+                    ))
+                
+                # Освобождаем память разобранного элемента
+                element.clear()
         
         except Exception as e:
             logger.error(f"Ошибка при парсинге pom.xml: {str(e)}")
         
         return dependencies
     
-    def _parse_gradle(self, content: str) -> List[Dict[str, Any]]:
+    def _parse_gradle(self, content: str) -> List[Dep]:
         """
         Парсит файл build.gradle для Gradle (Java).
         
@@ -363,15 +478,13 @@ class DependencyAnalyzer:
             content: Содержимое файла
             
         Returns:
-            List словарей с информацией о зависимостях
+            List зависимостей
         """
         dependencies = []
         
         try:
             # Извлекаем зависимости с помощью регулярных выражений
-            dependency_pattern = r"(implementation|testImplementation|api|compileOnly|runtimeOnly)\s+['\"]([^'\"]+)['\"]"
-            
-            for match in re.finditer(dependency_pattern, content):
+            for match in _GRADLE_RE.finditer(content):
                 scope, dependency_string = match.groups()
                 
                 # Определяем тип зависимости
@@ -390,18 +503,14 @@ class DependencyAnalyzer:
                     name = dependency_string
                     version = "unspecified"
                 
-                dependencies.append({
-                    "name": name,
-                    "version": version,
-                    "type": dep_type
-                })
+                dependencies.append(Dep(name, version, dep_type))
         
         except Exception as e:
             logger.error(f"Ошибка при парсинге build.gradle: {str(e)}")
         
         return dependencies
     
-    def _parse_gemfile(self, content: str) -> List[Dict[str, Any]]:
+    def _parse_gemfile(self, content: str) -> List[Dep]:
         """
         Парсит Gemfile для Ruby.
         
@@ -409,29 +518,23 @@ class DependencyAnalyzer:
             content: Содержимое файла
             
         Returns:
-            List словарей с информацией о зависимостях
+            List зависимостей
         """
         dependencies = []
         
         try:
             # Извлекаем зависимости с помощью регулярных выражений
-            gem_pattern = r"gem\s+['\"]([^'\"]+)['\"](?:,\s*['\"]([^'\"]+)['\"])?"
-            
-            for match in re.finditer(gem_pattern, content):
+            for match in _GEM_RE.finditer(content):
                 name, version = match.groups()
                 
-                dependencies.append({
-                    "name": name,
-                    "version": version or "latest",
-                    "type": "runtime"
-                })
+                dependencies.append(Dep(name, version or "latest", "runtime"))
         
         except Exception as e:
             logger.error(f"Ошибка при парсинге Gemfile: {str(e)}")
         
         return dependencies
     
-    def _parse_cargo_toml(self, content: str) -> List[Dict[str, Any]]:
+    def _parse_cargo_toml(self, content: str) -> List[Dep]:
         """
         Парсит Cargo.toml для Rust.
         
@@ -439,54 +542,26 @@ class DependencyAnalyzer:
             content: Содержимое файла
             
         Returns:
-            List словарей с информацией о зависимостях
+            List зависимостей
         """
         dependencies = []
         
         try:
-            # Ищем секцию [dependencies]
-            in_dependencies = False
+            data = tomllib.loads(content)
             
-            for line in content.split("\n"):
-                line = line.strip()
-                
-                if not line or line.startswith("#"):
-                    continue
-                
-                if line == "[dependencies]":
-                    in_dependencies = True
-                    continue
-                
-                if line.startswith("[") and line.endswith("]"):
-                    in_dependencies = False
-                    continue
-                
-                if in_dependencies and "=" in line:
-                    parts = line.split("=", 1)
-                    name = parts[0].strip()
-                    version_part = parts[1].strip()
-                    
-                    # Удаляем кавычки и фигурные скобки из версии
-                    version_part = version_part.strip('",{}')
-                    
-                    if "version" in version_part:
-                        version_match = re.search(r"version\s*=\s*[\'\"]([^\'\"]+)", version_part)
-                        version = version_match.group(1) if version_match else "latest"
-                    else:
-                        version = version_part
+            # Зависимости задаются строкой версии или таблицей (version, git, path, features)
+            for section, dep_type in (("dependencies", "runtime"), ("dev-dependencies", "development")):
+                for name, spec in data.get(section, {}).items():
+                    version = spec if isinstance(spec, str) else spec.get("version", "latest")
                     
-                    dependencies.append({
-                        "name": name,
-                        "version": version,
-                        "type": "runtime"
-                    })
+                    dependencies.append(Dep(name, version, dep_type))
         
         except Exception as e:
             logger.error(f"Ошибка при парсинге Cargo.toml: {str(e)}")
         
         return dependencies
     
-    def _parse_go_mod(self, content: str) -> List[Dict[str, Any]]:
+    def _parse_go_mod(self, content: str) -> List[Dep]:
         """
         Парсит go.mod для Go.
         
@@ -494,125 +569,121 @@ class DependencyAnalyzer:
             content: Содержимое файла
             
         Returns:
-            List словарей с информацией о зависимостях
+            List зависимостей
         """
-        dependencies = []
-        
         try:
-            # Ищем строки с require
-            require_pattern = r"require\s+([^\s]+)\s+([^\s]+)"
-            
-            for match in re.finditer(require_pattern, content):
-                name, version = match.groups()
-                
-                dependencies.append({
-                    "name": name,
-                    "version": version,
-                    "type": "runtime"
-                })
-            
-            # Ищем блоки require
-            block_pattern = r"require\s+\((.*?)\)"
-            block_matches = re.finditer(block_pattern, content, re.DOTALL)
-            
-            for block_match in block_matches:
-                block = block_match.group(1)
-                
-                for line in block.split("\n"):
-                    line = line.strip()
-                    
-                    if not line or line.startswith("//"):
-                        continue
-                    
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        name, version = parts[0], parts[1]
-                        
-                        dependencies.append({
-                            "name": name,
-                            "version": version,
-                            "type": "runtime"
-                        })
+            return parse_go_mod(content)
         
         except Exception as e:
             logger.error(f"Ошибка при парсинге go.mod: {str(e)}")
-        
-        return dependencies
+            return []
     
-    async def _extract_dependencies_with_claude(self, file_path: str, file_content: str) -> List[Dict[str, Any]]:
+    async def _extract_dependencies_with_claude(self, files: List[IndexedFile]) -> Dict[str, List[Dep]]:
         """
-        Использует Claude API для извлечения зависимостей из неизвестного формата файла.
+        Использует Claude API для извлечения зависимостей из файлов неизвестного формата.
+        
+        Все файлы передаются одним запросом; содержимое каждого файла
+        ограничено CLAUDE_DEPENDENCY_FILE_MAX_CHARS символами.
         
         Args:
-            file_path: Путь к файлу
-            file_content: Содержимое файла
+            files: Список проиндексированных файлов
             
         Returns:
-            List словарей с информацией о зависимостях
+            Dict, где ключ - путь к файлу, а значение - список зависимостей
         """
         try:
+            files_str = "\n".join(
+                f"## {dep_file.path}\n```\n{dep_file.content[:CLAUDE_DEPENDENCY_FILE_MAX_CHARS]}\n```"
+                for dep_file in files
+            )
+            
             # Формируем промпт для Claude API
             prompt = f"""
-            Извлеки список зависимостей из следующего файла:
-            
-            Файл: {file_path}
+            Извлеки список зависимостей из каждого из следующих файлов:
             
-            ```
-            {file_content}
-            ```
+            {files_str}
             
-            Представь результат в формате JSON-массива, где каждый элемент имеет следующую структуру:
+            Представь результат в формате JSON-объекта, где ключ - путь к файлу,
+            а значение - JSON-массив, каждый элемент которого имеет следующую структуру:
             {{
                 "name": "имя_зависимости",
                 "version": "версия_зависимости",
                 "type": "тип_зависимости" // (runtime, development, test и т.д.)
             }}
             
-            Выведи только JSON-массив без дополнительных пояснений.
+            Выведи только JSON-объект без дополнительных пояснений.
             """
             
-            # Вызываем Claude API
-            response = await self.claude_api.send_request(prompt)
-            
-            # Извлекаем JSON из ответа
-            json_str = self._extract_json_array(response)
+            # Вызываем Claude API и извлекаем JSON из ответа по мере его генерации
+            json_bytes = await self._stream_json_object(prompt)
             
-            if json_str:
-                import json
-                dependencies = json.loads(json_str)
-                return dependencies
+            if json_bytes:
+                dependencies_by_path = orjson.loads(json_bytes)
+                return {
+                    path: [
+                        Dep(str(dep["name"]), str(dep.get("version", "latest")), str(dep.get("type", "runtime")))
+                        for dep in deps if isinstance(dep, dict) and dep.get("name")
+                    ]
+                    for path, deps in dependencies_by_path.items()
+                    if isinstance(deps, list)
+                }
             
-            return []
+            return {}
         
         except Exception as e:
             logger.error(f"Ошибка при извлечении зависимостей с помощью Claude API: {str(e)}")
-            return []
+            return {}
     
-    def _extract_json_array(self, text: str) -> str:
+    async def _stream_json_object(self, prompt: str) -> Optional[bytes]:
         """
-        Извлекает JSON-массив из текстового ответа Claude API.
+        Получает потоковый ответ Claude API и извлекает из него первый JSON-объект.
+        
+        Фигурные скобки подсчитываются по мере поступления фрагментов (с учетом строк
+        и экранирования), поэтому чтение ответа прекращается сразу после закрытия объекта,
+        а в памяти хранится только сам объект.
         
         Args:
-            text: Текст, содержащий JSON-массив
+            prompt: Текст промпта
             
         Returns:
-            Строка с JSON-массивом или пустая строка в случае ошибки
+            Байты JSON-объекта или None, если объект не найден
         """
-        try:
-            # Ищем открывающую и закрывающую квадратные скобки
-            start_index = text.find("[")
-            end_index = text.rfind("]")
-            
-            if start_index == -1 or end_index == -1 or start_index > end_index:
-                return ""
-            
-            return text[start_index:end_index+1]
+        buffer = bytearray()
+        depth = 0
+        in_string = False
+        escaped = False
+        
+        async with aclosing(self.claude_api.stream_request(prompt)) as stream:
+            async for chunk in stream:
+                start = 0 if depth else chunk.find("{")
+                if start == -1:
+                    continue
+                
+                for index in range(start, len(chunk)):
+                    char = chunk[index]
+                    
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif char == "\\":
+                            escaped = True
+                        elif char == '"':
+                            in_string = False
+                    elif char == '"':
+                        in_string = True
+                    elif char == "{":
+                        depth += 1
+                    elif char == "}":
+                        depth -= 1
+                        if depth == 0:
+                            buffer += chunk[start:index + 1].encode("utf-8")
+                            return bytes(buffer)
+                
+                buffer += chunk[start:].encode("utf-8")
         
-        except Exception as e:
-            logger.error(f"Ошибка при извлечении JSON-массива: {str(e)}")
-            return ""
+        return None
     
-    async def _get_dependency_recommendations(self, dependencies: List[Dict[str, Any]], tech_stack: Dict[str, Any]) -> str:
+    async def _get_dependency_recommendations(self, dependencies: List[Dep], tech_stack: Dict[str, Any]) -> str:
         """
         Получает рекомендации по зависимостям с использованием Claude API.
         
@@ -628,7 +699,7 @@ class DependencyAnalyzer:
             main_languages = ", ".join(tech_stack.get("main_languages", []))
             frameworks = ", ".join(tech_stack.get("frameworks", []))
             
-            deps_text = "\n".join([f"- {dep['name']} ({dep.get('version', 'unknown version')})" for dep in dependencies[:20]])
+            deps_text = "\n".join([f"- {dep.name} ({dep.version or 'unknown version'})" for dep in dependencies[:20]])
             
             prompt = f"""
             Проанализируй список зависимостей проекта и предоставь рекомендации.
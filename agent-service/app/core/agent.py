@@ -3,18 +3,147 @@
 import logging
 import uuid
 import json
-from typing import Dict, List, Any, Optional
-from fastapi import HTTPException
+import re
+import asyncio
+from functools import cached_property
+from string import Template
+from typing import Dict, Any, Optional, AsyncIterator
+from cachetools import TTLCache
+from app.core.config import settings
 from app.services.claude_api import ClaudeAPI
 from app.analyzers.code_analyzer import CodeAnalyzer
 from app.analyzers.dependency_analyzer import DependencyAnalyzer
 from app.generators.code_generator import CodeGenerator
-from app.utils.prompt_utils import load_prompt, format_context_for_prompt
-from app.utils.file_utils import format_file_context
+from app.utils.prompt_utils import (
+    load_prompt, split_prompt_template, build_cached_content
+)
+from app.utils.cache_utils import prompt_hash
+from app.utils.file_utils import format_file_context, select_files_within_budget
 from app.tasks.executor import TaskExecutor
 
 logger = logging.getLogger(__name__)
 
+_JSON_DECODER = json.JSONDecoder()
+
+# Ключевые слова для локальной классификации запросов без обращения к Claude.
+# Русские слова заданы основами, поэтому граница слова проверяется только в начале;
+# английские слова перечислены полностью и ограничены с обеих сторон ("fixture" - не "fix").
+# Git-операция запускает фоновую задачу, поэтому локально распознаются только повелительные
+# формы: команда "git <глагол>" в начале сообщения, глагол в начале сообщения рядом со словом
+# repo/branch/remote/origin или русский глагол в повелительном наклонении.
+_REQUEST_TYPE_KEYWORDS = {
+    "git_operation": (r"\A\s*git\s+\w+"
+                      r"|\A\s*(?:clone|commit|push|pull|merge|rebase|checkout)\b[^.?!\n]{0,40}?"
+                      r"\b(?:repo(?:sitory)?|branch|remote|origin)\b"
+                      r"|\b(?:закоммить|запушь|склонируй|клонируй)(?:те)?\b"),
+    "error_fixing": (r"\b(?:ошибк|баг|исправ|дебаг|отлад|не работает|падает)"
+                     r"|\b(?:errors?|exceptions?|traceback|fix(?:es|ed|ing)?|bugs?|debug)\b"),
+    "code_generation": r"\b(?:напиши|сгенерируй|создай|реализуй)|\b(?:generate|implement|write)\b",
+    "code_analysis": r"\b(?:объясни|проанализируй|ревью|как работает)|\b(?:analy[sz]e|explain|review)\b"
+}
+
+# Одна альтернатива с именованными группами: все категории за один проход
+_REQUEST_TYPE_RE = re.compile(
+    "|".join(f"(?P<{request_type}>{pattern})" for request_type, pattern in _REQUEST_TYPE_KEYWORDS.items()),
+    re.IGNORECASE
+)
+
+# Признаки вопроса: такие сообщения не считаются командой git без проверки Claude
+_QUESTION_RE = re.compile(r"\?|\b(?:что|чем|как|какой|почему|зачем|what|how|why)\b", re.IGNORECASE)
+
+# Статические инструкции для разбора Git-операций
+GIT_OPERATION_PROMPT = """Пользователь запрашивает операцию с Git.
+
+Проанализируй запрос и определи:
+1. Какой тип операции требуется (clone, commit, push, pull, branch и т.д.)
+2. Какие параметры необходимы для выполнения (URL репозитория, ветка, сообщение и т.д.)
+3. Шаги, которые нужно выполнить
+
+Представь результат в JSON формате:
+{
+    "operation_type": "тип операции",
+    "parameters": {
+        "param1": "value1",
+        "param2": "value2"
+    },
+    "steps": [
+        "шаг 1",
+        "шаг 2"
+    ]
+}"""
+
+# Инструкции для обработки запроса за один вызов Claude с выбором инструмента
+TOOL_ROUTING_PROMPT = """Ты опытный AI-ассистент разработчика. Определи тип запроса пользователя и вызови
+РОВНО ОДИН инструмент, соответствующий запросу, передав в него полный ответ для пользователя:
+
+- analyze_code - анализ кода, архитектуры, объяснение как что-то работает
+- generate_code - генерация нового кода или модификация существующего
+- fix_error - исправление ошибки или отладка проблемы
+- git_operation - операции с git (clone, commit, push и т.д.)
+- answer_general - общий вопрос, не относящийся к указанным категориям
+
+Код оформляй блоками в формате:
+
+## Файл: <путь_к_файлу>
+```<язык>
+// код здесь
+```"""
+
+# Схема аргумента с полным ответом пользователю
+_RESPONSE_PROPERTY = {
+    "response": {"type": "string", "description": "Полный ответ пользователю в формате Markdown"}
+}
+
+# Инструменты по одному на тип запроса: модель выбирает тип и сразу формирует ответ
+AGENT_TOOLS = [
+    {
+        "name": "analyze_code",
+        "description": "Анализ кода: обзор, архитектура, качество, производительность, безопасность, рекомендации.",
+        "input_schema": {"type": "object", "properties": _RESPONSE_PROPERTY, "required": ["response"]}
+    },
+    {
+        "name": "generate_code",
+        "description": "Генерация нового кода или модификация существующего с пояснением ключевых решений.",
+        "input_schema": {"type": "object", "properties": _RESPONSE_PROPERTY, "required": ["response"]}
+    },
+    {
+        "name": "fix_error",
+        "description": "Исправление ошибки: причина проблемы, объяснение и исправленный код.",
+        "input_schema": {"type": "object", "properties": _RESPONSE_PROPERTY, "required": ["response"]}
+    },
+    {
+        "name": "git_operation",
+        "description": "План выполнения операции с Git.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "operation_type": {"type": "string", "description": "Тип операции (clone, commit, push, pull, branch и т.д.)"},
+                "parameters": {"type": "object", "description": "Параметры операции (URL репозитория, ветка, сообщение и т.д.)"},
+                "steps": {"type": "array", "items": {"type": "string"}, "description": "Шаги, которые нужно выполнить"}
+            },
+            "required": ["operation_type", "parameters", "steps"]
+        }
+    },
+    {
+        "name": "answer_general",
+        "description": "Ответ на общий вопрос о разработке ПО.",
+        "input_schema": {"type": "object", "properties": _RESPONSE_PROPERTY, "required": ["response"]}
+    }
+]
+
+# Соответствие инструментов типам запросов
+_TOOL_REQUEST_TYPES = {
+    "analyze_code": "code_analysis",
+    "generate_code": "code_generation",
+    "fix_error": "error_fixing",
+    "git_operation": "git_operation",
+    "answer_general": "general_question"
+}
+
+# Статические инструкции для общих вопросов
+GENERAL_QUESTION_PROMPT = """Пожалуйста, предоставь информативный и полезный ответ, относящийся к разработке ПО.
+Если вопрос связан с конкретным проектом, учти предоставленный контекст."""
+
 class DevAgent:
     """
     Основной класс AI-агента разработчика, который координирует все взаимодействия
@@ -23,21 +152,69 @@ class DevAgent:
     
     def __init__(self):
         """Инициализация агента и его компонентов."""
+        # Клиент Claude нужен на любом пути обработки, остальные компоненты создаются лениво
         self.claude_api = ClaudeAPI()
-        self.code_analyzer = CodeAnalyzer()
-        self.dependency_analyzer = DependencyAnalyzer()
-        self.code_generator = CodeGenerator()
-        self.task_executor = TaskExecutor()
-        
-        # Загрузка шаблонов промптов
-        self.prompts = {
-            "code_analysis": load_prompt("code_analysis.txt"),
-            "code_generation": load_prompt("code_generation.txt"),
-            "error_fixing": load_prompt("error_fixing.txt")
+        
+        # Загрузка шаблонов промптов: каждый делится на статический префикс
+        # (системный промпт), контекст проекта и запрос пользователя.
+        # Префикс и контекст кэшируются отдельными точками останова.
+        # Шаблоны разбираются один раз при запуске, а не на каждый запрос.
+        self.prompts = {}
+        for name, dynamic_fields in (
+            ("code_analysis", ("user_message",)),
+            ("code_generation", ("user_message",)),
+            ("error_fixing", ("error_context", "user_message"))
+        ):
+            static_prefix, context_part, request_part = split_prompt_template(
+                load_prompt(f"{name}.txt"), dynamic_fields
+            )
+            self.prompts[name] = (static_prefix, Template(context_part), Template(request_part))
+        
+        # Кэш классификации Claude: хэш сообщения -> тип запроса
+        self._classify_cache = None
+        if settings.CLASSIFY_CACHE_ENABLED:
+            self._classify_cache = TTLCache(maxsize=settings.CLASSIFY_CACHE_SIZE, ttl=settings.CLASSIFY_CACHE_TTL)
+        
+        # История бесед: user_id -> сообщения (только дополняется, см. _remember_turn)
+        self.history: TTLCache = TTLCache(
+            maxsize=settings.CONVERSATION_HISTORY_USERS, ttl=settings.CONVERSATION_HISTORY_TTL
+        )
+        
+        # Обработчики, которым достаточно одного запроса к Claude: их ответ
+        # можно передавать потоком
+        self._stream_request_builders = {
+            "code_analysis": self._build_code_analysis_request,
+            "error_fixing": self._build_error_fixing_request,
+            "general_question": self._build_general_question_request
         }
         
         logger.info("DevAgent инициализирован")
     
+    @cached_property
+    def code_analyzer(self) -> CodeAnalyzer:
+        """Анализатор кода, создается при первом обращении."""
+        return CodeAnalyzer()
+    
+    @cached_property
+    def dependency_analyzer(self) -> DependencyAnalyzer:
+        """Анализатор зависимостей, создается при первом обращении."""
+        return DependencyAnalyzer()
+    
+    @cached_property
+    def code_generator(self) -> CodeGenerator:
+        """Генератор кода, создается при первом обращении."""
+        return CodeGenerator()
+    
+    @cached_property
+    def task_executor(self) -> TaskExecutor:
+        """
+        Исполнитель фоновых задач, создается при первом обращении.
+        
+        TaskExecutor запускает обработчик очереди через asyncio.create_task,
+        поэтому его нужно создавать внутри работающего event loop.
+        """
+        return TaskExecutor()
+    
     async def process_message(self, user_id: str, message: str, 
                              project_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -53,195 +230,429 @@ class DevAgent:
         """
         logger.info(f"Обработка сообщения для пользователя {user_id}")
         
-        # Определяем тип запроса
-        request_type = await self._classify_request(message, project_context)
+        # Если тип запроса известен без Claude, сразу вызываем специализированный обработчик
+        request_type = self._known_request_type(message)
+        if request_type:
+            return await self._dispatch(request_type, message, project_context, user_id)
         
-        # В зависимости от типа запроса выбираем стратегию обработки
-        response = {}
+        # Иначе классификация и ответ выполняются одним вызовом Claude с инструментами
+        return await self._process_with_tools(user_id, message, project_context)
+    
+    async def process_message_stream(self, user_id: str, message: str,
+                                     project_context: Optional[Dict[str, Any]] = None
+                                     ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Обрабатывает сообщение, передавая ответ Claude по частям по мере генерации.
+        
+        Тип запроса определяется так же, как в process_message. Запросы с одним
+        обращением к Claude (анализ кода, исправление ошибок, общие вопросы)
+        стримятся событиями delta. Остальные обработчики и запросы, классифицируемые вызовом Claude
+        с инструментами, возвращают ответ целиком.
         
+        Args:
+            user_id: Идентификатор пользователя
+            message: Текст сообщения от пользователя
+            project_context: Дополнительный контекст проекта (репозиторий, файлы и т.д.)
+            
+        Yields:
+            Dict с событием: {"event": "delta", "text": ...} для фрагментов ответа
+            и {"event": "done", "response": ...} с итоговым ответом и метаданными
+        """
+        logger.info(f"Потоковая обработка сообщения для пользователя {user_id}")
+        
+        # Классификация та же, что в process_message: сначала локально, иначе вызов Claude с инструментами
+        request_type = self._known_request_type(message)
+        if not request_type:
+            yield {"event": "done", "response": await self._process_with_tools(user_id, message, project_context)}
+            return
+        
+        builder = self._stream_request_builders.get(request_type)
+        if not builder:
+            yield {"event": "done", "response": await self._dispatch(request_type, message, project_context, user_id)}
+            return
+        
+        chunks = []
+        async for text in self.claude_api.stream_request(
+            **builder(message, project_context), history=self.history.get(user_id)
+        ):
+            chunks.append(text)
+            yield {"event": "delta", "text": text}
+        
+        response_text = "".join(chunks)
+        self._remember_turn(user_id, message, response_text)
+        
+        yield {
+            "event": "done",
+            "response": self._text_response(request_type, response_text, project_context)
+        }
+    
+    async def _dispatch(self, request_type: str, message: str,
+                        project_context: Optional[Dict[str, Any]] = None,
+                        user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Вызывает обработчик, соответствующий типу запроса.
+        
+        Args:
+            request_type: Тип запроса
+            message: Текст сообщения от пользователя
+            project_context: Дополнительный контекст проекта
+            user_id: Идентификатор пользователя (для истории беседы)
+            
+        Returns:
+            Dict с ответом и метаданными
+        """
+        # В зависимости от типа запроса выбираем стратегию обработки
         if request_type == "code_analysis":
-            response = await self._handle_code_analysis(message, project_context)
+            return await self._handle_code_analysis(message, project_context, user_id)
         elif request_type == "code_generation":
-            response = await self._handle_code_generation(message, project_context)
+            return await self._handle_code_generation(message, project_context, user_id)
         elif request_type == "error_fixing":
-            response = await self._handle_error_fixing(message, project_context)
+            return await self._handle_error_fixing(message, project_context, user_id)
         elif request_type == "git_operation":
-            response = await self._handle_git_operation(message, project_context)
-        elif request_type == "general_question":
-            response = await self._handle_general_question(message, project_context)
-        else:
-            # Если не удалось определить тип запроса, обрабатываем как общий вопрос
-            response = await self._handle_general_question(message, project_context)
+            return await self._handle_git_operation(message, project_context, user_id)
         
-        return response
+        # Общие вопросы и нераспознанные запросы обрабатываем как общий вопрос
+        return await self._handle_general_question(message, project_context, user_id)
     
-    async def _classify_request(self, message: str, 
-                               context: Optional[Dict[str, Any]] = None) -> str:
+    def _known_request_type(self, message: str) -> Optional[str]:
         """
-        Классифицирует тип запроса пользователя для определения дальнейших действий.
+        Определяет тип запроса без обращения к Claude.
         
         Args:
             message: Текст сообщения от пользователя
-            context: Дополнительный контекст
             
         Returns:
-            Строка с типом запроса: code_analysis, code_generation, error_fixing, git_operation, general_question
+            Тип запроса или None, если его нужно определять с помощью Claude
         """
-        # Формируем промпт для классификации запроса
-        prompt = f"""
-        Я разрабатываю систему для анализа запросов пользователей. Пожалуйста, определи тип следующего запроса,
-        выбрав ТОЛЬКО ОДНУ категорию из списка:
-
-        1. code_analysis - запрос на анализ кода, архитектуры, объяснение как что-то работает
-        2. code_generation - запрос на генерацию нового кода или модификацию существующего
-        3. error_fixing - запрос на исправление ошибки или отладку проблемы
-        4. git_operation - запрос на операции с git (clone, commit, push и т.д.)
-        5. general_question - общий вопрос, не относящийся к указанным категориям
+        # Очевидные запросы классифицируем локально
+        request_type = self._fast_classify(message)
+        if request_type:
+            logger.info(f"Запрос классифицирован локально: {request_type}")
+            return request_type
+        
+        # Повторные сообщения (ретраи, перезапуски CI) не классифицируем заново.
+        # Контекст на классификацию не влияет, поэтому ключ - только текст сообщения.
+        if self._classify_cache is not None:
+            request_type = self._classify_cache.get(prompt_hash(message))
+            if request_type:
+                logger.info(f"Тип запроса найден в кэше: {request_type}")
+                return request_type
         
-        Запрос пользователя: "{message}"
+        return None
+    
+    def _remember_request_type(self, message: str, request_type: str):
+        """
+        Сохраняет тип запроса, определенный Claude, в кэш классификации.
         
-        Ответ (только название категории):
+        Args:
+            message: Текст сообщения от пользователя
+            request_type: Тип запроса
         """
+        if self._classify_cache is not None:
+            self._classify_cache[prompt_hash(message)] = request_type
+    
+    @staticmethod
+    def _fast_classify(message: str) -> Optional[str]:
+        """
+        Классифицирует запрос по ключевым словам.
         
-        # Вызываем Claude API для классификации
-        result = await self.claude_api.send_request(prompt, max_tokens=100)
+        Args:
+            message: Текст сообщения от пользователя
+            
+        Returns:
+            Тип запроса или None, если ключевых слов нет либо они указывают
+            на разные категории (тогда решение принимает Claude)
+        """
+        request_types = {match.lastgroup for match in _REQUEST_TYPE_RE.finditer(message)}
+        if len(request_types) != 1:
+            return None
         
-        # Обрабатываем ответ для получения чистой категории
-        result = result.strip().lower()
+        request_type = request_types.pop()
         
-        # Извлекаем тип запроса из ответа
-        for request_type in ["code_analysis", "code_generation", "error_fixing", "git_operation", "general_question"]:
-            if request_type in result:
-                return request_type
+        # Вопрос о git ("что такое git rebase?") не должен запускать операцию с репозиторием
+        if request_type == "git_operation" and _QUESTION_RE.search(message):
+            return None
+        return request_type
+    
+    async def _process_with_tools(self, user_id: str, message: str,
+                                  context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Классифицирует запрос и формирует ответ одним вызовом Claude.
+        
+        Модель выбирает один из инструментов AGENT_TOOLS (по одному на тип запроса)
+        и передает в него готовый ответ, поэтому обработчикам остается только
+        оформить результат и при необходимости поставить фоновую задачу.
+        
+        Args:
+            user_id: Идентификатор пользователя
+            message: Текст сообщения от пользователя
+            context: Дополнительный контекст проекта
+            
+        Returns:
+            Dict с ответом и метаданными
+        """
+        result = await self.claude_api.send_request_with_tools(
+            **self._build_tool_request(message, context),
+            tools=AGENT_TOOLS,
+            history=self.history.get(user_id)
+        )
+        
+        # Если инструмент не выбран, текст ответа считаем ответом на общий вопрос
+        request_type = _TOOL_REQUEST_TYPES.get(result["tool_name"], "general_question")
+        tool_input = result["tool_input"]
+        logger.info(f"Запрос обработан с инструментом {result['tool_name']}: {request_type}")
+        
+        if result["tool_name"]:
+            self._remember_request_type(message, request_type)
         
-        # По умолчанию считаем запрос общим вопросом
-        return "general_question"
+        # Git-операции, как и в _handle_git_operation, в историю беседы не попадают
+        if request_type == "git_operation":
+            return await self._start_git_operation(message, tool_input, context)
+        
+        response_text = tool_input.get("response") or result["text"]
+        self._remember_turn(user_id, message, response_text)
+        
+        if request_type == "code_generation":
+            task = None
+            if self._needs_background_generation(message, context):
+                task = await self._start_code_generation_task(
+                    message, context, self._build_code_generation_request(message, context)
+                )
+            return self._code_generation_response(response_text, task)
+        
+        return self._text_response(request_type, response_text, context)
+    
+    def _build_tool_request(self, message: str,
+                            context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Формирует параметры запроса к Claude с выбором инструмента."""
+        # Контекст проекта и файлов - кэшируемый блок, ошибка и запрос - последними
+        project_context = self._format_project_context(context)
+        code_context = self._format_code_context(message, context) if context and "files" in context else ""
+        context_text = f"## Контекст проекта\n{project_context}\n\n## Код проекта\n{code_context}"
+        
+        request_text = f"## Запрос пользователя\n{message}"
+        if context and context.get("error"):
+            request_text = f"## Сообщение об ошибке или проблеме\n{context['error']}\n\n" + request_text
+        
+        return {
+            "prompt": build_cached_content(context_text, request_text),
+            "system_prompt": TOOL_ROUTING_PROMPT,
+            "cache_system_prompt": True
+        }
     
     async def _handle_code_analysis(self, message: str, 
-                                   context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                   context: Optional[Dict[str, Any]] = None,
+                                   user_id: Optional[str] = None) -> Dict[str, Any]:
         """Обрабатывает запрос на анализ кода."""
         logger.info("Обработка запроса на анализ кода")
         
+        # Получаем ответ от Claude API
+        response_text = await self._send_with_history(
+            user_id, message, **self._build_code_analysis_request(message, context)
+        )
+        
+        # В случае анализа кода обычно возвращаем синхронный ответ
+        return self._text_response("code_analysis", response_text, context)
+    
+    def _build_code_analysis_request(self, message: str,
+                                     context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Формирует параметры запроса к Claude для анализа кода."""
         # Получаем контекст кода из проекта, если предоставлен
         code_context = ""
         if context and "files" in context:
-            code_context = format_file_context(context["files"])
+            code_context = self._format_code_context(message, context)
         
         # Формируем промпт для анализа кода
-        prompt = self.prompts["code_analysis"].format(
-            user_message=message,
-            code_context=code_context
+        static_prefix, context_template, request_template = self.prompts["code_analysis"]
+        prompt = build_cached_content(
+            context_template.safe_substitute(
+                project_context=self._format_project_context(context),
+                code_context=code_context
+            ),
+            request_template.safe_substitute(user_message=message)
         )
         
-        # Получаем ответ от Claude API
-        response_text = await self.claude_api.send_request(prompt)
-        
-        # В случае анализа кода обычно возвращаем синхронный ответ
-        return {
-            "message": response_text,
-            "meta": {
-                "type": "code_analysis",
-                "analyzed_files": context.get("files", []) if context else []
-            }
-        }
+        return {"prompt": prompt, "system_prompt": static_prefix, "cache_system_prompt": True}
     
     async def _handle_code_generation(self, message: str, 
-                                     context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                     context: Optional[Dict[str, Any]] = None,
+                                     user_id: Optional[str] = None) -> Dict[str, Any]:
         """Обрабатывает запрос на генерацию кода."""
         logger.info("Обработка запроса на генерацию кода")
         
-        # Для генерации кода может потребоваться создание фоновой задачи
-        task_id = str(uuid.uuid4())
+        request = self._build_code_generation_request(message, context)
+        
+        # Для быстрого ответа генерируем предварительный ответ
+        preliminary_request = self._send_with_history(user_id, message, max_tokens=1000, **request)
+        
+        # Для простых запросов возвращаем результат сразу
+        if not self._needs_background_generation(message, context):
+            return self._code_generation_response(await preliminary_request)
+        
+        # Предварительный ответ и постановка фоновой задачи в очередь не зависят друг от друга:
+        # выполняем их одновременно, чтобы фоновая генерация не ждала предварительного ответа.
+        # execute только ставит задачу в очередь и не ждет ее завершения.
+        preliminary_response, task = await asyncio.gather(
+            preliminary_request,
+            self._start_code_generation_task(message, context, request)
+        )
         
+        return self._code_generation_response(preliminary_response, task)
+    
+    def _build_code_generation_request(self, message: str,
+                                       context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Формирует параметры запроса к Claude для генерации кода."""
         # Получаем контекст кода
         code_context = ""
         if context and "files" in context:
-            code_context = format_file_context(context["files"])
+            code_context = self._format_code_context(message, context)
         
         # Формируем промпт для генерации кода
-        prompt = self.prompts["code_generation"].format(
-            user_message=message,
-            code_context=code_context
+        static_prefix, context_template, request_template = self.prompts["code_generation"]
+        prompt = build_cached_content(
+            context_template.safe_substitute(
+                project_context=self._format_project_context(context),
+                code_context=code_context
+            ),
+            request_template.safe_substitute(user_message=message)
         )
         
-        # Для быстрого ответа генерируем предварительный ответ
-        preliminary_response = await self.claude_api.send_request(
-            prompt, max_tokens=1000
+        return {"prompt": prompt, "system_prompt": static_prefix, "cache_system_prompt": True}
+    
+    @staticmethod
+    def _needs_background_generation(message: str, context: Optional[Dict[str, Any]] = None) -> bool:
+        """Проверяет, требует ли генерация большого объема кода фоновой задачи."""
+        return len(message.split()) > 20 or bool(context and len(context.get("files", [])) > 2)
+    
+    async def _start_code_generation_task(self, message: str, context: Optional[Dict[str, Any]],
+                                          request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ставит в очередь фоновую задачу полной генерации кода.
+        
+        Args:
+            message: Текст сообщения от пользователя
+            context: Дополнительный контекст проекта
+            request: Параметры запроса к Claude для генерации кода
+            
+        Returns:
+            Dict с информацией о задаче для ответа пользователю
+        """
+        task_id = str(uuid.uuid4())
+        
+        await self.task_executor.execute(
+            task_id=task_id,
+            task_type="code_generation",
+            prompt=request["prompt"],
+            system_prompt=request["system_prompt"],
+            context=context
         )
         
-        # Создаем задачу для полной генерации в фоне, если требуется большой объем кода
-        task = {
+        return {
             "id": task_id,
             "type": "code_generation",
             "status": "pending",
             "progress": 0,
             "description": f"Генерация кода для запроса: {message[:50]}..."
         }
-        
-        # Запускаем задачу в фоновом режиме, если генерация сложная
-        if len(message.split()) > 20 or (context and len(context.get("files", [])) > 2):
-            await self.task_executor.execute(
-                task_id=task_id,
-                task_type="code_generation",
-                prompt=prompt,
-                context=context
-            )
-            
-            return {
-                "message": f"Я начал генерировать код для вашего запроса. " + 
-                          f"Вот предварительный результат:\n\n{preliminary_response}",
-                "meta": {
-                    "type": "code_generation"
-                },
-                "task": task
-            }
-        else:
-            # Для простых запросов возвращаем результат сразу
+    
+    @staticmethod
+    def _code_generation_response(preliminary_response: str,
+                                  task: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Формирует ответ на запрос генерации кода (с фоновой задачей или без)."""
+        if task is None:
             return {
                 "message": preliminary_response,
                 "meta": {
                     "type": "code_generation"
                 }
             }
+        
+        return {
+            "message": f"Я начал генерировать код для вашего запроса. " + 
+                      f"Вот предварительный результат:\n\n{preliminary_response}",
+            "meta": {
+                "type": "code_generation"
+            },
+            "task": task
+        }
     
     async def _handle_error_fixing(self, message: str, 
-                                  context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                  context: Optional[Dict[str, Any]] = None,
+                                  user_id: Optional[str] = None) -> Dict[str, Any]:
         """Обрабатывает запрос на исправление ошибок."""
         logger.info("Обработка запроса на исправление ошибок")
         
+        # Получаем ответ от Claude API
+        response_text = await self._send_with_history(
+            user_id, message, **self._build_error_fixing_request(message, context)
+        )
+        
+        return self._text_response("error_fixing", response_text, context)
+    
+    def _build_error_fixing_request(self, message: str,
+                                    context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Формирует параметры запроса к Claude для исправления ошибок."""
         # Получаем контекст кода и ошибки
         code_context = ""
         error_context = ""
         
         if context:
             if "files" in context:
-                code_context = format_file_context(context["files"])
+                code_context = self._format_code_context(message, context)
             if "error" in context:
                 error_context = context["error"]
         
         # Формируем промпт для исправления ошибок
-        prompt = self.prompts["error_fixing"].format(
-            user_message=message,
-            code_context=code_context,
-            error_context=error_context
+        static_prefix, context_template, request_template = self.prompts["error_fixing"]
+        prompt = build_cached_content(
+            context_template.safe_substitute(
+                project_context=self._format_project_context(context),
+                code_context=code_context
+            ),
+            request_template.safe_substitute(
+                user_message=message,
+                error_context=error_context
+            )
         )
         
-        # Получаем ответ от Claude API
-        response_text = await self.claude_api.send_request(prompt)
-        
-        return {
-            "message": response_text,
-            "meta": {
-                "type": "error_fixing",
-                "analyzed_files": context.get("files", []) if context else []
-            }
-        }
+        return {"prompt": prompt, "system_prompt": static_prefix, "cache_system_prompt": True}
     
     async def _handle_git_operation(self, message: str, 
-                                   context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                   context: Optional[Dict[str, Any]] = None,
+                                   user_id: Optional[str] = None) -> Dict[str, Any]:
         """Обрабатывает запрос на операции с Git."""
         logger.info("Обработка запроса на операции с Git")
         
+        # Формируем промпт для Claude, чтобы понять, что именно нужно сделать
+        prompt = f'Запрос пользователя: "{message}"'
+        
+        # Получаем план действий от Claude API
+        operation_plan_text = await self.claude_api.send_request(
+            prompt, max_tokens=1000, system_prompt=GIT_OPERATION_PROMPT, cache_system_prompt=True
+        )
+        
+        try:
+            # Извлекаем JSON из ответа
+            operation_plan = self._extract_json(operation_plan_text)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке Git-операции: {str(e)}")
+            return self._git_operation_error(e)
+        
+        return await self._start_git_operation(message, operation_plan, context)
+    
+    async def _start_git_operation(self, message: str, operation_plan: Dict[str, Any],
+                                   context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Запускает фоновую задачу выполнения Git-операции по плану.
+        
+        Args:
+            message: Текст сообщения от пользователя
+            operation_plan: План операции (operation_type, parameters, steps)
+            context: Дополнительный контекст проекта
+            
+        Returns:
+            Dict с ответом и информацией о задаче
+        """
         # Создаем задачу для выполнения Git-операций
         task_id = str(uuid.uuid4())
         
@@ -253,36 +664,7 @@ class DevAgent:
             "description": f"Git-операция: {message[:50]}..."
         }
         
-        # Формируем промпт для Claude, чтобы понять, что именно нужно сделать
-        prompt = f"""
-        Пользователь запрашивает операцию с Git: "{message}"
-        
-        Проанализируй запрос и определи:
-        1. Какой тип операции требуется (clone, commit, push, pull, branch и т.д.)
-        2. Какие параметры необходимы для выполнения (URL репозитория, ветка, сообщение и т.д.)
-        3. Шаги, которые нужно выполнить
-        
-        Представь результат в JSON формате:
-        {{
-            "operation_type": "тип операции",
-            "parameters": {{
-                "param1": "value1",
-                "param2": "value2"
-            }},
-            "steps": [
-                "шаг 1",
-                "шаг 2"
-            ]
-        }}
-        """
-        
-        # Получаем план действий от Claude API
-        operation_plan_text = await self.claude_api.send_request(prompt, max_tokens=1000)
-        
         try:
-            # Извлекаем JSON из ответа
-            operation_plan = self._extract_json(operation_plan_text)
-            
             # Запускаем задачу для выполнения Git-операций
             await self.task_executor.execute(
                 task_id=task_id,
@@ -303,47 +685,153 @@ class DevAgent:
             }
         except Exception as e:
             logger.error(f"Ошибка при обработке Git-операции: {str(e)}")
-            return {
-                "message": f"Произошла ошибка при анализе вашего запроса на Git-операцию. " +
-                          f"Пожалуйста, уточните, что именно вы хотите сделать с репозиторием.",
-                "meta": {
-                    "type": "git_operation",
-                    "error": str(e)
-                }
+            return self._git_operation_error(e)
+    
+    @staticmethod
+    def _git_operation_error(error: Exception) -> Dict[str, Any]:
+        """Формирует ответ пользователю при ошибке разбора или запуска Git-операции."""
+        return {
+            "message": f"Произошла ошибка при анализе вашего запроса на Git-операцию. " +
+                      f"Пожалуйста, уточните, что именно вы хотите сделать с репозиторием.",
+            "meta": {
+                "type": "git_operation",
+                "error": str(error)
             }
+        }
     
     async def _handle_general_question(self, message: str, 
-                                      context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                      context: Optional[Dict[str, Any]] = None,
+                                      user_id: Optional[str] = None) -> Dict[str, Any]:
         """Обрабатывает общие вопросы."""
         logger.info("Обработка общего вопроса")
         
-        # Формируем промпт с контекстом проекта, если он есть
-        project_context = ""
-        if context and "project" in context:
-            project_context = f"Контекст проекта: {json.dumps(context['project'])}\n\n"
-        
-        prompt = f"""
-        {project_context}
+        # Получаем ответ от Claude API
+        response_text = await self._send_with_history(
+            user_id, message, **self._build_general_question_request(message, context)
+        )
         
-        Пользователь спрашивает: {message}
+        return self._text_response("general_question", response_text, context)
+    
+    def _build_general_question_request(self, message: str,
+                                        context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Формирует параметры запроса к Claude для общего вопроса."""
+        # Инструкции идут первыми (системный промпт), за ними контекст проекта
+        # со своей точкой кэширования, вопрос пользователя - последним
+        question = f"Пользователь спрашивает: {message}"
+        project_context = self._format_project_context(context)
+        if project_context:
+            prompt = build_cached_content(f"Контекст проекта: {project_context}", question)
+        else:
+            prompt = question
         
-        Пожалуйста, предоставь информативный и полезный ответ, относящийся к разработке ПО.
-        Если вопрос связан с конкретным проектом, учти предоставленный контекст.
+        return {"prompt": prompt, "system_prompt": GENERAL_QUESTION_PROMPT, "cache_system_prompt": True}
+    
+    @staticmethod
+    def _text_response(request_type: str, response_text: str,
+                       context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
+        Формирует ответ пользователю для обработчиков с одним запросом к Claude.
         
-        # Получаем ответ от Claude API
-        response_text = await self.claude_api.send_request(prompt)
+        Args:
+            request_type: Тип запроса
+            response_text: Текст ответа Claude
+            context: Контекст запроса
+            
+        Returns:
+            Dict с ответом и метаданными
+        """
+        meta = {"type": request_type}
+        if request_type != "general_question":
+            meta["analyzed_files"] = context.get("files", []) if context else []
         
         return {
             "message": response_text,
-            "meta": {
-                "type": "general_question"
-            }
+            "meta": meta
         }
     
+    async def _send_with_history(self, user_id: Optional[str], message: str, **request) -> str:
+        """
+        Отправляет запрос к Claude с историей беседы пользователя и сохраняет новый ход.
+        
+        Args:
+            user_id: Идентификатор пользователя (без него история не используется)
+            message: Текст сообщения от пользователя, сохраняемый в историю
+            **request: Параметры ClaudeAPI.send_request
+            
+        Returns:
+            str: Ответ от API Claude
+        """
+        response_text = await self.claude_api.send_request(**request, history=self.history.get(user_id))
+        self._remember_turn(user_id, message, response_text)
+        return response_text
+    
+    def _remember_turn(self, user_id: Optional[str], message: str, response_text: str):
+        """
+        Добавляет ход беседы в историю пользователя.
+        
+        История только дополняется, поэтому префикс [system, ход 1, ..., ход N]
+        остается неизменным между ходами и обслуживается из кэша Anthropic.
+        При переполнении удаляется середина истории: первый ход сохраняется,
+        а старые ходы отбрасываются пачкой, чтобы префикс сбрасывался редко.
+        
+        Args:
+            user_id: Идентификатор пользователя
+            message: Текст сообщения от пользователя
+            response_text: Ответ Claude
+        """
+        if not user_id:
+            return
+        
+        history = self.history.get(user_id, [])
+        history.append({"role": "user", "content": message})
+        history.append({"role": "assistant", "content": response_text})
+        
+        max_messages = settings.CONVERSATION_HISTORY_MAX_MESSAGES
+        if len(history) > max_messages:
+            # Оставляем первый ход и последние ходы (четное число сообщений: пары user/assistant)
+            tail = max_messages // 4 * 2
+            history = history[:2] + history[-tail:]
+        
+        self.history[user_id] = history
+    
+    @staticmethod
+    def _format_code_context(message: str, context: Dict[str, Any]) -> str:
+        """
+        Форматирует файлы проекта, ограничивая их объем MAX_CODE_CONTEXT_TOKENS.
+        
+        Args:
+            message: Текст сообщения от пользователя (для оценки релевантности файлов)
+            context: Контекст запроса с файлами и опциональным списком focus_files
+            
+        Returns:
+            str: Отформатированный контекст файлов
+        """
+        files = select_files_within_budget(
+            context["files"], message, settings.MAX_CODE_CONTEXT_TOKENS, context.get("focus_files")
+        )
+        return format_file_context(files)
+    
+    @staticmethod
+    def _format_project_context(context: Optional[Dict[str, Any]]) -> str:
+        """
+        Сериализует информацию о проекте для вставки в промпт.
+        
+        Ключи сортируются, чтобы текст был побайтово стабильным между
+        запросами и попадал в кэш префиксов.
+        
+        Args:
+            context: Контекст запроса
+            
+        Returns:
+            str: JSON с информацией о проекте или пустая строка
+        """
+        if not context or "project" not in context:
+            return ""
+        return json.dumps(context["project"], ensure_ascii=False, sort_keys=True)
+    
     def _extract_json(self, text: str) -> Dict:
         """
-        Извлекает JSON из текстового ответа, ищет фрагмент в фигурных скобках.
+        Извлекает JSON из текстового ответа, разбирая объект с первой фигурной скобки.
         
         Args:
             text: Текст, содержащий JSON
@@ -354,16 +842,14 @@ class DevAgent:
         Raises:
             ValueError: Если не удалось извлечь валидный JSON
         """
+        start_index = text.find("{")
+        if start_index == -1:
+            raise ValueError("JSON не найден в ответе")
+        
         try:
-            # Ищем JSON в ответе (между фигурными скобками)
-            start_index = text.find("{")
-            end_index = text.rfind("}")
-            
-            if start_index == -1 or end_index == -1:
-                raise ValueError("JSON не найден в ответе")
-            
-            json_str = text[start_index:end_index+1]
-            return json.loads(json_str)
+            # raw_decode разбирает объект за один проход и не смотрит на текст после него
+            result, _ = _JSON_DECODER.raw_decode(text, start_index)
+            return result
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка декодирования JSON: {str(e)}")
             raise ValueError(f"Не удалось разобрать JSON в ответе: {str(e)}")
\ No newline at end of file
@@ -1,34 +1,93 @@
 # agent-service/app/core/config.py
 
-import os
+from functools import lru_cache
 from pydantic import BaseSettings, validator
 from typing import Optional, List
-from dotenv import load_dotenv
-
-# Загрузка переменных окружения из .env файла
-load_dotenv()
 
 class Settings(BaseSettings):
+    """
+    Настройки сервиса.
+    
+    Значения читаются BaseSettings из переменных окружения и файла .env
+    (переменные окружения имеют приоритет) при создании экземпляра.
+    """
+    
     # Настройки API и сервера
-    PORT: int = int(os.getenv("PORT", "8001"))
-    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: int = 8001
+    HOST: str = "0.0.0.0"
+    # Количество процессов uvicorn. История бесед, кэши и загрузки контекста хранятся
+    # в памяти процесса, поэтому больше одного воркера - только с привязкой
+    # пользователя к воркеру (sticky-маршрутизация) на балансировщике
+    WEB_CONCURRENCY: int = 1
     
     # Настройки Claude API
-    CLAUDE_API_KEY: Optional[str] = os.getenv("CLAUDE_API_KEY")
-    CLAUDE_API_MODEL: str = os.getenv("CLAUDE_API_MODEL", "claude-3-7-sonnet-20250219")
+    CLAUDE_API_KEY: Optional[str] = None
+    CLAUDE_API_MODEL: str = "claude-3-7-sonnet-20250219"
+    CLAUDE_MAX_CONCURRENCY: int = 8
+    CLAUDE_MAX_RETRIES: int = 3
+    CLAUDE_MAX_TOKENS_CAP: int = 16000
+    CLAUDE_HISTORY_TURNS: int = 10
+    CLAUDE_HISTORY_MAX_TOKENS: int = 30000
+    CLAUDE_HISTORY_SUMMARY_LINES: int = 20
+    CLAUDE_USER_DAILY_TOKENS: int = 0
+    
+    # Настройки точного кэша ответов Claude API (общий для всех вызовов send_request)
+    CLAUDE_CACHE_ENABLED: bool = True
+    CLAUDE_CACHE_SIZE: int = 1024
+    CLAUDE_CACHE_TTL: int = 3600
     
     # URL других сервисов
-    API_SERVICE_URL: str = os.getenv("API_SERVICE_URL", "http://localhost:8000")
-    GIT_SERVICE_URL: str = os.getenv("GIT_SERVICE_URL", "http://localhost:8004")
+    API_SERVICE_URL: str = "http://localhost:8000"
+    GIT_SERVICE_URL: str = "http://localhost:8004"
+    
+    # HTTP/2 для запросов к внутренним сервисам (согласуется через TLS ALPN)
+    INTERNAL_HTTP2: bool = True
+    
+    # Настройки объединения запросов файлов к Git Service
+    GIT_FILE_BATCH_SIZE: int = 32
+    GIT_FILE_BATCH_WINDOW: float = 0.01
+    GIT_FETCH_CONCURRENCY: int = 16
+    
+    # Настройки кэша чтений Git Service (сбрасывается при изменении репозитория)
+    GIT_READ_CACHE_SIZE: int = 4096
+    GIT_READ_CACHE_TTL: int = 300
     
     # Redis настройки
-    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_URL: str = "redis://localhost:6379/0"
     
     # Директории промптов и ресурсов
-    PROMPTS_DIR: str = os.getenv("PROMPTS_DIR", "prompts")
+    PROMPTS_DIR: str = "prompts"
+    
+    # Настройки истории бесед агента
+    CONVERSATION_HISTORY_MAX_MESSAGES: int = 20
+    CONVERSATION_HISTORY_USERS: int = 1024
+    CONVERSATION_HISTORY_TTL: int = 3600
+    
+    # Максимальный объем контекста файлов в промпте (в токенах)
+    MAX_CODE_CONTEXT_TOKENS: int = 40000
     
     # Настройки логирования
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVEL: str = "INFO"
+    
+    # Настройки точного кэша результатов анализа кода (CodeAnalyzer, включая потоковый анализ)
+    EXACT_CACHE_SIZE: int = 1024
+    EXACT_CACHE_TTL: int = 3600
+    
+    # Настройки кэша классификации запросов
+    CLASSIFY_CACHE_ENABLED: bool = True
+    CLASSIFY_CACHE_SIZE: int = 10000
+    CLASSIFY_CACHE_TTL: int = 3600
+    
+    # Директория файлового кэша контекстов проектов
+    CONTEXT_CACHE_DIR: str = "cache/contexts"
+    
+    # Настройки кэша контекстов проектов в памяти
+    CONTEXT_CACHE_SIZE: int = 1024
+    CONTEXT_CACHE_TTL: int = 300
+    
+    # Настройки кэша анализа репозиториев (инвалидируется при смене HEAD)
+    REPO_CACHE_SIZE: int = 128
+    REPO_CACHE_TTL: int = 86400
     
     # Валидация обязательных полей
     @validator("CLAUDE_API_KEY", pre=True)
@@ -41,5 +100,15 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
 
-# Создаем экземпляр настроек
-settings = Settings()
\ No newline at end of file
+@lru_cache()
+def get_settings() -> Settings:
+    """
+    Возвращает единственный экземпляр настроек (зависимость FastAPI).
+    
+    Returns:
+        Settings: Настройки сервиса
+    """
+    return Settings()
+
+# Экземпляр настроек для импорта модулями сервиса
+settings = get_settings()
\ No newline at end of file
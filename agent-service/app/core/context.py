@@ -1,15 +1,38 @@
 # agent-service/app/core/context.py
 
 import logging
+import asyncio
 from typing import Dict, List, Any, Optional, Set
-import json
-import os
+import orjson
+from cachetools import TTLCache
 from pathlib import Path
-import httpx
 from app.core.config import settings
+from app.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+def _load_context_file(cache_file: Path) -> Dict[str, Any]:
+    """
+    Читает и разбирает файл контекста (выполняется в отдельном потоке).
+    
+    Args:
+        cache_file: Путь к файлу контекста
+        
+    Returns:
+        Dict с контекстом проекта
+    """
+    return orjson.loads(cache_file.read_bytes())
+
+def _dump_context_file(cache_file: Path, context: Dict[str, Any]):
+    """
+    Сериализует и записывает контекст в файл (выполняется в отдельном потоке).
+    
+    Args:
+        cache_file: Путь к файлу контекста
+        context: Контекст проекта
+    """
+    cache_file.write_bytes(orjson.dumps(context))
+
 class ProjectContext:
     """
     Класс для управления контекстом проекта.
@@ -18,11 +41,20 @@ class ProjectContext:
     
     def __init__(self):
         """Инициализация контекста проекта."""
-        self.contexts = {}  # Словарь для хранения контекстов проектов
-        self.context_cache_dir = Path("cache/contexts")
+        # Контексты проектов в памяти: ограниченный размер и время жизни, чтобы
+        # память не росла неограниченно и изменения с других реплик подхватывались.
+        # При вытеснении контекст загружается из файлового кэша.
+        self.contexts = TTLCache(maxsize=settings.CONTEXT_CACHE_SIZE, ttl=settings.CONTEXT_CACHE_TTL)
+        # Путь задается настройкой, чтобы в контейнерах с read-only rootfs
+        # кэш можно было перенести, например, на tmpfs
+        self.context_cache_dir = Path(settings.CONTEXT_CACHE_DIR)
         
         # Создаем директорию для кэширования контекстов, если не существует
-        os.makedirs(self.context_cache_dir, exist_ok=True)
+        self.context_cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Загрузки контекста, выполняющиеся сейчас: project_id -> задача.
+        # Одновременные запросы одного проекта ждут одну загрузку.
+        self._inflight: Dict[str, asyncio.Task] = {}
         
         logger.info("ProjectContext инициализирован")
     
@@ -37,21 +69,57 @@ class ProjectContext:
             Dict с контекстом проекта
         """
         # Проверяем, есть ли контекст в кэше
-        if project_id in self.contexts:
+        context = self.contexts.get(project_id)
+        if context is not None:
             logger.info(f"Контекст проекта {project_id} найден в кэше")
-            return self.contexts[project_id]
+            return context
         
-        # Проверяем, есть ли контекст в файловом кэше
+        # Если контекст этого проекта уже загружается, дожидаемся той же загрузки
+        task = self._inflight.get(project_id)
+        if task is None:
+            task = asyncio.create_task(self._load_project_context(project_id))
+            self._inflight[project_id] = task
+            task.add_done_callback(lambda done: self._forget_inflight(project_id, done))
+        
+        # shield: отмена одного из ожидающих запросов не прерывает общую загрузку
+        return await asyncio.shield(task)
+    
+    def _forget_inflight(self, project_id: str, task: asyncio.Task):
+        """
+        Удаляет завершенную загрузку из списка выполняющихся.
+        
+        Запись удаляется, только если она принадлежит этой задаче,
+        чтобы не затронуть более новую загрузку того же проекта.
+        
+        Args:
+            project_id: Идентификатор проекта
+            task: Завершившаяся задача загрузки
+        """
+        if self._inflight.get(project_id) is task:
+            del self._inflight[project_id]
+    
+    async def _load_project_context(self, project_id: str) -> Dict[str, Any]:
+        """
+        Загружает контекст проекта из файлового кэша или API Service.
+        
+        Args:
+            project_id: Идентификатор проекта
+            
+        Returns:
+            Dict с контекстом проекта
+        """
+        # Проверяем, есть ли контекст в файловом кэше.
+        # Чтение и разбор файла выполняются вне event loop, чтобы не блокировать другие запросы.
         cache_file = self.context_cache_dir / f"{project_id}.json"
-        if cache_file.exists():
-            try:
-                with open(cache_file, "r", encoding="utf-8") as f:
-                    context = json.load(f)
-                    self.contexts[project_id] = context
-                    logger.info(f"Контекст проекта {project_id} загружен из файла")
-                    return context
-            except Exception as e:
-                logger.error(f"Ошибка при загрузке контекста из файла: {str(e)}")
+        try:
+            context = await asyncio.to_thread(_load_context_file, cache_file)
+            self.contexts[project_id] = context
+            logger.info(f"Контекст проекта {project_id} загружен из файла")
+            return context
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке контекста из файла: {str(e)}")
         
         # Если контекста нет в кэше, запрашиваем его из API Service
         try:
@@ -61,8 +129,7 @@ class ProjectContext:
             self.contexts[project_id] = context
             
             # Сохраняем контекст в файл
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(context, f)
+            await asyncio.to_thread(_dump_context_file, cache_file, context)
             
             logger.info(f"Контекст проекта {project_id} получен из API и сохранен в кэш")
             return context
@@ -93,8 +160,7 @@ class ProjectContext:
         
         # Сохраняем контекст в файл
         cache_file = self.context_cache_dir / f"{project_id}.json"
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump(context, f)
+        await asyncio.to_thread(_dump_context_file, cache_file, context)
         
         logger.info(f"Контекст проекта {project_id} обновлен")
         return context
@@ -110,19 +176,18 @@ class ProjectContext:
             bool: True, если контекст успешно очищен
         """
         # Удаляем контекст из кэша
-        if project_id in self.contexts:
-            del self.contexts[project_id]
+        self.contexts.pop(project_id, None)
         
         # Удаляем файл контекста
         cache_file = self.context_cache_dir / f"{project_id}.json"
-        if cache_file.exists():
-            try:
-                os.remove(cache_file)
-                logger.info(f"Контекст проекта {project_id} очищен")
-                return True
-            except Exception as e:
-                logger.error(f"Ошибка при удалении файла контекста: {str(e)}")
-                return False
+        try:
+            await asyncio.to_thread(cache_file.unlink)
+            logger.info(f"Контекст проекта {project_id} очищен")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка при удалении файла контекста: {str(e)}")
+            return False
         
         return True
     
@@ -136,41 +201,43 @@ class ProjectContext:
         Returns:
             Dict с контекстом проекта
         """
+        # Общий клиент с пулом соединений: без нового TCP/TLS-рукопожатия на каждый запрос
+        client = get_http_client()
+        
         try:
-            async with httpx.AsyncClient() as client:
-                # Получаем информацию о проекте
-                response = await client.get(
-                    f"{settings.API_SERVICE_URL}/projects/{project_id}",
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при получении информации о проекте: {response.text}")
-                    raise ValueError(f"Ошибка получения информации о проекте: {response.status_code}")
-                
-                project_info = response.json()
-                
-                # Если у проекта есть репозиторий, получаем информацию о нем
-                repo_info = {}
-                if project_info.get("repository_url"):
-                    # Если есть Git Service, запрашиваем у него информацию о репозитории
-                    if settings.GIT_SERVICE_URL:
-                        repo_response = await client.get(
-                            f"{settings.GIT_SERVICE_URL}/repos/analyze",
-                            params={"url": project_info["repository_url"]},
-                            timeout=30.0
-                        )
-                        
-                        if repo_response.status_code == 200:
-                            repo_info = repo_response.json()
-                
-                # Формируем контекст проекта
-                context = {
-                    "project": project_info,
-                    "repository": repo_info
-                }
-                
-                return context
+            # Получаем информацию о проекте
+            response = await client.get(
+                f"{settings.API_SERVICE_URL}/projects/{project_id}",
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                logger.error(f"Ошибка при получении информации о проекте: {response.text}")
+                raise ValueError(f"Ошибка получения информации о проекте: {response.status_code}")
+            
+            project_info = response.json()
+            
+            # Если у проекта есть репозиторий, получаем информацию о нем
+            repo_info = {}
+            if project_info.get("repository_url"):
+                # Если есть Git Service, запрашиваем у него информацию о репозитории
+                if settings.GIT_SERVICE_URL:
+                    repo_response = await client.get(
+                        f"{settings.GIT_SERVICE_URL}/repos/analyze",
+                        params={"url": project_info["repository_url"]},
+                        timeout=30.0
+                    )
+                    
+                    if repo_response.status_code == 200:
+                        repo_info = repo_response.json()
+            
+            # Формируем контекст проекта
+            context = {
+                "project": project_info,
+                "repository": repo_info
+            }
+            
+            return context
         
         except Exception as e:
             logger.error(f"Ошибка при запросе к API Service: {str(e)}")
@@ -2,12 +2,257 @@
 
 import logging
 import re
-from typing import Dict, List, Any, Optional, Tuple
-from app.services.claude_api import ClaudeAPI
-from app.utils.prompt_utils import build_system_prompt
+import asyncio
+from typing import Dict, List, Any, Optional, Tuple, Callable
+from app.services.claude_api import ClaudeAPI, ResponseTruncatedError
+from app.core.config import settings
+from app.utils.prompt_utils import build_system_prompt, build_cached_content, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+# Размер ответа (в символах), начиная с которого разбор выполняется в отдельном потоке
+_EXTRACT_IN_THREAD_THRESHOLD = 8192
+
+# Блок файла в ответе Claude:
+# ## Файл: path/to/file.ext
+# ```[language]
+# code
+# ```
+_FILE_RE = re.compile(r"## Файл:\s*(.*?)\n```(?:\w*)\n(.*?)```", re.DOTALL)
+
+# Блок кода с необязательным указанием языка
+_CODE_RE = re.compile(r"```(?:(\w+)\n)?(.*?)```", re.DOTALL)
+
+# Блок кода без захвата языка
+_CODE_NO_LANG_RE = re.compile(r"```(?:\w*)\n(.*?)```", re.DOTALL)
+
+# Начало верхнеуровневой функции или класса (вместе с декораторами) по языку
+_JS_UNIT_RE = re.compile(
+    r"^(?:export\s+(?:default\s+)?)?(?:async\s+)?"
+    r"(?:function\b|class\s|const\s+\w+\s*=\s*(?:async\s*)?(?:\(|function\b))",
+    re.MULTILINE
+)
+_UNIT_START_RE = {
+    "python": re.compile(r"^(?:@.*\n)*(?:async\s+def|def|class)\s", re.MULTILINE),
+    "javascript": _JS_UNIT_RE,
+    "typescript": _JS_UNIT_RE
+}
+
+# Размер кода (в символах), начиная с которого тесты генерируются по частям
+_SPLIT_TESTS_THRESHOLD = 4000
+
+# Фреймворки для тестирования по умолчанию
+_FRAMEWORKS = {
+    "python": "pytest",
+    "javascript": "jest",
+    "typescript": "jest",
+    "java": "JUnit",
+    "csharp": "NUnit",
+    "go": "testing",
+    "ruby": "RSpec",
+    "php": "PHPUnit",
+    "rust": "cargo test",
+    "swift": "XCTest"
+}
+
+# Описания типов рефакторинга для промпта
+_REFACTOR_DESC = {
+    "general": "общем улучшении кода",
+    "performance": "оптимизации производительности",
+    "readability": "улучшении читаемости кода",
+    "maintainability": "улучшении поддерживаемости кода",
+    "security": "улучшении безопасности кода",
+    "modernization": "модернизации кода под современные стандарты",
+    "clean_code": "принципах чистого кода"
+}
+
+# Язык программирования по расширению файла
+_LANG_BY_EXT = {
+    "py": "python",
+    "js": "javascript",
+    "ts": "typescript",
+    "jsx": "jsx",
+    "tsx": "tsx",
+    "html": "html",
+    "css": "css",
+    "java": "java",
+    "c": "c",
+    "cpp": "cpp",
+    "cs": "csharp",
+    "go": "go",
+    "rb": "ruby",
+    "php": "php",
+    "swift": "swift",
+    "kt": "kotlin",
+    "rs": "rust",
+    "sh": "bash",
+    "json": "json",
+    "yml": "yaml",
+    "yaml": "yaml",
+    "xml": "xml",
+    "md": "markdown"
+}
+
+# Расширение файла по языку программирования
+_EXT_BY_LANG = {
+    "python": ".py",
+    "javascript": ".js",
+    "typescript": ".ts",
+    "jsx": ".jsx",
+    "tsx": ".tsx",
+    "html": ".html",
+    "css": ".css",
+    "java": ".java",
+    "c": ".c",
+    "cpp": ".cpp",
+    "csharp": ".cs",
+    "go": ".go",
+    "ruby": ".rb",
+    "php": ".php",
+    "swift": ".swift",
+    "kotlin": ".kt",
+    "rust": ".rs",
+    "bash": ".sh",
+    "json": ".json",
+    "yaml": ".yml",
+    "xml": ".xml",
+    "markdown": ".md"
+}
+
+# Шаблоны динамической части промптов (идут после кэшируемых инструкций)
+_GENERATE_TMPL = "Напиши код на языке {language} для выполнения следующей задачи:\n\n{description}\n\n{context_str}"
+
+_MODIFY_TMPL = (
+    "Модифицируй следующий код на языке {language} в соответствии с инструкциями:\n\n"
+    "## Исходный код:\n```{language}\n{original_code}\n```\n\n"
+    "## Инструкции для модификации:\n{instructions}"
+)
+
+_TESTS_TMPL = (
+    "Напиши модульные тесты для следующего кода на языке {language} "
+    "с использованием фреймворка {test_framework}:\n\n```{language}\n{code}\n```"
+)
+
+_REFACTOR_TMPL = (
+    "Рефактори следующий код на языке {language}, фокусируясь на {refactoring_description} "
+    "(тип рефакторинга: {refactoring_type}):\n\n```{language}\n{original_code}\n```"
+)
+
+def _require_text(value: Optional[str], name: str, min_length: int = 5):
+    """
+    Проверяет, что входной текст не пустой, до обращения к Claude API.
+    
+    Args:
+        value: Проверяемый текст
+        name: Название параметра для сообщения об ошибке
+        min_length: Минимальная длина текста без пробелов по краям
+        
+    Raises:
+        ValueError: Если текст пустой или слишком короткий
+    """
+    if not value or len(value.strip()) < min_length:
+        raise ValueError(f"{name} слишком короткое: требуется не менее {min_length} символов")
+
+def _split_units(code: str, language: str) -> List[str]:
+    """
+    Делит код на верхнеуровневые функции и классы.
+    
+    Код до первой функции (импорты, константы) добавляется к каждой части,
+    чтобы части оставались самодостаточными. Для неподдерживаемых языков
+    код возвращается целиком.
+    
+    Args:
+        code: Исходный код
+        language: Язык программирования
+        
+    Returns:
+        List частей кода
+    """
+    pattern = _UNIT_START_RE.get(language.lower())
+    if pattern is None:
+        return [code]
+    
+    starts = [match.start() for match in pattern.finditer(code)]
+    if len(starts) < 2:
+        return [code]
+    
+    header = code[:starts[0]]
+    ends = starts[1:] + [len(code)]
+    return [header + code[start:end].rstrip() for start, end in zip(starts, ends)]
+
+# Оценка объема ответа по типу задачи: (множитель к объему промпта, запас на пояснения).
+# Модификация и рефакторинг возвращают весь файл с комментариями и описанием изменений.
+_OUTPUT_TOKEN_FACTORS = {
+    "gen": (2.0, 1024),
+    "modify": (2.0, 1024),
+    "test": (1.5, 1024),
+    "refactor": (2.0, 1024)
+}
+
+# Минимальный лимит токенов ответа для любого типа задачи
+_MIN_OUTPUT_TOKENS = 2048
+
+def _estimate_output_tokens(prompt: List[Dict[str, Any]], kind: str) -> int:
+    """
+    Оценивает лимит токенов ответа по объему промпта.
+    
+    Args:
+        prompt: Блоки содержимого промпта (статические инструкции и задача)
+        kind: Тип задачи (gen, modify, test, refactor)
+        
+    Returns:
+        int: Значение max_tokens, не превышающее CLAUDE_MAX_TOKENS_CAP
+    """
+    factor, allowance = _OUTPUT_TOKEN_FACTORS[kind]
+    prompt_tokens = sum(estimate_tokens(block["text"]) for block in prompt)
+    estimate = int(prompt_tokens * factor) + allowance
+    return min(max(estimate, _MIN_OUTPUT_TOKENS), settings.CLAUDE_MAX_TOKENS_CAP)
+
+# Неизменяемые инструкции промптов. Идут первым блоком сообщения и помечаются
+# cache_control, поэтому должны быть побайтово одинаковыми между вызовами.
+_GENERATE_PREAMBLE = """Требования к коду:
+1. Код должен быть чистым, хорошо структурированным и следовать лучшим практикам
+2. Включи необходимые импорты и зависимости
+3. Добавь комментарии для объяснения ключевых частей кода
+4. Следуй стандартным соглашениям о стиле для указанного языка
+
+Предоставь полный код, готовый к использованию. Если код должен быть разделен на несколько файлов,
+обозначь каждый файл с указанием пути. Например:
+
+## Файл: src/main.py
+```python
+# Код здесь
+```
+
+## Файл: src/utils.py
+```python
+# Код здесь
+```"""
+
+_MODIFY_PREAMBLE = """Требования к модификации кода:
+1. Сохрани существующую структуру кода, если не указано иное
+2. Внеси только необходимые изменения
+3. Объясни ключевые изменения в комментариях
+4. Следуй стандартным соглашениям о стиле для указанного языка
+
+Предоставь полный модифицированный код и кратко опиши основные внесенные изменения."""
+
+_TESTS_PREAMBLE = """Требования к тестам:
+1. Тесты должны быть полными и охватывать основные функциональности кода
+2. Проверить как позитивные сценарии, так и обработку ошибок
+3. Добавить необходимые mock-объекты или fixtures, если требуется
+4. Следовать лучшим практикам тестирования для указанных языка и фреймворка
+
+Предоставь полный код тестов и коротко объясни, что тестирует каждый тест."""
+
+_REFACTOR_PREAMBLE = """Требования к рефакторингу:
+1. Сохрани функциональность кода
+2. Следуй лучшим практикам для указанного языка
+3. Оптимизируй код в соответствии с указанным типом рефакторинга
+4. Прокомментируй ключевые изменения
+
+Предоставь полный рефакторинг кода и объясни основные сделанные улучшения."""
+
 class CodeGenerator:
     """
     Класс для генерации кода с использованием API Claude.
@@ -31,7 +276,10 @@ class CodeGenerator:
         Returns:
             Dict с результатами генерации
         """
-        logger.info(f"Начало генерации кода на языке {language}")
+        logger.debug("Начало генерации кода на языке %s", language)
+        
+        # Не тратим запрос к Claude на пустое описание задачи
+        _require_text(description, "Описание задачи")
         
         # Создаем системный промпт для генерации кода
         system_prompt = build_system_prompt("code_generation", context)
@@ -39,45 +287,28 @@ class CodeGenerator:
         # Формируем контекст из файлов, если он предоставлен
         context_str = ""
         if context and "files" in context:
-            context_str = "Существующий код для контекста:\n\n"
+            parts = ["Существующий код для контекста:\n\n"]
             for file in context["files"]:
                 file_path = file.get("path", "Неизвестный файл")
                 file_content = file.get("content", "Содержимое недоступно")
-                context_str += f"## Файл: {file_path}\n```\n{file_content}\n```\n\n"
-        
-        # Формируем промпт для генерации кода
-        prompt = f"""
-        Напиши код на языке {language} для выполнения следующей задачи:
-        
-        {description}
-        
-        {context_str}
-        
-        Требования:
-        1. Код должен быть чистым, хорошо структурированным и следовать лучшим практикам
-        2. Включи необходимые импорты и зависимости
-        3. Добавь комментарии для объяснения ключевых частей кода
-        4. Следуй стандартным соглашениям о стиле для языка {language}
-        
-        Предоставь полный код, готовый к использованию. Если код должен быть разделен на несколько файлов,
-        обозначь каждый файл с указанием пути. Например:
-        
-        ## Файл: src/main.py
-        ```python
-        # Код здесь
-        ```
-        
-        ## Файл: src/utils.py
-        ```python
-        # Код здесь
-        ```
-        """
+                parts.append(f"## Файл: {file_path}\n```\n{file_content}\n```\n\n")
+            context_str = "".join(parts)
+        
+        # Формируем промпт: статические требования кэшируются, задача идет последней
+        prompt = build_cached_content(
+            _GENERATE_PREAMBLE,
+            _GENERATE_TMPL.format_map({
+                "language": language,
+                "description": description,
+                "context_str": context_str
+            })
+        )
         
         # Получаем ответ от Claude API
-        response = await self.claude_api.send_request(prompt, max_tokens=4000)
+        response = await self._send(prompt, "gen", system_prompt)
         
         # Извлекаем сгенерированный код
-        files = self._extract_code_files(response)
+        files = await self._extract(self._extract_code_files, response)
         
         # Формируем результат
         result = {
@@ -86,7 +317,7 @@ class CodeGenerator:
             "files": files
         }
         
-        logger.info(f"Генерация кода завершена. Сгенерировано {len(files)} файлов")
+        logger.info("Генерация кода завершена. Сгенерировано %d файлов", len(files))
         return result
     
     async def modify_code(self, original_code: str, instructions: str, 
@@ -105,35 +336,27 @@ class CodeGenerator:
         """
         logger.info(f"Начало модификации кода на языке {language}")
         
+        _require_text(original_code, "Исходный код", min_length=1)
+        _require_text(instructions, "Инструкции для модификации")
+        
         # Создаем системный промпт для модификации кода
         system_prompt = build_system_prompt("code_generation", context)
         
         # Формируем промпт для модификации кода
-        prompt = f"""
-        Модифицируй следующий код на языке {language} в соответствии с инструкциями:
-        
-        ## Исходный код:
-        ```{language}
-        {original_code}
-        ```
-        
-        ## Инструкции для модификации:
-        {instructions}
-        
-        Требования:
-        1. Сохрани существующую структуру кода, если не указано иное
-        2. Внеси только необходимые изменения
-        3. Объясни ключевые изменения в комментариях
-        4. Следуй стандартным соглашениям о стиле для языка {language}
-        
-        Предоставь полный модифицированный код и кратко опиши основные внесенные изменения.
-        """
+        prompt = build_cached_content(
+            _MODIFY_PREAMBLE,
+            _MODIFY_TMPL.format_map({
+                "language": language,
+                "original_code": original_code,
+                "instructions": instructions
+            })
+        )
         
         # Получаем ответ от Claude API
-        response = await self.claude_api.send_request(prompt, max_tokens=4000)
+        response = await self._send(prompt, "modify", system_prompt)
         
         # Извлекаем модифицированный код и сводку изменений
-        code, summary = self._extract_modified_code(response, language)
+        code, summary = await self._extract(self._extract_last_code_block, response)
         
         # Формируем результат
         result = {
@@ -164,6 +387,8 @@ class CodeGenerator:
         """
         logger.info(f"Начало генерации тестов для кода на языке {language}")
         
+        _require_text(code, "Код для тестирования", min_length=1)
+        
         # Определяем фреймворк для тестирования, если не указан
         if not test_framework:
             test_framework = self._get_default_test_framework(language)
@@ -171,28 +396,33 @@ class CodeGenerator:
         # Создаем системный промпт для генерации тестов
         system_prompt = build_system_prompt("code_generation", context)
         
-        # Формируем промпт для генерации тестов
-        prompt = f"""
-        Напиши модульные тесты для следующего кода на языке {language} с использованием фреймворка {test_framework}:
-        
-        ```{language}
-        {code}
-        ```
-        
-        Требования:
-        1. Тесты должны быть полными и охватывать основные функциональности кода
-        2. Проверить как позитивные сценарии, так и обработку ошибок
-        3. Добавить необходимые mock-объекты или fixtures, если требуется
-        4. Следовать лучшим практикам тестирования для языка {language} и фреймворка {test_framework}
-        
-        Предоставь полный код тестов и коротко объясни, что тестирует каждый тест.
-        """
+        # Большой код с несколькими функциями покрываем тестами по частям параллельно
+        units = _split_units(code, language) if len(code) > _SPLIT_TESTS_THRESHOLD else [code]
+        semaphore = asyncio.Semaphore(settings.CLAUDE_MAX_CONCURRENCY)
+        
+        async def generate_unit_tests(unit: str) -> Tuple[str, str]:
+            prompt = build_cached_content(
+                _TESTS_PREAMBLE,
+                _TESTS_TMPL.format_map({
+                    "language": language,
+                    "test_framework": test_framework,
+                    "code": unit
+                })
+            )
+            
+            # Получаем ответ от Claude API
+            async with semaphore:
+                response = await self._send(prompt, "test", system_prompt)
+            
+            # Извлекаем сгенерированные тесты
+            return await self._extract(self._extract_last_code_block, response)
         
-        # Получаем ответ от Claude API
-        response = await self.claude_api.send_request(prompt, max_tokens=4000)
+        if len(units) > 1:
+            logger.info(f"Код разделен на {len(units)} частей для генерации тестов")
         
-        # Извлекаем сгенерированные тесты
-        test_code, explanation = self._extract_test_code(response, language)
+        results = await asyncio.gather(*(generate_unit_tests(unit) for unit in units))
+        test_code = "\n\n".join(unit_code for unit_code, _ in results if unit_code)
+        explanation = "\n\n".join(unit_explanation for _, unit_explanation in results if unit_explanation)
         
         # Формируем результат
         result = {
@@ -230,27 +460,21 @@ class CodeGenerator:
         refactoring_description = self._get_refactoring_description(refactoring_type)
         
         # Формируем промпт для рефакторинга
-        prompt = f"""
-        Рефактори следующий код на языке {language}, фокусируясь на {refactoring_description}:
-        
-        ```{language}
-        {original_code}
-        ```
-        
-        Требования:
-        1. Сохрани функциональность кода
-        2. Следуй лучшим практикам для языка {language}
-        3. Оптимизируй код в соответствии с типом рефакторинга: {refactoring_type}
-        4. Прокомментируй ключевые изменения
-        
-        Предоставь полный рефакторинг кода и объясни основные сделанные улучшения.
-        """
+        prompt = build_cached_content(
+            _REFACTOR_PREAMBLE,
+            _REFACTOR_TMPL.format_map({
+                "language": language,
+                "refactoring_description": refactoring_description,
+                "refactoring_type": refactoring_type,
+                "original_code": original_code
+            })
+        )
         
         # Получаем ответ от Claude API
-        response = await self.claude_api.send_request(prompt, max_tokens=4000)
+        response = await self._send(prompt, "refactor", system_prompt)
         
         # Извлекаем рефакторинг кода и сводку изменений
-        refactored_code, improvements = self._extract_refactored_code(response, language)
+        refactored_code, improvements = await self._extract(self._extract_last_code_block, response)
         
         # Формируем результат
         result = {
@@ -264,6 +488,57 @@ class CodeGenerator:
         logger.info("Рефакторинг кода завершен")
         return result
     
+    async def _send(self, prompt: List[Dict[str, Any]], kind: str, system_prompt: str) -> str:
+        """
+        Отправляет запрос к Claude с лимитом ответа, оцененным по промпту.
+        
+        Обрезанный ответ не содержит закрывающего блока кода, поэтому запрос
+        повторяется с удвоенным лимитом, пока не будет достигнут CLAUDE_MAX_TOKENS_CAP.
+        
+        Args:
+            prompt: Блоки содержимого промпта
+            kind: Тип задачи (gen, modify, test, refactor)
+            system_prompt: Системный промпт
+            
+        Returns:
+            str: Полный ответ Claude
+            
+        Raises:
+            ValueError: Если ответ не помещается в CLAUDE_MAX_TOKENS_CAP
+        """
+        max_tokens = _estimate_output_tokens(prompt, kind)
+        while True:
+            try:
+                return await self.claude_api.send_request(
+                    prompt, max_tokens=max_tokens,
+                    system_prompt=system_prompt, cache_system_prompt=True,
+                    allow_truncated=False
+                )
+            except ResponseTruncatedError:
+                if max_tokens >= settings.CLAUDE_MAX_TOKENS_CAP:
+                    raise ValueError(
+                        f"Ответ Claude не помещается в лимит {settings.CLAUDE_MAX_TOKENS_CAP} токенов. "
+                        "Уменьшите объем кода или увеличьте CLAUDE_MAX_TOKENS_CAP"
+                    )
+                max_tokens = min(max_tokens * 2, settings.CLAUDE_MAX_TOKENS_CAP)
+                logger.warning("Ответ Claude обрезан, повтор с max_tokens=%d", max_tokens)
+    
+    async def _extract(self, extractor: Callable[[str], Any], response: str) -> Any:
+        """
+        Разбирает ответ Claude API, вынося разбор больших ответов из цикла событий.
+        
+        Args:
+            extractor: Функция разбора ответа
+            response: Текстовый ответ от Claude API
+            
+        Returns:
+            Результат функции разбора
+        """
+        # Для небольших ответов переключение потоков дороже самого разбора
+        if len(response) > _EXTRACT_IN_THREAD_THRESHOLD:
+            return await asyncio.to_thread(extractor, response)
+        return extractor(response)
+    
     def _extract_code_files(self, response: str) -> List[Dict[str, Any]]:
         """
         Извлекает файлы с кодом из ответа Claude API.
@@ -276,17 +551,8 @@ class CodeGenerator:
         """
         files = []
         
-        # Регулярное выражение для поиска блоков файлов
-        # ## Файл: path/to/file.ext
-        # ```[language]
-        # code
-        # ```
-        file_pattern = r"## Файл:\s*(.*?)\n```(?:\w*)\n(.*?)```"
-        
         # Находим все блоки файлов
-        matches = re.finditer(file_pattern, response, re.DOTALL)
-        
-        for match in matches:
+        for match in _FILE_RE.finditer(response):
             file_path = match.group(1).strip()
             file_content = match.group(2).strip()
             
@@ -302,10 +568,7 @@ class CodeGenerator:
         
         # Если блоки файлов не найдены, но есть блок кода, считаем его одним файлом
         if not files:
-            code_pattern = r"```(?:(\w+)\n)?(.*?)```"
-            matches = re.finditer(code_pattern, response, re.DOTALL)
-            
-            for match in matches:
+            for match in _CODE_RE.finditer(response):
                 language = match.group(1) or "text"
                 code = match.group(2).strip()
                 
@@ -320,95 +583,33 @@ class CodeGenerator:
         
         return files
     
-    def _extract_modified_code(self, response: str, language: str) -> Tuple[str, str]:
-        """
-        Извлекает модифицированный код и сводку изменений из ответа Claude API.
-        
-        Args:
-            response: Текстовый ответ от Claude API
-            language: Язык программирования
-            
-        Returns:
-            Tuple с модифицированным кодом и сводкой изменений
+    def _extract_last_code_block(self, response: str) -> Tuple[str, str]:
         """
-        # Регулярное выражение для поиска блока кода
-        code_pattern = r"```(?:\w*)\n(.*?)```"
-        
-        # Находим все блоки кода
-        code_matches = re.finditer(code_pattern, response, re.DOTALL)
-        
-        modified_code = ""
-        for match in code_matches:
-            code = match.group(1).strip()
-            modified_code = code  # Берем последний найденный блок кода
+        Извлекает последний блок кода и сопровождающий текст из ответа Claude API.
         
-        # Извлекаем сводку изменений
-        # Ищем текст после последнего блока кода или перед первым блоком кода
-        if modified_code:
-            last_code_end = response.rfind("```") + 3
-            summary = response[last_code_end:].strip()
-            
-            # Если после кода нет текста, ищем текст до первого блока кода
-            if not summary:
-                first_code_start = response.find("```")
-                if first_code_start > 0:
-                    summary = response[:first_code_start].strip()
-        else:
-            summary = response.strip()
-        
-        return modified_code, summary
-    
-    def _extract_test_code(self, response: str, language: str) -> Tuple[str, str]:
-        """
-        Извлекает код тестов и объяснение из ответа Claude API.
+        Используется для модификации, рефакторинга и генерации тестов: код берется
+        из последнего блока, пояснение - из текста после него или, если после
+        кода текста нет, из текста перед первым блоком. Ответ сканируется один раз.
         
         Args:
             response: Текстовый ответ от Claude API
-            language: Язык программирования
             
         Returns:
-            Tuple с кодом тестов и объяснением
+            Tuple с кодом и пояснением (сводкой изменений, объяснением тестов)
         """
-        # Регулярное выражение для поиска блока кода
-        code_pattern = r"```(?:\w*)\n(.*?)```"
-        
-        # Находим все блоки кода
-        code_matches = re.finditer(code_pattern, response, re.DOTALL)
+        first = last = None
+        for match in _CODE_NO_LANG_RE.finditer(response):
+            if first is None:
+                first = match
+            last = match
         
-        test_code = ""
-        for match in code_matches:
-            code = match.group(1).strip()
-            test_code = code  # Берем последний найденный блок кода
+        code = last.group(1).strip() if last else ""
+        if not code:
+            return "", response.strip()
         
-        # Извлекаем объяснение
         # Ищем текст после последнего блока кода или перед первым блоком кода
-        if test_code:
-            last_code_end = response.rfind("```") + 3
-            explanation = response[last_code_end:].strip()
-            
-            # Если после кода нет текста, ищем текст до первого блока кода
-            if not explanation:
-                first_code_start = response.find("```")
-                if first_code_start > 0:
-                    explanation = response[:first_code_start].strip()
-        else:
-            explanation = response.strip()
-        
-        return test_code, explanation
-    
-    def _extract_refactored_code(self, response: str, language: str) -> Tuple[str, str]:
-        """
-        Извлекает рефакторинг кода и улучшения из ответа Claude API.
-        
-        Args:
-            response: Текстовый ответ от Claude API
-            language: Язык программирования
-            
-        Returns:
-            Tuple с рефакторингом кода и улучшениями
-        """
-        # Аналогично методу _extract_modified_code
-        return self._extract_modified_code(response, language)
+        text = response[last.end():].strip() or response[:first.start()].strip()
+        return code, text
     
     def _get_default_test_framework(self, language: str) -> str:
         """
@@ -420,20 +621,7 @@ class CodeGenerator:
         Returns:
             Строка с названием фреймворка
         """
-        frameworks = {
-            "python": "pytest",
-            "javascript": "jest",
-            "typescript": "jest",
-            "java": "JUnit",
-            "csharp": "NUnit",
-            "go": "testing",
-            "ruby": "RSpec",
-            "php": "PHPUnit",
-            "rust": "cargo test",
-            "swift": "XCTest"
-        }
-        
-        return frameworks.get(language.lower(), "unittest")
+        return _FRAMEWORKS.get(language.lower(), "unittest")
     
     def _get_refactoring_description(self, refactoring_type: str) -> str:
         """
@@ -445,17 +633,7 @@ class CodeGenerator:
         Returns:
             Строка с описанием
         """
-        descriptions = {
-            "general": "общем улучшении кода",
-            "performance": "оптимизации производительности",
-            "readability": "улучшении читаемости кода",
-            "maintainability": "улучшении поддерживаемости кода",
-            "security": "улучшении безопасности кода",
-            "modernization": "модернизации кода под современные стандарты",
-            "clean_code": "принципах чистого кода"
-        }
-        
-        return descriptions.get(refactoring_type.lower(), "общем улучшении кода")
+        return _REFACTOR_DESC.get(refactoring_type.lower(), "общем улучшении кода")
     
     def _get_language_by_extension(self, extension: str) -> str:
         """
@@ -467,33 +645,7 @@ class CodeGenerator:
         Returns:
             Строка с названием языка
         """
-        extensions = {
-            "py": "python",
-            "js": "javascript",
-            "ts": "typescript",
-            "jsx": "jsx",
-            "tsx": "tsx",
-            "html": "html",
-            "css": "css",
-            "java": "java",
-            "c": "c",
-            "cpp": "cpp",
-            "cs": "csharp",
-            "go": "go",
-            "rb": "ruby",
-            "php": "php",
-            "swift": "swift",
-            "kt": "kotlin",
-            "rs": "rust",
-            "sh": "bash",
-            "json": "json",
-            "yml": "yaml",
-            "yaml": "yaml",
-            "xml": "xml",
-            "md": "markdown"
-        }
-        
-        return extensions.get(extension.lower(), "text")
+        return _LANG_BY_EXT.get(extension.lower(), "text")
     
     def _get_extension_by_language(self, language: str) -> str:
         """
@@ -505,29 +657,4 @@ class CodeGenerator:
         Returns:
             Строка с расширением файла
         """
-        languages = {
-            "python": ".py",
-            "javascript": ".js",
-            "typescript": ".ts",
-            "jsx": ".jsx",
-            "tsx": ".tsx",
-            "html": ".html",
-            "css": ".css",
-            "java": ".java",
-            "c": ".c",
-            "cpp": ".cpp",
-            "csharp": ".cs",
-            "go": ".go",
-            "ruby": ".rb",
-            "php": ".php",
-            "swift": ".swift",
-            "kotlin": ".kt",
-            "rust": ".rs",
-            "bash": ".sh",
-            "json": ".json",
-            "yaml": ".yml",
-            "xml": ".xml",
-            "markdown": ".md"
-        }
-        
-        return languages.get(language.lower(), ".txt")
\ No newline at end of file
+        return _EXT_BY_LANG.get(language.lower(), ".txt")
\ No newline at end of file
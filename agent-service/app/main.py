@@ -2,16 +2,21 @@
 
 import uvicorn
 import logging
+import orjson
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, Optional, List
-import os
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, validator
+from typing import Dict, Any, Optional, List, AsyncIterator
 
 from app.core.config import settings
 from app.core.agent import DevAgent
 from app.tasks.executor import TaskExecutor
 from app.tasks.queue import TaskQueue
+from app.services.http_client import close_http_client
+from app.services.claude_api import close_claude_clients
+from app.services.token_budget import TokenBudget
+from app.utils.prompt_utils import estimate_tokens
 
 # Настройка логирования
 logging.basicConfig(
@@ -42,22 +47,63 @@ class MessageRequest(BaseModel):
     message: str
     project_id: Optional[str] = None
     context: Optional[Dict[str, Any]] = None
+    stream: bool = False
+    
+    # Пустые сообщения отклоняются с 422 до обращения к Claude
+    @validator("message")
+    def validate_message(cls, v):
+        if not v.strip():
+            raise ValueError("Сообщение не может быть пустым")
+        return v
+    
+    class Config:
+        frozen = True
 
 class TaskStatusUpdate(BaseModel):
     status: str
     progress: int
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    
+    class Config:
+        # Обновления статуса приходят только от внутренних сервисов
+        extra = "forbid"
+        frozen = True
 
 # Инициализация сервисов
 dev_agent = DevAgent()
 task_queue = TaskQueue()
+token_budget = TokenBudget()
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Запуск API сервиса AI-агента разработчика")
     logger.info(f"Версия Claude API: {settings.CLAUDE_API_MODEL}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("Остановка API сервиса AI-агента разработчика")
+    await close_http_client()
+    await close_claude_clients()
+
+def build_project_context(request: MessageRequest) -> Optional[Dict[str, Any]]:
+    """Формирует контекст проекта из запроса пользователя."""
+    project_context = None
+    if request.project_id:
+        project_context = {"project_id": request.project_id}
+        if request.context:
+            project_context.update(request.context)
+    return project_context
+
+async def ensure_token_budget(user_id: str):
+    """Отклоняет запрос, если пользователь исчерпал суточный лимит токенов."""
+    if await token_budget.is_exhausted(user_id):
+        raise HTTPException(status_code=429, detail="Суточный лимит токенов исчерпан")
+
+async def record_token_usage(user_id: str, message: str, response: Dict[str, Any]):
+    """Учитывает токены запроса и ответа в суточном лимите пользователя (по оценке длины текста)."""
+    await token_budget.add(user_id, estimate_tokens(message) + estimate_tokens(response.get("message", "")))
+
 @app.get("/health")
 async def health_check():
     """Проверка состояния сервиса."""
@@ -68,17 +114,22 @@ async def process_message(request: MessageRequest, background_tasks: BackgroundT
     """
     Обрабатывает сообщение от пользователя и возвращает ответ.
     Для длительных операций создает фоновую задачу.
+    При stream=true ответ передается потоком событий, как в /process/stream.
     """
     logger.info(f"Получено сообщение от пользователя {request.user_id}")
     
+    await ensure_token_budget(request.user_id)
+    
+    # Создаем контекст проекта
+    project_context = build_project_context(request)
+    
+    if request.stream:
+        return StreamingResponse(
+            event_stream(request.user_id, request.message, project_context),
+            media_type="text/event-stream"
+        )
+    
     try:
-        # Создаем контекст проекта
-        project_context = None
-        if request.project_id:
-            project_context = {"project_id": request.project_id}
-            if request.context:
-                project_context.update(request.context)
-        
         # Обрабатываем сообщение через агента
         response = await dev_agent.process_message(
             user_id=request.user_id,
@@ -86,12 +137,52 @@ async def process_message(request: MessageRequest, background_tasks: BackgroundT
             project_context=project_context
         )
         
+        await record_token_usage(request.user_id, request.message, response)
+        
         return response
     
     except Exception as e:
         logger.error(f"Ошибка при обработке сообщения: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/process/stream")
+async def process_message_stream(request: MessageRequest):
+    """
+    Обрабатывает сообщение от пользователя и передает ответ потоком (Server-Sent Events).
+    """
+    logger.info(f"Получено сообщение для потоковой обработки от пользователя {request.user_id}")
+    
+    await ensure_token_budget(request.user_id)
+    
+    # Создаем контекст проекта
+    project_context = build_project_context(request)
+    
+    return StreamingResponse(
+        event_stream(request.user_id, request.message, project_context),
+        media_type="text/event-stream"
+    )
+
+async def event_stream(user_id: str, message: str,
+                       project_context: Optional[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """
+    Передает ответ агента событиями Server-Sent Events.
+    
+    Фрагменты ответа идут событиями delta, итоговый ответ - событием done.
+    """
+    try:
+        async for event in dev_agent.process_message_stream(
+            user_id=user_id,
+            message=message,
+            project_context=project_context
+        ):
+            if event["event"] == "done":
+                await record_token_usage(user_id, message, event["response"])
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+    except Exception as e:
+        # Заголовки уже отправлены, поэтому ошибку передаем событием
+        logger.error(f"Ошибка при потоковой обработке сообщения: {str(e)}")
+        yield b"data: " + orjson.dumps({"event": "error", "detail": str(e)}) + b"\n\n"
+
 @app.get("/tasks/{task_id}")
 async def get_task_status(task_id: str):
     """
@@ -125,9 +216,14 @@ async def list_tasks(status: Optional[str] = None):
     return tasks
 
 if __name__ == "__main__":
+    # Каждый воркер - отдельный процесс со своим циклом событий uvloop,
+    # поэтому клиенты Claude API и HTTP создаются в каждом воркере заново
     uvicorn.run(
         "app.main:app",
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", "8001")),
-        reload=True
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=settings.WEB_CONCURRENCY,
+        loop="uvloop",
+        http="httptools",
+        reload=False
     )
\ No newline at end of file
@@ -1,13 +1,128 @@
 # agent-service/app/services/claude_api.py
 
-import os
 import json
 import logging
 import time
+import httpx
+from collections import deque
 import anthropic
-from typing import Dict, List, Any, Optional
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from typing import Dict, List, Any, Optional, Union, AsyncIterator
+from cachetools import TTLCache
 from app.core.config import settings
+from app.utils.cache_utils import prompt_hash
+from app.utils.prompt_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина строки краткого содержания вытесненного сообщения
+_SUMMARY_LINE_LENGTH = 200
+
+# Заголовок для включения кэширования префиксов промптов (cache_control)
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+
+# Максимальное количество блоков cache_control в одном запросе (ограничение API)
+_MAX_CACHE_BREAKPOINTS = 4
+
+# Интервал (в сообщениях) между промежуточными точками кэширования длинной истории
+_CACHE_CHECKPOINT_INTERVAL = 10
+
+# Общие асинхронные клиенты Claude API по API-ключу (один пул соединений на ключ)
+_CLIENTS: Dict[str, anthropic.AsyncAnthropic] = {}
+
+# Точный кэш ответов, общий для всех экземпляров ClaudeAPI
+_RESPONSE_CACHE: Optional[TTLCache] = None
+if settings.CLAUDE_CACHE_ENABLED:
+    _RESPONSE_CACHE = TTLCache(maxsize=settings.CLAUDE_CACHE_SIZE, ttl=settings.CLAUDE_CACHE_TTL)
+
+class ResponseTruncatedError(ValueError):
+    """
+    Ответ Claude обрезан по лимиту max_tokens.
+    """
+    
+    def __init__(self, max_tokens: int):
+        super().__init__(f"Ответ API Claude обрезан по лимиту max_tokens={max_tokens}")
+        self.max_tokens = max_tokens
+
+def _get_async_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """
+    Возвращает общий асинхронный клиент Claude API для указанного ключа.
+    
+    Клиент создается при первом обращении и переиспользуется всеми экземплярами
+    ClaudeAPI, поэтому TCP/TLS-соединения не устанавливаются заново для каждого
+    компонента (генератора кода, анализаторов, исполнителя задач).
+    
+    Args:
+        api_key: API-ключ для Claude
+        
+    Returns:
+        anthropic.AsyncAnthropic: Общий клиент
+    """
+    client = _CLIENTS.get(api_key)
+    if client is None:
+        client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            # SDK повторяет только сетевой вызов (ошибки соединения, таймауты, 429, 5xx)
+            # с экспоненциальной задержкой и учетом заголовка Retry-After
+            max_retries=settings.CLAUDE_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(60.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_keepalive_connections=50,
+                    max_connections=200,
+                    keepalive_expiry=30.0
+                )
+            )
+        )
+        _CLIENTS[api_key] = client
+    return client
+
+async def close_claude_clients():
+    """
+    Закрывает общие клиенты Claude API. Вызывается при остановке сервиса.
+    """
+    clients = list(_CLIENTS.values())
+    _CLIENTS.clear()
+    
+    for client in clients:
+        await client.close()
+    
+    if clients:
+        logger.info("Клиенты Claude API закрыты")
+
+def _message_text(message: Dict[str, Any]) -> str:
+    """
+    Возвращает текст сообщения беседы.
+    
+    Args:
+        message: Сообщение со строковым содержимым или списком блоков
+        
+    Returns:
+        str: Текст сообщения
+    """
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(block.get("text", "") for block in content)
+
+def _summarize_message(message: Dict[str, Any]) -> str:
+    """
+    Кратко излагает сообщение беседы одной строкой без обращения к модели.
+    
+    Берется первая непустая строка сообщения, обрезанная до _SUMMARY_LINE_LENGTH символов.
+    
+    Args:
+        message: Сообщение беседы
+        
+    Returns:
+        str: Строка краткого содержания
+    """
+    text = _message_text(message).strip()
+    line = text.splitlines()[0].strip() if text else ""
+    if len(line) > _SUMMARY_LINE_LENGTH:
+        line = line[:_SUMMARY_LINE_LENGTH].rstrip() + "..."
+    role = "Пользователь" if message["role"] == "user" else "Ассистент"
+    return f"- {role}: {line}"
 
 class ClaudeAPI:
     """
@@ -30,46 +145,95 @@ class ClaudeAPI:
             self.logger.error("API-ключ не найден. Укажите его в параметре api_key или в настройках.")
             raise ValueError("API-ключ не найден")
         
-        # Инициализируем клиент Claude API
         self.model = model or settings.CLAUDE_API_MODEL
-        self.client = anthropic.Anthropic(api_key=self.api_key)
         
-        # Хранилище для беседы (опционально, для сохранения контекста)
-        self.conversation_history = []
+        # Хранилище для беседы (опционально, для сохранения контекста).
+        # Ограничено последними CLAUDE_HISTORY_TURNS парами сообщений
+        self.conversation_history: deque = deque(maxlen=settings.CLAUDE_HISTORY_TURNS * 2)
+        
+        # Краткое содержание вытесненных из истории сообщений (без дополнительных запросов к модели)
+        self._history_summary: deque = deque(maxlen=settings.CLAUDE_HISTORY_SUMMARY_LINES)
+        
+        self.logger.info("ClaudeAPI инициализирован с моделью %s", self.model)
+    
+    @property
+    def client(self) -> anthropic.AsyncAnthropic:
+        """
+        Общий асинхронный клиент Claude API для ключа этого экземпляра.
+        
+        Клиент берется из общего реестра при каждом обращении, поэтому после
+        закрытия (aclose, остановка сервиса) следующий запрос создаст новый клиент,
+        а не обратится к закрытому пулу соединений.
+        """
+        return _get_async_client(self.api_key)
+    
+    async def aclose(self):
+        """
+        Закрывает общий клиент Claude API для ключа этого экземпляра.
         
-        self.logger.info(f"ClaudeAPI инициализирован с моделью {self.model}")
+        Клиент используется всеми экземплярами с тем же ключом; последующие
+        запросы любого из них откроют новый пул соединений.
+        """
+        client = _CLIENTS.pop(self.api_key, None)
+        if client is not None:
+            await client.close()
+            self.logger.info("Клиент Claude API закрыт")
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((anthropic.RateLimitError, anthropic.APITimeoutError)),
-        reraise=True
-    )
-    async def send_request(self, prompt: str, 
+    async def send_request(self, prompt: Union[str, List[Dict[str, Any]]], 
                            max_tokens: int = 4000, 
                            use_conversation_history: bool = False,
-                           system_prompt: Optional[str] = None) -> str:
+                           system_prompt: Optional[str] = None,
+                           temperature: Optional[float] = None,
+                           cache_system_prompt: bool = False,
+                           history: Optional[List[Dict[str, Any]]] = None,
+                           use_cache: bool = True,
+                           allow_truncated: bool = True) -> str:
         """
         Отправляет запрос к API Claude и возвращает ответ.
         
+        Ответы на одинаковые запросы без истории беседы берутся из точного кэша.
+        
         Args:
-            prompt: Текст промпта для отправки.
+            prompt: Текст промпта или список блоков содержимого (в т.ч. с cache_control).
             max_tokens: Максимальное количество токенов в ответе.
             use_conversation_history: Использовать ли историю беседы для контекста.
             system_prompt: Опциональный системный промпт.
+            temperature: Температура генерации (по умолчанию - значение API).
+            cache_system_prompt: Пометить системный промпт для кэширования префикса.
+            history: Предыдущие сообщения беседы; имеют приоритет над use_conversation_history.
+            use_cache: Использовать ли точный кэш ответов.
+            allow_truncated: Возвращать ли ответ, обрезанный по лимиту max_tokens.
             
         Returns:
             str: Ответ от API Claude.
+            
+        Raises:
+            ResponseTruncatedError: Ответ обрезан по лимиту, а allow_truncated=False.
         """
-        self.logger.info(f"Отправка запроса к Claude API (модель: {self.model})")
+        # Запросы с историей зависят от беседы, поэтому в кэш не попадают
+        cache_key = None
+        if use_cache and _RESPONSE_CACHE is not None and not history and not use_conversation_history:
+            cache_key = self._response_cache_key(prompt, max_tokens, system_prompt, temperature)
+            cached_answer = _RESPONSE_CACHE.get(cache_key)
+            if cached_answer is not None:
+                self.logger.info("Ответ Claude API получен из кэша")
+                return cached_answer
+        
+        self.logger.debug("Отправка запроса к Claude API (модель: %s)", self.model)
         
         try:
             # Подготовка сообщений
             messages = []
             
             # Добавляем историю беседы, если требуется
-            if use_conversation_history and self.conversation_history:
-                messages = self.conversation_history.copy()
+            if history:
+                messages = self._cacheable_history(
+                    history, self._free_cache_breakpoints(prompt, system_prompt, cache_system_prompt)
+                )
+            elif use_conversation_history and self.conversation_history:
+                messages = self._cacheable_history(
+                    self._history_messages(), self._free_cache_breakpoints(prompt, system_prompt, cache_system_prompt)
+                )
             else:
                 # Если не используем историю, начинаем новую беседу
                 messages = []
@@ -78,43 +242,346 @@ class ClaudeAPI:
             messages.append({"role": "user", "content": prompt})
             
             # Подготавливаем параметры запроса
-            request_params = {
-                "model": self.model,
-                "max_tokens": max_tokens,
-                "messages": messages
-            }
-            
-            # Добавляем системный промпт, если указан
-            if system_prompt:
-                request_params["system"] = system_prompt
+            request_params = self._build_request_params(
+                messages, max_tokens, system_prompt, temperature, cache_system_prompt
+            )
+            
+            # Включаем кэширование префикса, если в запросе есть блоки с cache_control
+            if cache_system_prompt or any(self._has_cache_control(message["content"]) for message in messages):
+                request_params["extra_headers"] = {"anthropic-beta": PROMPT_CACHING_BETA}
             
             # Отправляем запрос
-            start_time = time.time()
+            start = time.perf_counter_ns()
+            
+            response = await self.client.messages.create(**request_params)
             
-            response = self.client.messages.create(**request_params)
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("Запрос к Claude API (%s) выполнен за %.2f мс",
+                                 self.model, (time.perf_counter_ns() - start) / 1e6)
             
-            elapsed_time = time.time() - start_time
-            self.logger.info(f"Запрос выполнен за {elapsed_time:.2f} секунд")
+            # Неполный ответ не сохраняем ни в истории, ни в кэше
+            if not allow_truncated and response.stop_reason == "max_tokens":
+                raise ResponseTruncatedError(max_tokens)
             
             # Извлекаем текст ответа
             answer_text = response.content[0].text
             
             # Сохраняем сообщения в историю беседы, если требуется
             if use_conversation_history:
-                self.conversation_history.append({"role": "user", "content": prompt})
-                self.conversation_history.append({"role": "assistant", "content": answer_text})
+                self._append_history({"role": "user", "content": prompt})
+                self._append_history({"role": "assistant", "content": answer_text})
+            
+            if cache_key is not None:
+                _RESPONSE_CACHE[cache_key] = answer_text
             
             return answer_text
         
+        except ResponseTruncatedError:
+            raise
+        except Exception as e:
+            self.logger.exception("Ошибка при запросе к API")
+            raise ValueError(f"Ошибка запроса к API Claude: {str(e)}")
+    
+    async def send_request_with_tools(self, prompt: Union[str, List[Dict[str, Any]]],
+                                      tools: List[Dict[str, Any]],
+                                      max_tokens: int = 4000,
+                                      system_prompt: Optional[str] = None,
+                                      temperature: Optional[float] = None,
+                                      cache_system_prompt: bool = False,
+                                      history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Отправляет запрос к API Claude с набором инструментов (tool use).
+        
+        Args:
+            prompt: Текст промпта или список блоков содержимого (в т.ч. с cache_control).
+            tools: Описания инструментов (name, description, input_schema).
+            max_tokens: Максимальное количество токенов в ответе.
+            system_prompt: Опциональный системный промпт.
+            temperature: Температура генерации (по умолчанию - значение API).
+            cache_system_prompt: Пометить системный промпт для кэширования префикса
+                                 (вместе с описаниями инструментов, которые идут перед ним).
+            history: Предыдущие сообщения беседы.
+            
+        Returns:
+            Dict с ключами tool_name (None, если инструмент не выбран),
+            tool_input (аргументы вызова) и text (текстовая часть ответа).
+        """
+        self.logger.debug("Отправка запроса с инструментами к Claude API (модель: %s)", self.model)
+        
+        try:
+            messages = self._cacheable_history(
+                history, self._free_cache_breakpoints(prompt, system_prompt, cache_system_prompt)
+            ) if history else []
+            messages.append({"role": "user", "content": prompt})
+            
+            request_params = self._build_request_params(
+                messages, max_tokens, system_prompt, temperature, cache_system_prompt
+            )
+            request_params["tools"] = tools
+            
+            if cache_system_prompt or any(self._has_cache_control(message["content"]) for message in messages):
+                request_params["extra_headers"] = {"anthropic-beta": PROMPT_CACHING_BETA}
+            
+            start = time.perf_counter_ns()
+            
+            response = await self.client.messages.create(**request_params)
+            
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("Запрос к Claude API (%s) выполнен за %.2f мс",
+                                 self.model, (time.perf_counter_ns() - start) / 1e6)
+            
+            # Берем первый вызов инструмента и весь текст ответа
+            result = {"tool_name": None, "tool_input": {}, "text": ""}
+            texts = []
+            for block in response.content:
+                if block.type == "tool_use" and result["tool_name"] is None:
+                    result["tool_name"] = block.name
+                    result["tool_input"] = block.input
+                elif block.type == "text":
+                    texts.append(block.text)
+            result["text"] = "".join(texts)
+            
+            return result
+        
         except Exception as e:
-            self.logger.error(f"Ошибка при запросе к API: {str(e)}")
+            self.logger.exception("Ошибка при запросе с инструментами к API")
             raise ValueError(f"Ошибка запроса к API Claude: {str(e)}")
     
+    async def stream_request(self, prompt: Union[str, List[Dict[str, Any]]],
+                             max_tokens: int = 4000,
+                             system_prompt: Optional[str] = None,
+                             temperature: Optional[float] = None,
+                             cache_system_prompt: bool = False,
+                             history: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[str]:
+        """
+        Отправляет запрос к API Claude и возвращает ответ по частям по мере генерации.
+        
+        Args:
+            prompt: Текст промпта или список блоков содержимого (в т.ч. с cache_control).
+            max_tokens: Максимальное количество токенов в ответе.
+            system_prompt: Опциональный системный промпт.
+            temperature: Температура генерации (по умолчанию - значение API).
+            cache_system_prompt: Пометить системный промпт для кэширования префикса.
+            history: Предыдущие сообщения беседы.
+            
+        Yields:
+            str: Очередной фрагмент текста ответа.
+        """
+        self.logger.debug("Отправка потокового запроса к Claude API (модель: %s)", self.model)
+        
+        messages = self._cacheable_history(
+            history, self._free_cache_breakpoints(prompt, system_prompt, cache_system_prompt)
+        ) if history else []
+        messages.append({"role": "user", "content": prompt})
+        
+        request_params = self._build_request_params(
+            messages, max_tokens, system_prompt, temperature, cache_system_prompt
+        )
+        
+        if cache_system_prompt or any(self._has_cache_control(message["content"]) for message in messages):
+            request_params["extra_headers"] = {"anthropic-beta": PROMPT_CACHING_BETA}
+        
+        try:
+            async with self.client.messages.stream(**request_params) as stream:
+                async for text in stream.text_stream:
+                    yield text
+        
+        except Exception as e:
+            self.logger.exception("Ошибка при потоковом запросе к API")
+            raise ValueError(f"Ошибка потокового запроса к API Claude: {str(e)}")
+    
+    def _build_request_params(self, messages: List[Dict[str, Any]],
+                              max_tokens: int,
+                              system_prompt: Optional[str] = None,
+                              temperature: Optional[float] = None,
+                              cache_system_prompt: bool = False) -> Dict[str, Any]:
+        """
+        Формирует параметры запроса к Messages API.
+        
+        Args:
+            messages: Список сообщений беседы
+            max_tokens: Максимальное количество токенов в ответе
+            system_prompt: Опциональный системный промпт
+            temperature: Температура генерации
+            cache_system_prompt: Передать системный промпт блоком с маркером cache_control
+            
+        Returns:
+            Dict с параметрами запроса
+        """
+        request_params = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "messages": messages
+        }
+        
+        # Добавляем системный промпт, если указан
+        if system_prompt:
+            if cache_system_prompt:
+                request_params["system"] = [
+                    {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+                ]
+            else:
+                request_params["system"] = system_prompt
+        
+        if temperature is not None:
+            request_params["temperature"] = temperature
+        
+        return request_params
+    
+    def _response_cache_key(self, prompt: Union[str, List[Dict[str, Any]]],
+                            max_tokens: int,
+                            system_prompt: Optional[str],
+                            temperature: Optional[float]) -> bytes:
+        """
+        Вычисляет ключ точного кэша ответов по параметрам запроса.
+        
+        Args:
+            prompt: Текст промпта или список блоков содержимого
+            max_tokens: Максимальное количество токенов в ответе
+            system_prompt: Системный промпт
+            temperature: Температура генерации
+            
+        Returns:
+            bytes: Ключ кэша
+        """
+        prompt_text = prompt if isinstance(prompt, str) else json.dumps(prompt, ensure_ascii=False, sort_keys=True)
+        return prompt_hash(self.model, system_prompt or "", prompt_text, str(max_tokens), str(temperature))
+    
+    @staticmethod
+    def _trim_history(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Отбрасывает самые старые пары сообщений, пока история не уложится в бюджет токенов.
+        
+        Системный промпт хранится отдельно от истории и не сокращается,
+        поэтому его префикс остается кэшируемым.
+        
+        Args:
+            messages: Сообщения беседы (пары user/assistant)
+            
+        Returns:
+            List сообщений в пределах CLAUDE_HISTORY_MAX_TOKENS
+        """
+        total = sum(estimate_tokens(_message_text(message)) for message in messages)
+        start = 0
+        while total > settings.CLAUDE_HISTORY_MAX_TOKENS and start < len(messages):
+            total -= sum(estimate_tokens(_message_text(message)) for message in messages[start:start + 2])
+            start += 2
+        
+        return messages[start:]
+    
+    def _history_messages(self) -> List[Dict[str, Any]]:
+        """
+        Формирует сообщения истории беседы для запроса.
+        
+        История сокращается до бюджета токенов, а краткое содержание вытесненных
+        и отброшенных сообщений добавляется в начало первого оставшегося сообщения.
+        
+        Returns:
+            List сообщений для Messages API
+        """
+        history = list(self.conversation_history)
+        messages = self._trim_history(history)
+        
+        summary = list(self._history_summary)
+        summary.extend(_summarize_message(message) for message in history[:len(history) - len(messages)])
+        if not summary or not messages:
+            return messages
+        
+        preamble = "Краткое содержание предыдущей части беседы:\n" + "\n".join(summary)
+        first = messages[0]
+        if isinstance(first["content"], str):
+            content = f"{preamble}\n\n{first['content']}"
+        else:
+            content = [{"type": "text", "text": preamble}] + list(first["content"])
+        messages[0] = {"role": first["role"], "content": content}
+        return messages
+    
+    def _append_history(self, message: Dict[str, Any]):
+        """
+        Добавляет сообщение в историю беседы, сохраняя краткое содержание вытесняемого.
+        
+        Args:
+            message: Сообщение беседы
+        """
+        if len(self.conversation_history) == self.conversation_history.maxlen:
+            self._history_summary.append(_summarize_message(self.conversation_history[0]))
+        self.conversation_history.append(message)
+    
+    @staticmethod
+    def _cacheable_history(history: List[Dict[str, Any]], max_breakpoints: int = 1) -> List[Dict[str, Any]]:
+        """
+        Копирует историю беседы, расставляя в ней маркеры cache_control.
+        
+        Точка кэширования в конце истории позволяет следующему ходу беседы
+        переиспользовать весь предыдущий префикс и платить только за новые сообщения.
+        Оставшиеся точки ставятся через каждые _CACHE_CHECKPOINT_INTERVAL сообщений
+        от конца, чтобы при изменении последних ходов часть префикса оставалась в кэше.
+        
+        Args:
+            history: Сообщения беседы
+            max_breakpoints: Сколько маркеров cache_control можно добавить
+            
+        Returns:
+            List сообщений для Messages API
+        """
+        messages = list(history)
+        
+        index = len(messages) - 1
+        while index >= 0 and max_breakpoints > 0:
+            message = messages[index]
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            if content:
+                content = list(content)
+                content[-1] = {**content[-1], "cache_control": {"type": "ephemeral"}}
+                messages[index] = {"role": message["role"], "content": content}
+                max_breakpoints -= 1
+            index -= _CACHE_CHECKPOINT_INTERVAL
+        
+        return messages
+    
+    @staticmethod
+    def _free_cache_breakpoints(prompt: Union[str, List[Dict[str, Any]]],
+                                system_prompt: Optional[str],
+                                cache_system_prompt: bool) -> int:
+        """
+        Вычисляет, сколько маркеров cache_control остается для истории беседы.
+        
+        Args:
+            prompt: Текст промпта или список блоков содержимого
+            system_prompt: Системный промпт
+            cache_system_prompt: Помечен ли системный промпт для кэширования
+            
+        Returns:
+            int: Количество свободных маркеров (не больше _MAX_CACHE_BREAKPOINTS)
+        """
+        used = 1 if system_prompt and cache_system_prompt else 0
+        if not isinstance(prompt, str):
+            used += sum(1 for block in prompt if "cache_control" in block)
+        return max(_MAX_CACHE_BREAKPOINTS - used, 0)
+    
+    @staticmethod
+    def _has_cache_control(content: Union[str, List[Dict[str, Any]]]) -> bool:
+        """
+        Проверяет, содержит ли промпт блоки с маркером cache_control.
+        
+        Args:
+            content: Текст промпта или список блоков содержимого
+            
+        Returns:
+            bool: True, если хотя бы один блок помечен для кэширования
+        """
+        if isinstance(content, str):
+            return False
+        return any("cache_control" in block for block in content)
+    
     def clear_conversation_history(self):
         """
         Очищает историю беседы.
         """
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self._history_summary.clear()
         self.logger.info("История беседы очищена")
     
     def add_to_conversation_history(self, role: str, content: str):
@@ -125,4 +592,4 @@ class ClaudeAPI:
             role: Роль (user, assistant, system)
             content: Содержимое сообщения
         """
-        self.conversation_history.append({"role": role, "content": content})
\ No newline at end of file
+        self._append_history({"role": role, "content": content})
\ No newline at end of file
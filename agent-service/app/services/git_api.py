@@ -1,12 +1,13 @@
 # agent-service/app/services/git_api.py
 
+import asyncio
 import logging
-import os
 import httpx
-import json
-from typing import Dict, List, Any, Optional
-from pathlib import Path
+import orjson
+from cachetools import TTLCache
+from typing import Dict, List, Any, Optional, Set, Tuple, Callable, Awaitable
 from app.core.config import settings
+from app.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +18,134 @@ class GitAPI:
     
     def __init__(self):
         """Инициализация Git API."""
-        self.git_service_url = settings.GIT_SERVICE_URL
-        logger.info(f"GitAPI инициализирован с URL: {self.git_service_url}")
+        # Базовый URL нормализуется один раз: пути запросов присоединяются к нему
+        # простой конкатенацией без лишнего "/" между частями
+        self.git_service_url = settings.GIT_SERVICE_URL.rstrip("/")
+        
+        # Общий пул HTTP-соединений к внутренним сервисам (закрывается при остановке сервиса)
+        self._http = get_http_client()
+        
+        # Кэш чтений (информация о репозитории, списки и содержимое файлов):
+        # ключ (вид, repo_id, путь). Сбрасывается для репозитория при его изменении.
+        self._read_cache = TTLCache(maxsize=settings.GIT_READ_CACHE_SIZE, ttl=settings.GIT_READ_CACHE_TTL)
+        
+        # Чтения, выполняющиеся сейчас: одновременные запросы одного ключа ждут один запрос
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        
+        # Ожидающие запросы файлов по репозиториям: (путь, future) до отправки пакетом
+        self._file_batches: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._file_batch_tasks: Dict[str, asyncio.Task] = {}
+        self._file_batch_sends: Set[asyncio.Task] = set()
+        
+        # Сбрасывается, если Git Service не поддерживает пакетное чтение файлов
+        self._file_batch_supported = True
+        
+        logger.info("GitAPI инициализирован с URL: %s", self.git_service_url)
+    
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Отправляет запрос к Git Service.
+        
+        Единственная точка, через которую GitAPI обращается к HTTP-транспорту.
+        
+        Args:
+            method: HTTP-метод
+            path: Путь относительно URL Git Service
+            **kwargs: Параметры запроса (params, json, timeout)
+            
+        Returns:
+            httpx.Response: Ответ Git Service
+        """
+        # Тело запроса сериализуется через orjson: изменения в коммите могут
+        # содержать большие файлы, а orjson сразу возвращает bytes
+        if "json" in kwargs:
+            kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+            kwargs["headers"] = {"Content-Type": "application/json", **kwargs.get("headers", {})}
+        
+        return await self._http.request(method, f"{self.git_service_url}{path}", **kwargs)
+    
+    @staticmethod
+    def _json(response: httpx.Response) -> Any:
+        """
+        Разбирает JSON-ответ Git Service через orjson.
+        
+        Args:
+            response: Ответ Git Service
+            
+        Returns:
+            Разобранное тело ответа
+        """
+        return orjson.loads(response.content)
+    
+    async def _cached_read(self, key: Tuple[str, str, str], loader: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Возвращает результат чтения из кэша или выполняет его один раз для всех ожидающих.
+        
+        Args:
+            key: Ключ кэша (вид, repo_id, путь)
+            loader: Корутина, выполняющая чтение из Git Service
+            *args: Аргументы loader
+            
+        Returns:
+            Результат чтения
+        """
+        result = self._read_cache.get(key)
+        if result is not None:
+            return result
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_into_cache(key, loader, *args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget_inflight(key, done))
+        
+        # shield: отмена одного из ожидающих запросов не прерывает общее чтение
+        return await asyncio.shield(task)
+    
+    async def _load_into_cache(self, key: Tuple[str, str, str], loader: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Выполняет чтение и сохраняет результат в кэше.
+        
+        Args:
+            key: Ключ кэша (вид, repo_id, путь)
+            loader: Корутина, выполняющая чтение из Git Service
+            *args: Аргументы loader
+            
+        Returns:
+            Результат чтения
+        """
+        result = await loader(*args)
+        
+        # Если репозиторий изменился во время чтения, результат может быть устаревшим
+        if self._inflight.get(key) is asyncio.current_task():
+            self._read_cache[key] = result
+        return result
+    
+    def _forget_inflight(self, key: Tuple[str, str, str], task: asyncio.Task):
+        """
+        Удаляет завершенное чтение из списка выполняющихся.
+        
+        После сброса кэша под тем же ключом может уже выполняться новое чтение,
+        поэтому запись удаляется, только если она принадлежит этой задаче.
+        
+        Args:
+            key: Ключ кэша (вид, repo_id, путь)
+            task: Завершившаяся задача чтения
+        """
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    def _invalidate_repository(self, repo_id: str):
+        """
+        Сбрасывает кэш чтений репозитория после его изменения.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+        """
+        for key in [key for key in self._inflight if key[1] == repo_id]:
+            self._inflight.pop(key, None)
+        for key in [key for key in list(self._read_cache.keys()) if key[1] == repo_id]:
+            self._read_cache.pop(key, None)
     
     async def clone_repository(self, repo_url: str, branch: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -31,7 +158,7 @@ class GitAPI:
         Returns:
             Dict с информацией о клонированном репозитории
         """
-        logger.info(f"Клонирование репозитория: {repo_url}, ветка: {branch or 'default'}")
+        logger.info("Клонирование репозитория: %s, ветка: %s", repo_url, branch or "default")
         
         try:
             # Формируем параметры запроса
@@ -40,23 +167,23 @@ class GitAPI:
                 params["branch"] = branch
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.git_service_url}/repos/clone",
-                    params=params,
-                    timeout=60.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при клонировании репозитория: {response.text}")
-                    raise ValueError(f"Ошибка клонирования репозитория: {response.status_code}")
-                
-                result = response.json()
-                logger.info(f"Репозиторий успешно клонирован: {result.get('repo_id')}")
-                return result
+            response = await self._request(
+                "POST",
+                "/repos/clone",
+                params=params,
+                timeout=60.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при клонировании репозитория: %s", response.text)
+                raise ValueError(f"Ошибка клонирования репозитория: {response.status_code}")
+            
+            result = self._json(response)
+            logger.info("Репозиторий успешно клонирован: %s", result.get("repo_id"))
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при клонировании репозитория: {str(e)}")
+            logger.exception("Ошибка при клонировании репозитория")
             raise ValueError(f"Не удалось клонировать репозиторий: {str(e)}")
     
     async def get_repository_info(self, repo_id: str) -> Dict[str, Any]:
@@ -69,31 +196,60 @@ class GitAPI:
         Returns:
             Dict с информацией о репозитории
         """
-        logger.info(f"Получение информации о репозитории: {repo_id}")
+        logger.info("Получение информации о репозитории: %s", repo_id)
+        return await self._cached_read(("info", repo_id, ""), self._fetch_repository_info, repo_id)
+    
+    async def _fetch_repository_info(self, repo_id: str) -> Dict[str, Any]:
+        """
+        Запрашивает информацию о репозитории у Git Service.
         
+        Args:
+            repo_id: Идентификатор репозитория
+            
+        Returns:
+            Dict с информацией о репозитории
+        """
         try:
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.git_service_url}/repos/{repo_id}",
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при получении информации о репозитории: {response.text}")
-                    raise ValueError(f"Ошибка получения информации о репозитории: {response.status_code}")
-                
-                result = response.json()
-                return result
+            response = await self._request(
+                "GET",
+                f"/repos/{repo_id}",
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при получении информации о репозитории: %s", response.text)
+                raise ValueError(f"Ошибка получения информации о репозитории: {response.status_code}")
+            
+            result = self._json(response)
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при получении информации о репозитории: {str(e)}")
+            logger.exception("Ошибка при получении информации о репозитории")
             raise ValueError(f"Не удалось получить информацию о репозитории: {str(e)}")
     
     async def get_file_content(self, repo_id: str, file_path: str) -> Dict[str, Any]:
         """
         Получает содержимое файла из репозитория.
         
+        Повторные чтения обслуживаются из кэша. Одновременные запросы файлов одного
+        репозитория, пришедшие в пределах GIT_FILE_BATCH_WINDOW, объединяются в один
+        пакетный запрос к Git Service.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+            file_path: Путь к файлу в репозитории
+            
+        Returns:
+            Dict с содержимым файла и информацией о нём
+        """
+        logger.info("Получение содержимого файла: %s из репозитория: %s", file_path, repo_id)
+        return await self._cached_read(("file", repo_id, file_path), self._batched_file_content, repo_id, file_path)
+    
+    async def _batched_file_content(self, repo_id: str, file_path: str) -> Dict[str, Any]:
+        """
+        Ставит запрос файла в пакет репозитория и дожидается результата.
+        
         Args:
             repo_id: Идентификатор репозитория
             file_path: Путь к файлу в репозитории
@@ -101,26 +257,150 @@ class GitAPI:
         Returns:
             Dict с содержимым файла и информацией о нём
         """
-        logger.info(f"Получение содержимого файла: {file_path} из репозитория: {repo_id}")
+        if not self._file_batch_supported:
+            return await self._fetch_file(repo_id, file_path)
+        
+        future = asyncio.get_running_loop().create_future()
+        batch = self._file_batches.setdefault(repo_id, [])
+        batch.append((file_path, future))
+        
+        if len(batch) >= settings.GIT_FILE_BATCH_SIZE:
+            self._flush_file_batch(repo_id)
+        elif repo_id not in self._file_batch_tasks:
+            self._file_batch_tasks[repo_id] = asyncio.create_task(self._flush_file_batch_later(repo_id))
+        
+        return await future
+    
+    async def _flush_file_batch_later(self, repo_id: str):
+        """
+        Отправляет накопленные запросы файлов репозитория по истечении окна ожидания.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+        """
+        await asyncio.sleep(settings.GIT_FILE_BATCH_WINDOW)
+        self._file_batch_tasks.pop(repo_id, None)
+        self._flush_file_batch(repo_id)
+    
+    def _flush_file_batch(self, repo_id: str):
+        """
+        Забирает накопленные запросы файлов репозитория и запускает их отправку.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+        """
+        batch = self._file_batches.pop(repo_id, None)
+        if batch:
+            # Ссылка на задачу хранится до ее завершения, чтобы ее не удалил сборщик мусора
+            task = asyncio.create_task(self._send_file_batch(repo_id, batch))
+            self._file_batch_sends.add(task)
+            task.add_done_callback(self._file_batch_sends.discard)
+    
+    async def _send_file_batch(self, repo_id: str, batch: List[Tuple[str, asyncio.Future]]):
+        """
+        Получает файлы пакетом и передает результаты ожидающим запросам.
+        
+        Если Git Service не поддерживает пакетное чтение, файлы запрашиваются
+        по одному (параллельно), а пакетный режим отключается.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+            batch: Список пар (путь к файлу, future запроса)
+        """
+        paths = list(dict.fromkeys(file_path for file_path, _ in batch))
         
         try:
-            # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.git_service_url}/repos/{repo_id}/files",
-                    params={"path": file_path},
-                    timeout=10.0
+            files = None
+            if len(paths) > 1:
+                files = await self._fetch_files(repo_id, paths)
+            
+            if files is None:
+                results = await asyncio.gather(
+                    *(self._fetch_file(repo_id, file_path) for file_path in paths),
+                    return_exceptions=True
                 )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при получении содержимого файла: {response.text}")
-                    raise ValueError(f"Ошибка получения содержимого файла: {response.status_code}")
-                
-                result = response.json()
-                return result
+                files = dict(zip(paths, results))
+        
+        except Exception as e:
+            files = {file_path: e for file_path in paths}
+        
+        for file_path, future in batch:
+            if future.done():
+                continue
+            
+            result = files.get(file_path)
+            if result is None:
+                future.set_exception(ValueError(f"Не удалось получить содержимое файла: {file_path} отсутствует в ответе"))
+            elif isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    async def _fetch_files(self, repo_id: str, paths: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Получает содержимое нескольких файлов одним запросом к Git Service.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+            paths: Пути к файлам в репозитории
+            
+        Returns:
+            Dict путь -> содержимое файла или None, если пакетное чтение не поддерживается
+        """
+        logger.info("Пакетное получение %s файлов из репозитория: %s", len(paths), repo_id)
+        
+        try:
+            response = await self._request(
+                "POST",
+                f"/repos/{repo_id}/files:batch",
+                json={"paths": paths},
+                timeout=30.0
+            )
+            
+            if response.status_code in (404, 405):
+                logger.info("Git Service не поддерживает пакетное чтение файлов, используются одиночные запросы")
+                self._file_batch_supported = False
+                return None
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при пакетном получении файлов: %s", response.text)
+                raise ValueError(f"Ошибка пакетного получения файлов: {response.status_code}")
+            
+            return {file_info.get("path"): file_info for file_info in self._json(response).get("files", [])}
+        
+        except Exception as e:
+            logger.exception("Ошибка при пакетном получении файлов")
+            raise ValueError(f"Не удалось получить содержимое файлов: {str(e)}")
+    
+    async def _fetch_file(self, repo_id: str, file_path: str) -> Dict[str, Any]:
+        """
+        Получает содержимое одного файла отдельным запросом к Git Service.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+            file_path: Путь к файлу в репозитории
+            
+        Returns:
+            Dict с содержимым файла и информацией о нём
+        """
+        try:
+            # Отправляем запрос к Git Service
+            response = await self._request(
+                "GET",
+                f"/repos/{repo_id}/files",
+                params={"path": file_path},
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при получении содержимого файла: %s", response.text)
+                raise ValueError(f"Ошибка получения содержимого файла: {response.status_code}")
+            
+            result = self._json(response)
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при получении содержимого файла: {str(e)}")
+            logger.exception("Ошибка при получении содержимого файла")
             raise ValueError(f"Не удалось получить содержимое файла: {str(e)}")
     
     async def list_files(self, repo_id: str, path: str = "") -> List[Dict[str, Any]]:
@@ -134,30 +414,42 @@ class GitAPI:
         Returns:
             List с информацией о файлах
         """
-        logger.info(f"Получение списка файлов из репозитория: {repo_id}, путь: {path or 'root'}")
+        logger.info("Получение списка файлов из репозитория: %s, путь: %s", repo_id, path or "root")
+        return await self._cached_read(("list", repo_id, path), self._fetch_file_list, repo_id, path)
+    
+    async def _fetch_file_list(self, repo_id: str, path: str) -> List[Dict[str, Any]]:
+        """
+        Запрашивает список файлов у Git Service.
         
+        Args:
+            repo_id: Идентификатор репозитория
+            path: Путь к директории
+            
+        Returns:
+            List с информацией о файлах
+        """
         try:
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                params = {}
-                if path:
-                    params["path"] = path
-                
-                response = await client.get(
-                    f"{self.git_service_url}/repos/{repo_id}/list",
-                    params=params,
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при получении списка файлов: {response.text}")
-                    raise ValueError(f"Ошибка получения списка файлов: {response.status_code}")
-                
-                result = response.json()
-                return result.get("files", [])
+            params = {}
+            if path:
+                params["path"] = path
+            
+            response = await self._request(
+                "GET",
+                f"/repos/{repo_id}/list",
+                params=params,
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при получении списка файлов: %s", response.text)
+                raise ValueError(f"Ошибка получения списка файлов: {response.status_code}")
+            
+            result = self._json(response)
+            return result.get("files", [])
         
         except Exception as e:
-            logger.error(f"Ошибка при получении списка файлов: {str(e)}")
+            logger.exception("Ошибка при получении списка файлов")
             raise ValueError(f"Не удалось получить список файлов: {str(e)}")
     
     async def commit_changes(self, repo_id: str, message: str, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -172,7 +464,7 @@ class GitAPI:
         Returns:
             Dict с информацией о коммите
         """
-        logger.info(f"Коммит изменений в репозиторий: {repo_id}, сообщение: {message}")
+        logger.info("Коммит изменений в репозиторий: %s, сообщение: %s", repo_id, message)
         
         try:
             # Формируем данные для запроса
@@ -182,23 +474,24 @@ class GitAPI:
             }
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.git_service_url}/repos/{repo_id}/commit",
-                    json=data,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при коммите изменений: {response.text}")
-                    raise ValueError(f"Ошибка коммита изменений: {response.status_code}")
-                
-                result = response.json()
-                logger.info(f"Изменения успешно закоммичены: {result.get('commit_id')}")
-                return result
+            response = await self._request(
+                "POST",
+                f"/repos/{repo_id}/commit",
+                json=data,
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при коммите изменений: %s", response.text)
+                raise ValueError(f"Ошибка коммита изменений: {response.status_code}")
+            
+            result = self._json(response)
+            self._invalidate_repository(repo_id)
+            logger.info("Изменения успешно закоммичены: %s", result.get("commit_id"))
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при коммите изменений: {str(e)}")
+            logger.exception("Ошибка при коммите изменений")
             raise ValueError(f"Не удалось закоммитить изменения: {str(e)}")
     
     async def push_changes(self, repo_id: str, branch: str = "main") -> Dict[str, Any]:
@@ -212,7 +505,7 @@ class GitAPI:
         Returns:
             Dict с информацией о пуше
         """
-        logger.info(f"Пуш изменений в репозиторий: {repo_id}, ветка: {branch}")
+        logger.info("Пуш изменений в репозиторий: %s, ветка: %s", repo_id, branch)
         
         try:
             # Формируем данные для запроса
@@ -221,23 +514,23 @@ class GitAPI:
             }
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.git_service_url}/repos/{repo_id}/push",
-                    json=data,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при пуше изменений: {response.text}")
-                    raise ValueError(f"Ошибка пуша изменений: {response.status_code}")
-                
-                result = response.json()
-                logger.info(f"Изменения успешно запушены: {result.get('status')}")
-                return result
+            response = await self._request(
+                "POST",
+                f"/repos/{repo_id}/push",
+                json=data,
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при пуше изменений: %s", response.text)
+                raise ValueError(f"Ошибка пуша изменений: {response.status_code}")
+            
+            result = self._json(response)
+            logger.info("Изменения успешно запушены: %s", result.get("status"))
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при пуше изменений: {str(e)}")
+            logger.exception("Ошибка при пуше изменений")
             raise ValueError(f"Не удалось запушить изменения: {str(e)}")
     
     async def pull_changes(self, repo_id: str, branch: str = "main") -> Dict[str, Any]:
@@ -251,7 +544,7 @@ class GitAPI:
         Returns:
             Dict с информацией о пулле
         """
-        logger.info(f"Пулл изменений из репозитория: {repo_id}, ветка: {branch}")
+        logger.info("Пулл изменений из репозитория: %s, ветка: %s", repo_id, branch)
         
         try:
             # Формируем данные для запроса
@@ -260,23 +553,24 @@ class GitAPI:
             }
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.git_service_url}/repos/{repo_id}/pull",
-                    json=data,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при пулле изменений: {response.text}")
-                    raise ValueError(f"Ошибка пулла изменений: {response.status_code}")
-                
-                result = response.json()
-                logger.info(f"Изменения успешно запуллены: {result.get('status')}")
-                return result
+            response = await self._request(
+                "POST",
+                f"/repos/{repo_id}/pull",
+                json=data,
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при пулле изменений: %s", response.text)
+                raise ValueError(f"Ошибка пулла изменений: {response.status_code}")
+            
+            result = self._json(response)
+            self._invalidate_repository(repo_id)
+            logger.info("Изменения успешно запуллены: %s", result.get("status"))
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при пулле изменений: {str(e)}")
+            logger.exception("Ошибка при пулле изменений")
             raise ValueError(f"Не удалось запуллить изменения: {str(e)}")
     
     async def manage_branch(self, repo_id: str, branch: str, create: bool = False) -> Dict[str, Any]:
@@ -292,7 +586,7 @@ class GitAPI:
             Dict с информацией о операции с веткой
         """
         action = "создание" if create else "переключение"
-        logger.info(f"{action} ветки {branch} в репозитории: {repo_id}")
+        logger.info("%s ветки %s в репозитории: %s", action, branch, repo_id)
         
         try:
             # Формируем данные для запроса
@@ -302,23 +596,24 @@ class GitAPI:
             }
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.git_service_url}/repos/{repo_id}/branch",
-                    json=data,
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при управлении веткой: {response.text}")
-                    raise ValueError(f"Ошибка управления веткой: {response.status_code}")
-                
-                result = response.json()
-                logger.info(f"Операция с веткой успешно выполнена: {result.get('status')}")
-                return result
+            response = await self._request(
+                "POST",
+                f"/repos/{repo_id}/branch",
+                json=data,
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при управлении веткой: %s", response.text)
+                raise ValueError(f"Ошибка управления веткой: {response.status_code}")
+            
+            result = self._json(response)
+            self._invalidate_repository(repo_id)
+            logger.info("Операция с веткой успешно выполнена: %s", result.get("status"))
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при управлении веткой: {str(e)}")
+            logger.exception("Ошибка при управлении веткой")
             raise ValueError(f"Не удалось выполнить операцию с веткой: {str(e)}")
     
     async def get_diff(self, repo_id: str, file_path: Optional[str] = None) -> Dict[str, Any]:
@@ -333,7 +628,7 @@ class GitAPI:
             Dict с информацией о diff
         """
         target = f"файла {file_path}" if file_path else "репозитория"
-        logger.info(f"Получение diff для {target} в репозитории: {repo_id}")
+        logger.info("Получение diff для %s в репозитории: %s", target, repo_id)
         
         try:
             # Формируем параметры запроса
@@ -342,22 +637,22 @@ class GitAPI:
                 params["path"] = file_path
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.git_service_url}/repos/{repo_id}/diff",
-                    params=params,
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при получении diff: {response.text}")
-                    raise ValueError(f"Ошибка получения diff: {response.status_code}")
-                
-                result = response.json()
-                return result
+            response = await self._request(
+                "GET",
+                f"/repos/{repo_id}/diff",
+                params=params,
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при получении diff: %s", response.text)
+                raise ValueError(f"Ошибка получения diff: {response.status_code}")
+            
+            result = self._json(response)
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при получении diff: {str(e)}")
+            logger.exception("Ошибка при получении diff")
             raise ValueError(f"Не удалось получить diff: {str(e)}")
     
     async def create_pull_request(self, repo_id: str, title: str, description: str, 
@@ -375,7 +670,7 @@ class GitAPI:
         Returns:
             Dict с информацией о созданном pull request
         """
-        logger.info(f"Создание pull request из {source_branch} в {target_branch} в репозитории: {repo_id}")
+        logger.info("Создание pull request из %s в %s в репозитории: %s", source_branch, target_branch, repo_id)
         
         try:
             # Формируем данные для запроса
@@ -387,37 +682,39 @@ class GitAPI:
             }
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.git_service_url}/repos/{repo_id}/pr",
-                    json=data,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при создании pull request: {response.text}")
-                    raise ValueError(f"Ошибка создания pull request: {response.status_code}")
-                
-                result = response.json()
-                logger.info(f"Pull request успешно создан: {result.get('pr_url')}")
-                return result
+            response = await self._request(
+                "POST",
+                f"/repos/{repo_id}/pr",
+                json=data,
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при создании pull request: %s", response.text)
+                raise ValueError(f"Ошибка создания pull request: {response.status_code}")
+            
+            result = self._json(response)
+            logger.info("Pull request успешно создан: %s", result.get("pr_url"))
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при создании pull request: {str(e)}")
+            logger.exception("Ошибка при создании pull request")
             raise ValueError(f"Не удалось создать pull request: {str(e)}")
     
-    async def analyze_repository(self, repo_url: str, branch: Optional[str] = None) -> Dict[str, Any]:
+    async def analyze_repository(self, repo_url: str, branch: Optional[str] = None,
+                                 fetch_key_files: bool = True) -> Dict[str, Any]:
         """
         Анализирует репозиторий для получения общей информации и ключевых файлов.
         
         Args:
             repo_url: URL репозитория
             branch: Ветка для анализа (опционально)
+            fetch_key_files: Загрузить ли содержимое ключевых файлов (key_files_content)
             
         Returns:
             Dict с результатами анализа репозитория
         """
-        logger.info(f"Анализ репозитория: {repo_url}, ветка: {branch or 'default'}")
+        logger.info("Анализ репозитория: %s, ветка: %s", repo_url, branch or "default")
         
         try:
             # Формируем параметры запроса
@@ -426,21 +723,57 @@ class GitAPI:
                 params["branch"] = branch
             
             # Отправляем запрос к Git Service
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.git_service_url}/repos/analyze",
-                    params=params,
-                    timeout=60.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка при анализе репозитория: {response.text}")
-                    raise ValueError(f"Ошибка анализа репозитория: {response.status_code}")
-                
-                result = response.json()
-                logger.info(f"Репозиторий успешно проанализирован")
-                return result
+            response = await self._request(
+                "GET",
+                "/repos/analyze",
+                params=params,
+                timeout=60.0
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка при анализе репозитория: %s", response.text)
+                raise ValueError(f"Ошибка анализа репозитория: {response.status_code}")
+            
+            result = self._json(response)
+            logger.info("Репозиторий успешно проанализирован")
+            
+            if fetch_key_files and result.get("repo_id") and result.get("key_files"):
+                result["key_files_content"] = await self._fetch_key_files(result["repo_id"], result["key_files"])
+            
+            return result
         
         except Exception as e:
-            logger.error(f"Ошибка при анализе репозитория: {str(e)}")
-            raise ValueError(f"Не удалось проанализировать репозиторий: {str(e)}")
\ No newline at end of file
+            logger.exception("Ошибка при анализе репозитория")
+            raise ValueError(f"Не удалось проанализировать репозиторий: {str(e)}")
+    
+    async def _fetch_key_files(self, repo_id: str, key_files: List[Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Параллельно загружает содержимое ключевых файлов репозитория.
+        
+        Число одновременных запросов ограничено GIT_FETCH_CONCURRENCY; одновременные
+        запросы дополнительно объединяются в пакеты в get_file_content.
+        
+        Args:
+            repo_id: Идентификатор репозитория
+            key_files: Пути ключевых файлов (строки или словари с ключом path)
+            
+        Returns:
+            Dict путь -> содержимое файла; файлы, которые не удалось загрузить, пропускаются
+        """
+        paths = [item.get("path") if isinstance(item, dict) else item for item in key_files]
+        paths = [file_path for file_path in dict.fromkeys(paths) if file_path]
+        semaphore = asyncio.Semaphore(settings.GIT_FETCH_CONCURRENCY)
+        
+        async def fetch(file_path: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.get_file_content(repo_id, file_path)
+        
+        results = await asyncio.gather(*(fetch(file_path) for file_path in paths), return_exceptions=True)
+        
+        files = {}
+        for file_path, result in zip(paths, results):
+            if isinstance(result, Exception):
+                logger.warning("Не удалось загрузить ключевой файл %s: %s", file_path, result)
+            else:
+                files[file_path] = result
+        return files
\ No newline at end of file
@@ -0,0 +1,53 @@
+# agent-service/app/services/http_client.py
+
+import logging
+import httpx
+from typing import Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Общий HTTP-клиент для запросов к внутренним сервисам (API Service, Git Service)
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Возвращает общий долгоживущий HTTP-клиент с пулом соединений.
+    
+    Клиент создается при первом обращении и переиспользуется всеми компонентами,
+    что позволяет не устанавливать TCP/TLS-соединение заново на каждый запрос.
+    
+    Если сервис доступен по HTTPS и поддерживает HTTP/2, одновременные запросы
+    мультиплексируются в одном соединении. Для адресов http:// и серверов
+    без HTTP/2 используется HTTP/1.1 с пулом из нескольких соединений.
+    
+    Returns:
+        httpx.AsyncClient: Общий HTTP-клиент
+    """
+    global _http_client
+    
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=settings.INTERNAL_HTTP2,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=20,
+                max_keepalive_connections=20,
+                keepalive_expiry=30
+            )
+        )
+        logger.info("Создан общий HTTP-клиент")
+    
+    return _http_client
+
+async def close_http_client():
+    """
+    Закрывает общий HTTP-клиент. Вызывается при остановке сервиса.
+    """
+    global _http_client
+    
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+        logger.info("Общий HTTP-клиент закрыт")
+    
+    _http_client = None
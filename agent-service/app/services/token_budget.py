@@ -0,0 +1,93 @@
+# agent-service/app/services/token_budget.py
+
+import logging
+from datetime import date
+from typing import Optional
+import redis.asyncio as redis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class TokenBudget:
+    """
+    Класс для учета суточного расхода токенов Claude API по пользователям.
+    Счетчики хранятся в Redis отдельно для каждых календарных суток.
+    """
+    
+    def __init__(self, daily_limit: Optional[int] = None):
+        """
+        Инициализация учета токенов.
+        
+        Args:
+            daily_limit: Суточный лимит токенов на пользователя (0 - без ограничений).
+                         Если не указан, берется из настроек.
+        """
+        self.daily_limit = settings.CLAUDE_USER_DAILY_TOKENS if daily_limit is None else daily_limit
+        self.key_prefix = "agent:tokens:"
+        
+        # Подключение к Redis будет происходить при первом вызове метода
+        self._redis_client = None
+        
+        logger.info(f"TokenBudget инициализирован с лимитом {self.daily_limit} токенов в сутки")
+    
+    async def _get_redis(self) -> redis.Redis:
+        """
+        Получает клиент Redis с ленивой инициализацией.
+        
+        Returns:
+            Клиент Redis
+        """
+        if self._redis_client is None:
+            self._redis_client = redis.from_url(settings.REDIS_URL)
+        
+        return self._redis_client
+    
+    def _key(self, user_id: str) -> str:
+        """Возвращает ключ счетчика пользователя за текущие сутки."""
+        return f"{self.key_prefix}{user_id}:{date.today().isoformat()}"
+    
+    async def is_exhausted(self, user_id: str) -> bool:
+        """
+        Проверяет, израсходовал ли пользователь суточный лимит токенов.
+        
+        Args:
+            user_id: Идентификатор пользователя
+        
+        Returns:
+            bool: True, если лимит исчерпан. При недоступности Redis запрос не блокируется.
+        """
+        if not self.daily_limit:
+            return False
+        
+        try:
+            client = await self._get_redis()
+            used = await client.get(self._key(user_id))
+            return used is not None and int(used) >= self.daily_limit
+        
+        except Exception as e:
+            logger.error(f"Ошибка при проверке лимита токенов: {str(e)}")
+            return False
+    
+    async def add(self, user_id: str, tokens: int):
+        """
+        Учитывает израсходованные пользователем токены.
+        
+        Args:
+            user_id: Идентификатор пользователя
+            tokens: Количество токенов
+        """
+        if not self.daily_limit or tokens <= 0:
+            return
+        
+        try:
+            client = await self._get_redis()
+            key = self._key(user_id)
+            
+            # Ключ привязан к дате, срок жизни нужен только для очистки старых счетчиков
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.incrby(key, tokens)
+                pipe.expire(key, 2 * 86400)
+                await pipe.execute()
+        
+        except Exception as e:
+            logger.error(f"Ошибка при учете токенов: {str(e)}")
\ No newline at end of file
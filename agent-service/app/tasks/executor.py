@@ -121,6 +121,7 @@ class TaskExecutor:
         # Получаем параметры задачи
         params = task['params']
         prompt = params.get('prompt', '')
+        system_prompt = params.get('system_prompt')
         context = params.get('context', {})
         
         try:
@@ -128,7 +129,10 @@ class TaskExecutor:
             await self._update_task_status(task['id'], "in_progress", 30)
             
             # Вызываем Claude API для генерации кода
-            response = await self.claude_api.send_request(prompt, max_tokens=4000)
+            response = await self.claude_api.send_request(
+                prompt, max_tokens=4000, system_prompt=system_prompt,
+                cache_system_prompt=system_prompt is not None
+            )
             
             # Обновляем прогресс задачи
             await self._update_task_status(task['id'], "in_progress", 70)
@@ -0,0 +1,22 @@
+# agent-service/app/utils/cache_utils.py
+
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+def prompt_hash(*parts: str) -> bytes:
+    """
+    Вычисляет ключ точного кэша по полностью сформированному промпту.
+    
+    Args:
+        *parts: Части промпта (статический префикс, динамическая часть и т.д.)
+        
+    Returns:
+        bytes: 16-байтовый дайджест BLAKE2b
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.digest()
\ No newline at end of file
@@ -0,0 +1,110 @@
+# agent-service/app/utils/file_utils.py
+
+import re
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Iterable
+from app.utils.prompt_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Слова запроса для оценки релевантности файлов (идентификаторы от 3 символов)
+_QUERY_TERM_RE = re.compile(r"\w{3,}")
+
+def format_file(file_info: Dict[str, Any]) -> str:
+    """
+    Форматирует один файл проекта для вставки в промпт.
+    
+    Args:
+        file_info: Словарь с путем и (опционально) содержимым файла
+    
+    Returns:
+        str: Отформатированный блок файла
+    """
+    path = file_info.get("path", "Неизвестный файл")
+    if "content" not in file_info:
+        return f"### Файл: {path}\nСодержимое файла не предоставлено.\n"
+    return f"### Файл: {path}\n```\n{file_info['content']}\n```\n"
+
+def format_file_context(files: Iterable[Dict[str, Any]]) -> str:
+    """
+    Форматирует файлы проекта для вставки в промпт.
+    
+    Args:
+        files: Список файлов с путями и содержимым
+    
+    Returns:
+        str: Отформатированный контекст файлов
+    """
+    return "\n".join(format_file(file_info) for file_info in files)
+
+def _modified_timestamp(value: Any) -> float:
+    """
+    Приводит время изменения файла к числу секунд эпохи для сравнения.
+    
+    Args:
+        value: Время изменения (число секунд эпохи, строка ISO 8601 или None)
+    
+    Returns:
+        float: Секунды эпохи или 0, если значение отсутствует или не распознано
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def select_files_within_budget(files: List[Dict[str, Any]], query: str, max_tokens: int,
+                               focus_files: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Отбирает файлы так, чтобы их контекст укладывался в бюджет токенов.
+    
+    Если все файлы помещаются в бюджет, список возвращается без изменений.
+    Иначе файлы ранжируются: сначала явно указанные (focus_files), затем по
+    количеству слов запроса в пути и содержимом, затем по времени изменения.
+    Файлы добавляются по рангу, пока есть бюджет; порядок отобранных файлов
+    совпадает с исходным, чтобы текст контекста оставался стабильным.
+    
+    Args:
+        files: Список файлов с путями, содержимым и метаданными
+        query: Текст запроса пользователя
+        max_tokens: Максимальное количество токенов контекста файлов
+        focus_files: Пути файлов, которые нужно включить в первую очередь
+    
+    Returns:
+        List отобранных файлов
+    """
+    sizes = [estimate_tokens(format_file(file_info)) for file_info in files]
+    if sum(sizes) <= max_tokens:
+        return files
+    
+    focus = set(focus_files or ())
+    terms = {term.lower() for term in _QUERY_TERM_RE.findall(query)}
+    
+    def rank(index: int):
+        file_info = files[index]
+        path = file_info.get("path", "")
+        text = f"{path}\n{file_info.get('content', '')}".lower()
+        overlap = sum(1 for term in terms if term in text)
+        modified = file_info.get("modified_at") or file_info.get("last_modified") or 0
+        return (path in focus, overlap, _modified_timestamp(modified))
+    
+    selected = []
+    budget = max_tokens
+    for index in sorted(range(len(files)), key=rank, reverse=True):
+        if sizes[index] <= budget:
+            selected.append(index)
+            budget -= sizes[index]
+    
+    logger.info(f"Контекст файлов сокращен до бюджета {max_tokens} токенов: {len(selected)} из {len(files)} файлов")
+    return [files[index] for index in sorted(selected)]
\ No newline at end of file
@@ -2,13 +2,20 @@
 
 import os
 import logging
+import re
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Среднее количество символов на токен (грубая оценка без токенизатора)
+CHARS_PER_TOKEN = 4
+
+# Плейсхолдер string.Template в шаблоне промпта ($name или ${name})
+_PLACEHOLDER_RE = re.compile(r"\$\{?\w+\}?")
+
 def load_prompt(filename: str) -> str:
     """
     Загружает шаблон промпта из файла.
@@ -32,7 +39,7 @@ def load_prompt(filename: str) -> str:
     except Exception as e:
         logger.error(f"Ошибка при загрузке промпта '{filename}': {str(e)}")
         # Возвращаем базовый промпт в случае ошибки
-        return "Ответь на следующий вопрос пользователя: {user_message}"
+        return "Ответь на следующий вопрос пользователя: $user_message"
 
 def format_context_for_prompt(context: Dict[str, Any]) -> str:
     """
@@ -141,4 +148,73 @@ def build_system_prompt(task_type: str,
             "при необходимости приводя примеры кода."
         )
     
-    return system_prompt
\ No newline at end of file
+    return system_prompt
+
+def build_cached_content(static_text: str, dynamic_text: str) -> List[Dict[str, Any]]:
+    """
+    Формирует содержимое сообщения из статического префикса и динамической части.
+    
+    Статический префикс помечается маркером cache_control, чтобы Anthropic
+    переиспользовал его между запросами. Динамическая часть всегда идет последней.
+    
+    Args:
+        static_text: Неизменяемые инструкции (должны быть побайтово одинаковыми между вызовами)
+        dynamic_text: Изменяемая часть запроса (код, diff, файлы)
+        
+    Returns:
+        List блоков содержимого для Claude API
+    """
+    # API не принимает пустые текстовые блоки
+    if not static_text:
+        return [{"type": "text", "text": dynamic_text}]
+    
+    return [
+        {"type": "text", "text": static_text, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": dynamic_text}
+    ]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценивает количество токенов в тексте по его длине.
+    
+    Args:
+        text: Исходный текст
+        
+    Returns:
+        int: Приблизительное количество токенов
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def split_prompt_template(template: str,
+                          dynamic_fields: Tuple[str, ...] = ("user_message",)) -> Tuple[str, str, str]:
+    """
+    Делит шаблон промпта на статический префикс, контекст проекта и запрос.
+    
+    Кэширование префиксов совпадает только с начала промпта, поэтому в шаблоне
+    изменяемые поля никогда не должны предшествовать статическим: сначала
+    инструкции, затем контекст проекта (меняется редко), последним - запрос.
+    
+    Args:
+        template: Шаблон промпта с плейсхолдерами string.Template
+        dynamic_fields: Поля, уникальные для каждого запроса
+        
+    Returns:
+        Tuple из статического префикса, шаблона контекста и шаблона запроса.
+        Раздел запроса начинается с абзаца, содержащего первое динамическое поле.
+    """
+    match = _PLACEHOLDER_RE.search(template)
+    if not match:
+        return template, "", ""
+    
+    static_prefix, tail = template[:match.start()], template[match.start():]
+    
+    positions = [tail.find("$" + field) for field in dynamic_fields]
+    positions = [position for position in positions if position >= 0]
+    if not positions:
+        return static_prefix, tail, ""
+    
+    split_at = tail.rfind("\n\n", 0, min(positions))
+    if split_at < 0:
+        return static_prefix, "", tail
+    return static_prefix, tail[:split_at], tail[split_at + 2:]
\ No newline at end of file
@@ -0,0 +1,42 @@
+# agent-service/tests/test_code_analyzer.py
+
+import os
+
+os.environ.setdefault("CLAUDE_API_KEY", "test-key")
+
+from app.analyzers.code_analyzer import _shrink, _OMITTED_MARKER
+from app.utils.prompt_utils import CHARS_PER_TOKEN
+
+def test_shrink_keeps_short_code():
+    code = "def f():\n    return 1\n"
+    
+    shrunk, _ = _shrink(code, "python", 1000)
+    
+    assert shrunk is code
+
+def test_shrink_single_line_keeps_head_and_tail():
+    code = "var a=1;" * 40000
+    budget = 1000 * CHARS_PER_TOKEN
+    
+    shrunk, original_tokens = _shrink(code, "javascript", 1000)
+    
+    assert original_tokens > 1000
+    assert shrunk.startswith(code[:budget * 2 // 5])
+    assert shrunk.endswith(code[-(budget // 5):])
+    assert len(shrunk) == budget * 2 // 5 + len(_OMITTED_MARKER) + budget // 5
+
+def test_shrink_single_line_with_trailing_newline_keeps_tail():
+    code = "var a=1;" * 40000 + "\n"
+    
+    shrunk, _ = _shrink(code, "javascript", 1000)
+    
+    assert shrunk.endswith("var a=1;\n")
+
+def test_shrink_multiline_cuts_on_line_boundaries():
+    code = "".join(f"x{i} = {i}\n" for i in range(20000))
+    
+    shrunk, _ = _shrink(code, "python", 1000)
+    head, _, tail = shrunk.partition(_OMITTED_MARKER)
+    
+    assert head.endswith("\n")
+    assert tail.startswith("x")